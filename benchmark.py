@@ -0,0 +1,288 @@
+from array import array
+from json import dump, load
+from os import mkdir
+from os.path import exists, getsize
+from platform import node
+from shutil import rmtree
+from sys import argv
+from tempfile import mkdtemp
+
+from ROOT import gROOT, RooFit, TChain, TFile, TRandom3, TTree
+
+from lib.closure import generate_toys
+from lib.correction import compute_correction
+from lib.fit import (
+    compute_chisq, data_hist, fit, model_hist, model_hist_fast,
+    overlap_variations
+)
+from lib.prepare import (
+    make_histograms, make_trees, storage_profiles, write_tree
+)
+from lib.profiling import Profiler
+from lib.shape.dg import (
+    DoubleGaussFit, DoubleGaussToy, SuperGaussFit, SuperGaussToy
+)
+from lib.shape.sg import SingleGauss
+from lib.shape.tg import (
+    TripleGaussFit, TripleGaussToy, SuperDoubleGaussFit, SuperDoubleGaussToy
+)
+
+models = {
+    'SG': (SingleGauss, SingleGauss, 'toySG'),
+    'DG': (DoubleGaussToy, DoubleGaussFit, 'toyDG'),
+    'TG': (TripleGaussToy, TripleGaussFit, 'toyTG'),
+    'SupG': (SuperGaussToy, SuperGaussFit, 'toySupG'),
+    'SupDG': (SuperDoubleGaussToy, SuperDoubleGaussFit, 'toySupDG'),
+}
+binnings = (95, 190, 760)
+# model_hist computes one integral per bin and model function, which takes
+# hours for the finest binning
+maxintegralbins = 190
+vtxres = 0.3
+seed = 4266
+
+def make_rawfiles(path, nfiles, nevents, steps, bcids, rand):
+    filelist = []
+    nvtx = array('i', [0])
+    ntrk = array('i', [0]*200)
+    posx = array('f', [0.0]*200)
+    posy = array('f', [0.0]*200)
+    errx = array('f', [0.0]*200)
+    erry = array('f', [0.0]*200)
+    good = array('b', [0]*200)
+    fake = array('b', [0]*200)
+    timestamp = array('I', [0])
+    bunch = array('i', [0])
+    for i in range(nfiles):
+        filename = '{0}/raw{1}.root'.format(path, i)
+        f = TFile(filename, 'RECREATE')
+        f.mkdir('lumi').cd()
+        tree = TTree('tree', 'tree')
+        tree.Branch('nVtx', nvtx, 'nVtx/I')
+        tree.Branch('vtx_nTrk', ntrk, 'vtx_nTrk[nVtx]/I')
+        tree.Branch('vtx_x', posx, 'vtx_x[nVtx]/F')
+        tree.Branch('vtx_y', posy, 'vtx_y[nVtx]/F')
+        tree.Branch('vtx_xError', errx, 'vtx_xError[nVtx]/F')
+        tree.Branch('vtx_yError', erry, 'vtx_yError[nVtx]/F')
+        tree.Branch('vtx_isGood', good, 'vtx_isGood[nVtx]/O')
+        tree.Branch('vtx_isFake', fake, 'vtx_isFake[nVtx]/O')
+        tree.Branch('timeStamp_begin', timestamp, 'timeStamp_begin/i')
+        tree.Branch('bunchCrossing', bunch, 'bunchCrossing/I')
+        for j in range(nevents):
+            step = rand.Integer(len(steps))
+            timestamp[0] = 1000*step + 1 + rand.Integer(998)
+            bunch[0] = bcids[rand.Integer(len(bcids))]
+            nvtx[0] = rand.Poisson(2.0)
+            for k in range(nvtx[0]):
+                ntrk[k] = 2 + rand.Poisson(20.0)
+                posx[k] = rand.Gaus(0.0004*steps[step], 0.002)
+                posy[k] = rand.Gaus(0.0, 0.002)
+                errx[k] = abs(rand.Gaus(0.002, 0.0005))
+                erry[k] = abs(rand.Gaus(0.002, 0.0005))
+                good[k] = int(rand.Uniform() < 0.95)
+                fake[k] = int(rand.Uniform() < 0.02)
+            tree.Fill()
+        tree.Write()
+        f.Close()
+        filelist.append(filename)
+    times = [(1000*i, 1000*(i+1)) for i in range(len(steps))]
+    return filelist, times
+
+def benchmark_prepare(profiler, nfiles, nevents, rand):
+    path = mkdtemp(prefix='benchmark_')
+    try:
+        steps = [i-9.0 for i in range(19)]
+        bcids = [1, 2]
+        filelist, times = make_rawfiles(
+            path, nfiles, nevents, steps, bcids, rand
+        )
+        with profiler.stage('make_trees'):
+            trees = make_trees(filelist, times, bcids, verbose=False)
+        for nbins in binnings:
+            with profiler.stage('make_histograms_{0}'.format(nbins)):
+                make_histograms(trees, nbins, 10, scaling=0.001)
+        return {
+            profile: benchmark_storage(
+                profiler, path, filelist, times, bcids, profile
+            ) for profile in sorted(storage_profiles)
+        }
+    finally:
+        rmtree(path)
+
+def benchmark_storage(profiler, path, filelist, times, bcids, profile):
+    compact = storage_profiles[profile]['compact']
+    compression = storage_profiles[profile]['compression']
+    trees = make_trees(
+        filelist, times, bcids, verbose=False, noerror=True, compact=compact
+    )
+    filename = '{0}/trees_{1}.root'.format(path, profile)
+    with profiler.stage('write_trees_{0}'.format(profile)):
+        f = TFile(filename, 'RECREATE')
+        if compression is not None:
+            f.SetCompressionSettings(compression)
+        for tree in trees.itervalues():
+            write_tree(
+                tree, 'Beam1MoveX_{0}'.format(tree.GetName()), compression
+            )
+        f.Close()
+    chains = {}
+    for bcid in bcids:
+        chains[bcid] = TChain('Beam1MoveX_bunch{0}Add'.format(bcid))
+        chains[bcid].Add(filename)
+    with profiler.stage('read_trees_{0}'.format(profile)):
+        make_histograms(chains, binnings[0], 10, scaling=0.001)
+    return getsize(filename)
+
+def benchmark_model(profiler, modelname, nvariations, nscans, rand):
+    toyclass, fitclass, toyjson = models[modelname]
+    toymodel = toyclass()
+    toymodel.factor = 100.0
+    fitmodel = fitclass()
+    fitmodel.factor = 100.0
+    fitmethod = lambda pdf, data: pdf.fitTo(
+        data, RooFit.Save(), RooFit.PrintLevel(-1), RooFit.Verbose(0)
+    )
+    for nbins in binnings:
+        label = '{0}_{1}'.format(modelname, nbins)
+        toymodel.load_json('res/shapes/{0}.json'.format(toyjson), rand)
+        with profiler.stage('generate_toys_{0}'.format(label)):
+            hists, nevents = generate_toys(
+                toymodel.overlap_func(), vtxres, rand=rand, nbins=nbins
+            )
+
+        fitmodel.reset()
+        fitmodel.load_json()
+        fitmodel.set_vtxres(vtxres)
+        for par in [
+            'x011', 'x012', 'x021', 'x022', 'y011', 'y012', 'y021', 'y022'
+        ]:
+            fitmodel.parameter(par).setConstant()
+        with profiler.stage('fit_{0}'.format(label)):
+            result, modfuncs, datahist = fit(fitmodel, hists, fitmethod)
+
+        xvar, yvar = fitmodel.xvar(), fitmodel.yvar()
+        hdata = data_hist(xvar, yvar, datahist, nbins=nbins)
+        if nbins <= maxintegralbins:
+            with profiler.stage('model_hist_{0}'.format(label)):
+                model_hist(xvar, yvar, modfuncs, nbins=nbins)
+        with profiler.stage('model_hist_fast_{0}'.format(label)):
+            hmodel = model_hist_fast(xvar, yvar, modfuncs, nbins=nbins)
+        with profiler.stage('compute_chisq_{0}'.format(label)):
+            compute_chisq(hmodel, hdata, nbins=nbins)
+
+    with profiler.stage('overlap_variations_{0}'.format(modelname)):
+        overlap_variations(fitmodel, rand=rand, n=nvariations)
+    with profiler.stage('compute_correction_{0}'.format(modelname)):
+        fitmodel.factor = 100.0
+        compute_correction(
+            fitmodel.overlap_func(), n=nscans, rand=rand, extended=False
+        )
+
+def run_benchmarks(modelnames, quick=False):
+    gROOT.SetBatch(True)
+    rand = TRandom3()
+    rand.SetSeed(seed)
+    profiler = Profiler()
+    if quick:
+        storage = benchmark_prepare(profiler, 2, 5000, rand)
+    else:
+        storage = benchmark_prepare(profiler, 4, 50000, rand)
+    for modelname in modelnames:
+        print '<<< Benchmark model {0}'.format(modelname)
+        benchmark_model(
+            profiler, modelname, 10 if quick else 100, 10 if quick else 100,
+            rand
+        )
+    metrics = profiler.metrics()
+    return {
+        'host': node(),
+        'root': gROOT.GetVersion(),
+        'quick': quick,
+        'models': modelnames,
+        'total_time': metrics['total_time'],
+        'peak_memory': metrics['peak_memory'],
+        'storage': storage,
+        'benchmarks': {
+            stage['name']: {
+                'time': stage['time'],
+                'evaluations': stage['evaluations'],
+                'integrals': stage['integrals'],
+            } for stage in metrics['stages']
+        },
+    }
+
+def report_storage(current):
+    print '<<< {0:40} {1:>10} {2:>10} {3:>10}'.format(
+        'Storage profile', 'Size [kB]', 'Write [s]', 'Read [s]'
+    )
+    for profile, size in sorted(current['storage'].iteritems()):
+        print '<<< {0:40} {1:10.1f} {2:10.3f} {3:10.3f}'.format(
+            profile, size/1024.0,
+            current['benchmarks']['write_trees_{0}'.format(profile)]['time'],
+            current['benchmarks']['read_trees_{0}'.format(profile)]['time']
+        )
+
+def compare_benchmarks(baseline, current, tolerance):
+    slower = []
+    print '<<< {0:40} {1:>10} {2:>10} {3:>7}'.format(
+        'Benchmark', 'Baseline', 'Current', 'Ratio'
+    )
+    for name in sorted(current['benchmarks']):
+        if name not in baseline['benchmarks']:
+            continue
+        old = baseline['benchmarks'][name]['time']
+        new = current['benchmarks'][name]['time']
+        ratio = new/old if old > 0.0 else float('inf')
+        if ratio > tolerance:
+            slower.append(name)
+        print '<<< {0:40} {1:10.3f} {2:10.3f} {3:7.2f}{4}'.format(
+            name, old, new, ratio, ' !' if ratio > tolerance else ''
+        )
+    return slower
+
+def main():
+    if len(argv) < 2 or not argv[1] or argv[1] not in ('record', 'compare'):
+        raise RuntimeError('Specify 1st argument: Mode (record, compare).')
+    mode = argv[1]
+    if len(argv) >= 3 and argv[2] and not argv[2].startswith('-'):
+        filename = argv[2]
+    else:
+        filename = 'res/benchmark/baseline.json'
+    if mode == 'compare' and not exists(filename):
+        raise RuntimeError('Specify 2nd argument: Baseline file.')
+    modelnames = ['SG', 'DG', 'TG', 'SupG', 'SupDG']
+    tolerance = 1.2
+    for arg in argv:
+        if arg.startswith('-models='):
+            modelnames = arg[8:].split(',')
+            if any(m not in models for m in modelnames):
+                raise RuntimeError(
+                    'Usage: -models=SG,DG (SG, DG, TG, SupG, SupDG).'
+                )
+        if arg.startswith('-tolerance='):
+            tolerance = float(arg[11:])
+    quick = bool('-quick' in argv)
+    current = run_benchmarks(modelnames, quick=quick)
+    report_storage(current)
+    if mode == 'record':
+        if not exists('res'):
+            mkdir('res')
+        if not exists('res/benchmark'):
+            mkdir('res/benchmark')
+        with open(filename, 'w') as f:
+            dump(current, f, indent=4, separators=(',',': '), sort_keys=True)
+        print '<<< Baseline written to {0}'.format(filename)
+    else:
+        with open(filename) as f:
+            baseline = load(f)
+        if baseline['quick'] != quick:
+            print '<<< Warning: Baseline was recorded with quick={0}' \
+                  .format(baseline['quick'])
+        slower = compare_benchmarks(baseline, current, tolerance)
+        if slower:
+            raise RuntimeError('Slower than baseline: {0}.'.format(
+                ', '.join(slower)
+            ))
+
+if __name__ == '__main__':
+    main()
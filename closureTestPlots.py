@@ -8,6 +8,7 @@ from ROOT import (
 
 from lib.io import BareRootFile
 from lib.plot.plot import SingleHistBase
+from lib.stats import fill_histograms
 
 wip = True
 colors = (46, 8, 9, 42, 38, 30)
@@ -21,14 +22,46 @@ def closureTest_plots(filename):
     gStyle.SetStatW(0.2)
     gStyle.SetStatH(0.14)
 
-    hist1 = TH1F('hist1', '', 55, 0.9, 2.0)
-    hist2 = TH1F('hist2', '', 55, 0.9, 2.0)
+    #bins_csq = [(0.0, 1.1), (1.1, 1.3), (1.3, 1.6), (1.6, 2.0)]
+    #bins_cor = [(0.0, 0.5), (0.5, 1.0), (1.0, 1.5), (1.5, 2.0), (2.0, 2.5)]
+    #bins_csq = [(1.07, 1.13), (1.06, 1.11), (1.3, 1.5), (1.08, 1.17), (1.1, 1.2)]
+    #bins_cor = [(0.3, 0.8), (0.9, 1.2), (0.1, 0.5), (0.4, 0.7), (0.3, 1.1)]
+    bins_csq = [(0.99, 1.06), (0.98, 1.07), (0.99, 1.10), (1.02, 1.06), (1.00, 1.06), (1.00, 1.04)]
+    bins_cor = [(0.9, 1.9), (0.4, 1.6), (0.6, 1.5), (0.6, 1.9), (1.0, 1.3), (0.3, 1.5)]
+
+    # All histograms are filled in one pass over the tree
     condition = (
         'fit_overlapDiff>=0 && temp_overlapDiff>=0 && '
         'fit_chisq/fit_dof<=2 && temp_chisq/temp_dof<=2'
     )
-    tree.Draw('temp_chisq/temp_dof>>hist1', condition)
-    tree.Draw('fit_chisq/fit_dof>>hist2', condition)
+    specs = [
+        ('temp_chisq/temp_dof', (55, 0.9, 2.0), 'hist1'),
+        ('fit_chisq/fit_dof', (55, 0.9, 2.0), 'hist2'),
+        (
+            '100*temp_overlapDiff:100*fit_overlapDiff',
+            (31, -0.05, 3.05, 31, -0.05, 3.05), 'hist3'
+        ),
+        (
+            'temp_chisq/temp_dof:fit_chisq/fit_dof',
+            (22, 0.95, 1.5, 22, 0.95, 1.5), 'hist4'
+        ),
+    ]
+    for i, (csq_bin, cor_bin) in enumerate(zip(bins_csq, bins_cor)):
+        for prefix in ('temp', 'fit'):
+            hist = TH1F('hist_{0}_{1}'.format(prefix, i), '', 41, -2.05, 2.05)
+            hist.SetDirectory(0)
+            hist.StatOverflows()
+            selection = (
+                '100*{0}_overlapDiff>={1} && 100*{0}_overlapDiff<{2} && '
+                '{0}_chisq/{0}_dof>={3} && {0}_chisq/{0}_dof<{4}'
+            ).format(prefix, cor_bin[0], cor_bin[1], csq_bin[0], csq_bin[1])
+            specs.append((
+                '100*({0}_overlapDiff-toy_overlapDiff)'.format(prefix), hist,
+                'hist_{0}_{1}'.format(prefix, i), selection
+            ))
+    hists = fill_histograms(tree, condition, specs)
+
+    hist1, hist2 = hists['hist1'], hists['hist2']
     for i, hist in [(0, hist1), (1, hist2)]:
         hist.SetLineColor(colors[i])
         hist.SetLineWidth(3)
@@ -50,8 +83,7 @@ def closureTest_plots(filename):
     plot.save_pdf()
     plot.Close()
 
-    hist3 = TH2F('hist3', '', 31, -0.05, 3.05, 31, -0.05, 3.05)
-    tree.Draw('100*temp_overlapDiff:100*fit_overlapDiff>>hist3', condition)
+    hist3 = hists['hist3']
     one = TF1('one', 'x', -10.0, 10.0)
     one.SetLineColor(1)
     plot = SingleHistBase(
@@ -66,8 +98,7 @@ def closureTest_plots(filename):
     plot.save_pdf()
     plot.Close()
 
-    hist4 = TH2F('hist4', '', 22, 0.95, 1.5, 22, 0.95, 1.5)
-    tree.Draw('temp_chisq/temp_dof:fit_chisq/fit_dof>>hist4', condition)
+    hist4 = hists['hist4']
     plot = SingleHistBase(
         hist4, 'chisqDGvsSupDG', fill=None, workinprogress=wip
     )
@@ -85,13 +116,6 @@ def closureTest_plots(filename):
     gStyle.SetStatW(0.3)
     gStyle.SetStatH(0.08)
 
-    #bins_csq = [(0.0, 1.1), (1.1, 1.3), (1.3, 1.6), (1.6, 2.0)]
-    #bins_cor = [(0.0, 0.5), (0.5, 1.0), (1.0, 1.5), (1.5, 2.0), (2.0, 2.5)]
-    #bins_csq = [(1.07, 1.13), (1.06, 1.11), (1.3, 1.5), (1.08, 1.17), (1.1, 1.2)]
-    #bins_cor = [(0.3, 0.8), (0.9, 1.2), (0.1, 0.5), (0.4, 0.7), (0.3, 1.1)]
-    bins_csq = [(0.99, 1.06), (0.98, 1.07), (0.99, 1.10), (1.02, 1.06), (1.00, 1.06), (1.00, 1.04)]
-    bins_cor = [(0.9, 1.9), (0.4, 1.6), (0.6, 1.5), (0.6, 1.9), (1.0, 1.3), (0.3, 1.5)]
-
     means = {mod: [
         [0.0 for __ in bins_cor] for __ in bins_csq
     ] for mod in ('DG', 'SupDG')}
@@ -111,21 +135,12 @@ def closureTest_plots(filename):
             j = i
             name = 'hist_{{0}}_{0}csq{1}_{2}cor{3}' \
                    .format(csq_lo, csq_hi, cor_lo, cor_hi)
-            fields = '100*({0}_overlapDiff-toy_overlapDiff)>>hist'
-            condition = (
-                '100*{{0}}_overlapDiff>={0} && 100*{{0}}_overlapDiff<{1} && '
-                '{{0}}_chisq/{{0}}_dof>={2} && {{0}}_chisq/{{0}}_dof<{3} && '
-                'fit_overlapDiff>=0 && temp_overlapDiff>=0 && '
-                'fit_chisq/fit_dof<=2 && temp_chisq/temp_dof<=2'
-            ).format(cor_lo, cor_hi, csq_lo, csq_hi)
             xtitle = 'correction [%] from {0} fit #minus true correction [%]'
             line1 = '{0} < correction < {1}'.format(cor_lo, cor_hi)
             line2 = '{0} < #chi^{{2}}/d.o.f. < {1}'.format(csq_lo, csq_hi)
             gStyle.SetOptStat(2210)
             for prefix, modname in (('temp', 'DG'), ('fit', 'SupDG')):
-                hist = TH1F('hist', '', 41, -2.05, 2.05)
-                hist.StatOverflows()
-                tree.Draw(fields.format(prefix), condition.format(prefix))
+                hist = hists['hist_{0}_{1}'.format(prefix, i)]
                 plot = SingleHistBase(
                     hist, name.format(modname), fill=None, workinprogress=wip
                 )
@@ -13,6 +13,7 @@ from lib.shape.sg import SingleGauss
 from lib.shape.tg import (
     TripleGaussFit, TripleGaussToy, SuperDoubleGaussFit, SuperDoubleGaussToy
 )
+from lib.stats import write_stats
 
 def do_closureTest(
     suffix, toymodel, fitmodel, vtxresx, vtxresy=None,
@@ -108,6 +109,7 @@ def do_closureTest(
 
     output = RootFile(name, 'RECREATE')
     tree.Write()
+    write_stats(tree)
     Timestamp().Write()
     output.Write()
     return output.close()
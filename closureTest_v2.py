@@ -12,6 +12,7 @@ from lib.shape.dg import (
 )
 from lib.shape.sg import SingleGauss
 from lib.shape.tg import SuperDoubleGaussFit, SuperDoubleGaussToy, TripleGaussToy
+from lib.stats import write_stats
 
 def do_closureTest(
     suffix, toymodel, tempmodel, fitmodel, vtxresx, vtxresy=None,
@@ -184,6 +185,7 @@ def do_closureTest(
 
     output = RootFile(name, 'RECREATE')
     tree.Write()
+    write_stats(tree)
     Timestamp().Write()
     output.Write()
     return output.close()
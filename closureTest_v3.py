@@ -20,6 +20,7 @@ from lib.shape.sg import SingleGauss
 from lib.shape.tg import (
     SuperDoubleGaussFit, SuperDoubleGaussToy, TripleGaussToy
 )
+from lib.stats import write_stats
 
 def do_closureTest(
     suffix, toymodel, tempmodel, fitmodel, inputfile, vtxresx, vtxresy=None
@@ -142,6 +143,8 @@ def do_closureTest(
             Timestamp(), NamedString('name', name)
         ]:
             obj.Write()
+        write_stats(tempTree)
+        write_stats(corrTree)
         for i, scan in enumerate(('X1', 'Y1', 'X2', 'Y2')):
             NamedFloat('temp_chisq{0}'.format(scan), tchisqs[i]).Write()
             NamedFloat('temp_dof{0}'.format(scan), tdofs[i]).Write()
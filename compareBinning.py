@@ -2,15 +2,16 @@ from json import load
 from os.path import exists
 from sys import argv
 
-from ROOT import RooArgList, RooDataHist
-
-from lib.fit import compute_chisq, residual_hist
-from lib.io import BareRootFile
+from lib.fit import (
+    compute_chisq, data_hist, make_datahist, model_hist_fast, residual_hist
+)
+from lib.io import BareRootFile, load_bi_hists
+from lib.prepare import binnings, rebin_histograms
 from lib.shape.dg import DoubleGaussFit
 from lib.shape.sg import SingleGauss
 from lib.shape.tg import TripleGaussFit
 
-def compare_binning(filename):
+def compare_binning(filename, binning=None):
     scans = ('X1', 'Y1', 'X2', 'Y2')
 
     with BareRootFile(filename) as f:
@@ -31,26 +32,26 @@ def compare_binning(filename):
 
     with open('res/hist/{0}.json'.format(dataname)) as f:
         json = load(f)
-    nbins = json['nbins']
+    if binning is None:
+        nbins = json['nbins']
+    else:
+        nbins = binnings[binning]
     scaling = json['scaling']
-    datafile = '{0}/{1}.root'.format(json['datapath'], json['name'])
+    # Histograms are derived from the finer master histograms if available
+    datafile = '{0}/{1}.root'.format(
+        json['datapath'], json.get('master', json['dataname'])
+    )
 
-    hists = []
-    with BareRootFile(datafile) as f:
-        for histname in [
-            'hist_Beam2MoveX_bunch{0}Add', 'hist_Beam2MoveY_bunch{0}Add',
-            'hist_Beam1MoveX_bunch{0}Add', 'hist_Beam1MoveY_bunch{0}Add'
-        ]:
-            hist = f.get(histname.format(bcid))
-            hists.append(hist)
-    datahist = [RooDataHist(
-        'scan{0}Beam{1}RestDataHist'.format(c, i),
-        'scan{0}Beam{1}RestDataHist'.format(c, i),
-        RooArgList(model.xvar(), model.yvar()),
-        hists[j]
-    ) for j, (i,c) in enumerate([('1','X'),('1','Y'),('2','X'),('2','Y')])]
+    hists = load_bi_hists(datafile, [bcid])[bcid]
+    rebinned = rebin_histograms(
+        dict((hist.GetName(), hist) for hist in hists), nbins
+    )
+    hists = [rebinned[hist.GetName()] for hist in hists]
+    datahist = make_datahist(model, hists)
 
-    chisq, dof, hdata, hmodel = compute_chisq(model, modfuncs, datahist, nbins)
+    hdata = data_hist(model.xvar(), model.yvar(), datahist, nbins)
+    hmodel = model_hist_fast(model.xvar(), model.yvar(), modfuncs, nbins)
+    chisq, dof = compute_chisq(hmodel, hdata, nbins)
     scDat, scMod, scRes = residual_hist(hdata, hmodel, scaling)
 
     for i, scan in enumerate(scans):
@@ -63,7 +64,13 @@ def compare_binning(filename):
 def main():
     if len(argv) < 2 or not argv[1] or not exists(argv[1]):
         raise RuntimeError('Specify 1st argument: ROOT results file.')
-    return compare_binning(argv[1])
+    if len(argv) >= 3 and argv[2]:
+        if argv[2] not in ('many', 'some', 'few'):
+            raise RuntimeError('Optional 2nd argument: Bins (many, some, few).')
+        binning = argv[2]
+    else:
+        binning = None
+    return compare_binning(argv[1], binning)
 
 if __name__ == '__main__':
     main()
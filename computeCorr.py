@@ -6,9 +6,11 @@ from ROOT import TH1F
 
 from lib.correction import compute_correction
 from lib.io import copy_directory, NamedFloat, RootFile, Timestamp
+from lib.results import record_results
 from lib.shape.dg import DoubleGaussFit, SuperGaussFit
 from lib.shape.sg import SingleGauss, SingleGaussUncorrelated
 from lib.shape.tg import SuperDoubleGaussFit, TripleGaussFit
+from lib.stats import write_stats
 
 def compute_corr(model, bcid, inputfile):
     model.load_root(inputfile)
@@ -29,10 +31,12 @@ def compute_corr(model, bcid, inputfile):
         copy_directory(new, old, condition=condition)
         new.cd()
         corrTree.Write()
+        write_stats(corrTree)
         overlapFit.Write()
         overlapDiff.Write()
         #NamedFloat('overlap_diff', overlapDiff).Write()
         Timestamp('corrTimestamp').Write()
+    record_results(new.filename)
 
 def compute_corr_randomized(model, bcid, inputfile):
     model.load_root(inputfile)
@@ -51,9 +55,11 @@ def compute_corr_randomized(model, bcid, inputfile):
         new.cd()
         corrTree.SetName('rndmzd_corrTree')
         corrTree.Write()
+        write_stats(corrTree)
         overlapFit.Write()
         overlapDiff.Write()
         Timestamp('rndmzdTimestamp').Write()
+    record_results(new.filename)
 
 fitmodels = ('noCorr', 'SG', 'DG', 'TG', 'SupG', 'SupDG')
 
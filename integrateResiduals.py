@@ -5,7 +5,10 @@ from sys import argv
 from ROOT import RooArgList, RooDataHist
 
 from lib.fit import compute_chisq, data_hist, model_hist, residual_hist
-from lib.io import BareRootFile, copy_directory, NamedFloat, RootFile, Timestamp
+from lib.io import (
+    copy_directory, load_bi_hists, NamedFloat, RootFile, Timestamp
+)
+from lib.results import record_results
 from lib.shape.dg import DoubleGaussFit, SuperGaussFit
 from lib.shape.sg import SingleGauss, SingleGaussUncorrelated
 from lib.shape.tg import SuperDoubleGaussFit, TripleGaussFit
@@ -16,15 +19,7 @@ def integrate_residuals(
     model, bcid, datafile, outputname, nbins, scaling=1.0, crange=None
 ):
     model.load_root(outputname)
-    hists = []
-    with BareRootFile(datafile) as f:
-        for histname in [
-            'hist_Beam2MoveX_bunch{0}Add', 'hist_Beam2MoveY_bunch{0}Add',
-            'hist_Beam1MoveX_bunch{0}Add', 'hist_Beam1MoveY_bunch{0}Add'
-        ]:
-            hist = f.Get(histname.format(bcid))
-            hist.SetDirectory(0)
-            hists.append(hist)
+    hists = load_bi_hists(datafile, [bcid])[bcid]
 
     modfuncs = model.model_functions()
     datahist = [RooDataHist(
@@ -57,6 +52,7 @@ def integrate_residuals(
             NamedFloat('chisq{0}'.format(scan), chisqs[i]).Write()
             NamedFloat('dof{0}'.format(scan), dofs[i]).Write()
         Timestamp('resTimestamp').Write()
+    record_results(new.filename)
 
 fitmodels = ('noCorr', 'SG', 'DG', 'TG', 'SupG', 'SupDG')
 
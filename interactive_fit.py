@@ -1,30 +1,140 @@
 from json import load
+from multiprocessing import Pipe, Process
 from os.path import exists
 from re import match
 from sys import argv
+from time import time
+from traceback import format_exc
 
 from ROOT import (
     gStyle, kLHintsExpandX, kLHintsExpandY, RooFit, TGHorizontalFrame,
     TGHorizontalLayout, TGLabel, TGLayoutHints, TGMainFrame, TGNumberEntry,
-    TGTextButton, TGVerticalFrame, TRootEmbeddedCanvas, TPyDispatcher
+    TGTextButton, TGVerticalFrame, TPyDispatcher, TRootEmbeddedCanvas, TTimer
 )
 from ROOT.TGNumberFormat import kNESRealThree
 
+from lib.batch import parse_options
+from lib.cache import FitCache
 from lib.fit import (
-    compute_chisq, data_hist, fit, model_hist_fast as model_hist, residual_hist
+    compute_chisq, data_hist, fit, fit_numpy, make_datahist,
+    model_hist_fast as model_hist, residual_hist
 )
-from lib.io import BareRootFile
+from lib.io import hist_array, load_bi_hists
 from lib.plot.plot import ColorBase
 from lib.shape.dg import DoubleGaussFit, SuperGaussFit
 from lib.shape.sg import SingleGauss, SingleGaussUncorrelated
 from lib.shape.tg import SuperDoubleGaussFit, TripleGaussFit
 
-class ParameterConstWindow(TGMainFrame):
+class ModelCache:
+
+    def __init__(self, model, hists, crange):
+        self.model = model
+        self.crange = crange
+        self.modfuncs = model.model_functions()
+        self.hdata = data_hist(
+            model.xvar(), model.yvar(), make_datahist(model, hists)
+        )
+        # Free parameters each scan depends on
+        self.depends = [[
+            par for par in model.parameters()
+            if not par.is_formula() and modfunc.dependsOn(par)
+        ] for modfunc in self.modfuncs]
+        self.keys = [None]*4
+        self.hmodel = [None]*4
+        self.results = [None]*4
+
+    def update(self):
+        changed = []
+        for i, modfunc in enumerate(self.modfuncs):
+            key = tuple(par.val() for par in self.depends[i])
+            if key == self.keys[i]:
+                continue
+            self.hmodel[i] = modfunc.createHistogram(
+                'cachedModel{0}'.format(i), self.model.xvar(),
+                RooFit.Binning(95),
+                RooFit.YVar(self.model.yvar(), RooFit.Binning(95))
+            )
+            self.keys[i] = key
+            changed.append(i)
+        return changed
+
+    def model_hists(self):
+        self.update()
+        return self.hmodel
+
+    def residuals(self):
+        changed = self.update()
+        if changed:
+            # compute_chisq scales the model histograms
+            hmodel = [
+                hist.Clone('scaledModel{0}'.format(i))
+                for i, hist in enumerate(self.hmodel)
+            ]
+            chisqs, dofs = compute_chisq(hmodel, self.hdata)
+            __, __, scRes = residual_hist(
+                self.hdata, hmodel, 1.0, crange=self.crange
+            )
+            for i in changed:
+                self.results[i] = (scRes[i], chisqs[i], dofs[i])
+        return zip(*self.results)
+
+class FitWorker:
 
     def __init__(self, model, fitter):
-        self._container = []
         self.model = model
         self.fitter = fitter
+        self._process = None
+        self._conn = None
+
+    def start(self):
+        self._conn, child = Pipe(False)
+        self._process = Process(target=self._run, args=(child,))
+        self._process.daemon = True
+        self._process.start()
+
+    def _run(self, conn):
+        try:
+            result, residuals, chisqs, dofs = self.fitter(
+                self.model, lambda stage: conn.send(('progress', stage))
+            )
+            parameters = {
+                par.GetName(): (par.getVal(), par.getError())
+                for par in self.model.parameters() if not par.is_formula()
+            }
+            conn.send((
+                'done', (parameters, result.minNll(), residuals, chisqs, dofs)
+            ))
+        except Exception:
+            conn.send(('error', format_exc()))
+
+    def running(self):
+        return self._process is not None and self._process.is_alive()
+
+    def messages(self):
+        messages = []
+        while self._conn is not None and self._conn.poll():
+            try:
+                messages.append(self._conn.recv())
+            except EOFError:
+                messages.append(('error', 'Fit process died'))
+                self.cancel()
+        return messages
+
+    def cancel(self):
+        if self._process is not None:
+            if self._process.is_alive():
+                self._process.terminate()
+            self._process.join()
+        self._process = None
+        self._conn = None
+
+class ParameterConstWindow(TGMainFrame):
+
+    def __init__(self, model, fitter, cache):
+        self._container = []
+        self.model = model
+        self.worker = FitWorker(model, fitter)
+        self.cache = cache
 
         ColorBase.kBird()
         gStyle.SetOptStat(0)
@@ -86,9 +196,17 @@ class ParameterConstWindow(TGMainFrame):
             self._metaPars[par] = entry
         self._computeBtn = TGTextButton(self._metaCol, 'Compute', 10)
         self._fitBtn = TGTextButton(self._metaCol, 'Fit data', 10)
+        self._cancelBtn = TGTextButton(self._metaCol, 'Cancel fit', 10)
         self._drawBtn = TGTextButton(self._metaCol, 'Draw model', 10)
-        for btn in [self._computeBtn, self._fitBtn, self._drawBtn]:
+        for btn in [
+            self._computeBtn, self._fitBtn, self._cancelBtn, self._drawBtn
+        ]:
             self._metaCol.AddFrame(btn, TGLayoutHints(kLHintsExpandX, 5,5,5,5))
+        self._cancelBtn.SetEnabled(False)
+        self._status = TGLabel(self._metaCol, 'Idle')
+        self._metaCol.AddFrame(
+            self._status, TGLayoutHints(kLHintsExpandX, 5, 5, 5, 5)
+        )
         self.AddFrame(self._metaCol)
 
         self._canvCol = [TGVerticalFrame(self, 250, 500) for i in range(2)]
@@ -114,10 +232,20 @@ class ParameterConstWindow(TGMainFrame):
         self._fitBtn.Connect(
             'Clicked()', 'TPyDispatcher', self._fitBtnDisp, 'Dispatch()'
         )
+        self._cancelBtnDisp = TPyDispatcher(self.cancelBtnClicked)
+        self._cancelBtn.Connect(
+            'Clicked()', 'TPyDispatcher', self._cancelBtnDisp, 'Dispatch()'
+        )
         self._drawBtnDisp = TPyDispatcher(self.drawBtnClicked)
         self._drawBtn.Connect(
             'Clicked()', 'TPyDispatcher', self._drawBtnDisp, 'Dispatch()'
         )
+        # Poll the fit process from the event loop
+        self._timer = TTimer(200)
+        self._timerDisp = TPyDispatcher(self.pollFit)
+        self._timer.Connect(
+            'Timeout()', 'TPyDispatcher', self._timerDisp, 'Dispatch()'
+        )
 
         self.SetWindowName('{0} Parameters'.format(self.model.name()))
         self.MapSubwindows()
@@ -130,6 +258,7 @@ class ParameterConstWindow(TGMainFrame):
             par.setConstant()
 
     def __del__(self):
+        self.worker.cancel()
         self.Cleanup()
 
     def readParameters(self):
@@ -149,40 +278,103 @@ class ParameterConstWindow(TGMainFrame):
         if nll:
             self._metaPars['nll'].SetNumber(nll)
 
-    def computeBtnClicked(self):
-        self.readParameters()
-        self.displayParameters()
+    def setStatus(self, text):
+        self._status.SetText(text)
+        self._metaCol.Layout()
 
-    def fitBtnClicked(self):
-        self.readParameters()
-        result, residuals, allChi2, allDof = self.fitter(self.model)
-        self._residuals = residuals
-        self.displayParameters(sum(allChi2)/sum(allDof), result.minNll())
+    def setFitting(self, fitting):
+        self._fitBtn.SetEnabled(not fitting)
+        self._computeBtn.SetEnabled(not fitting)
+        self._drawBtn.SetEnabled(not fitting)
+        self._cancelBtn.SetEnabled(fitting)
+        if fitting:
+            self._timer.TurnOn()
+        else:
+            self._timer.TurnOff()
 
+    def drawResiduals(self, residuals):
+        self._residuals = residuals
         for i in range(4):
             self._canvas[i].GetCanvas().cd()
-            for xbin in range(self._residuals[i].GetXaxis().GetNbins()+1):
-                for ybin in range(self._residuals[i].GetYaxis().GetNbins()+1):
-                    if self._residuals[i].GetBinContent(xbin, ybin) < -4.9999:
-                        self._residuals[i].SetBinContent(xbin, ybin, -4.9999)
-                    if self._residuals[i].GetBinContent(xbin, ybin) == 0.0:
-                        self._residuals[i].SetBinContent(xbin, ybin, -10.0)
+            pulls = hist_array(self._residuals[i])
+            pulls[pulls < -4.9999] = -4.9999
+            pulls[pulls == 0.0] = -10.0
             self._residuals[i].Draw('COLZ')
             self._residuals[i].GetZaxis().SetRangeUser(-5.0, 5.0)
             self._canvas[i].GetCanvas().Update()
 
+    def computeBtnClicked(self):
+        self.readParameters()
+        self.displayParameters()
+        start = time()
+        residuals, allChi2, allDof = self.cache.residuals()
+        self.displayParameters(chi2=sum(allChi2)/sum(allDof))
+        self.drawResiduals([hist.Clone() for hist in residuals])
+        self.setStatus('Computed ({0:.1f}s)'.format(time()-start))
+
+    def fitBtnClicked(self):
+        self.readParameters()
+        self._fitStart = time()
+        self._fitStage = 'starting'
+        self.worker.start()
+        self.setFitting(True)
+        self.setStatus('Fit: starting')
+
+    def cancelBtnClicked(self):
+        self.worker.cancel()
+        self.setFitting(False)
+        self.setStatus('Fit cancelled')
+
+    def handleMessages(self, messages):
+        for kind, content in messages:
+            if kind == 'progress':
+                self._fitStage = content
+            elif kind == 'error':
+                print '<<< Fit failed:'
+                print content
+                self.worker.cancel()
+                self.setFitting(False)
+                self.setStatus('Fit failed')
+                return True
+            elif kind == 'done':
+                self.worker.cancel()
+                self.setFitting(False)
+                self.fitDone(*content)
+                return True
+        return False
+
+    def pollFit(self):
+        if self.handleMessages(self.worker.messages()):
+            return
+        if not self.worker.running():
+            # The worker may have sent its result and exited after the
+            # messages were read
+            if self.handleMessages(self.worker.messages()):
+                return
+            self.worker.cancel()
+            self.setFitting(False)
+            self.setStatus('Fit process died')
+            return
+        self.setStatus('Fit: {0} ({1:.0f}s)'.format(
+            self._fitStage, time()-self._fitStart
+        ))
+
+    def fitDone(self, parameters, nll, residuals, allChi2, allDof):
+        for name, (val, err) in parameters.iteritems():
+            self.model.parameter(name).setVal(val)
+            self.model.parameter(name).setError(err)
+        self.displayParameters(sum(allChi2)/sum(allDof), nll)
+        self.drawResiduals(residuals)
+        self.setStatus('Fit done ({0:.0f}s)'.format(time()-self._fitStart))
+
     def drawBtnClicked(self):
         self.readParameters()
         self.displayParameters()
 
-        modelFunctions = self.model.model_functions()
         self._hists = []
-        for i in range(4):
+        for i, hist in enumerate(self.cache.model_hists()):
             self._canvas[i].GetCanvas().cd()
-            hist = modelFunctions[i].createHistogram(
-                'model{0}'.format(i), self.model.xvar(), RooFit.Binning(95),
-                RooFit.YVar(self.model.yvar(), RooFit.Binning(95))
-            )
+            hist = hist.Clone('model{0}'.format(i))
             hist.SetTitle('')
             hist.GetXaxis().SetTitle('')
             hist.GetYaxis().SetTitle('')
@@ -192,15 +384,32 @@ class ParameterConstWindow(TGMainFrame):
             self._canvas[i].GetCanvas().Update()
 
 def fit_shape(
-    model, bcid, hists, name, crange
+    model, bcid, hists, name, crange, cache=None, ncpu=1, numpy=False,
+    progress=None
 ):
-    fitmethod = lambda pdf, data: pdf.fitTo(
-        data, RooFit.Save(), RooFit.PrintLevel(1), RooFit.Verbose(0)
-    )
-    result, modfuncs, datahist = fit(model, hists, fitmethod)
+    if progress is None:
+        progress = lambda stage: None
+    progress('fit')
+    if numpy:
+        fitter, fitmethod = fit_numpy, 'nll'
+    else:
+        fitter = fit
+        fitmethod = lambda pdf, data: pdf.fitTo(
+            data, RooFit.Save(), RooFit.PrintLevel(1), RooFit.Verbose(0),
+            RooFit.NumCPU(ncpu, RooFit.Interleave)
+        )
+    if cache is None:
+        result, modfuncs, datahist = fitter(model, hists, fitmethod)
+    else:
+        result, modfuncs, datahist = cache.fit(
+            model, hists, fitmethod, fitter=fitter
+        )
+    progress('model histograms')
     hdata = data_hist(model.xvar(), model.yvar(), datahist)
     hmodel = model_hist(model.xvar(), model.yvar(), modfuncs)
+    progress('chi-square')
     chisqs, dofs = compute_chisq(hmodel, hdata)
+    progress('residuals')
     __, __, scRes = residual_hist(hdata, hmodel, 1.0, crange=crange)
     return result, scRes, chisqs, dofs
 
@@ -230,23 +439,26 @@ def main():
         'noCorr': SingleGaussUncorrelated
     }[argv[3]](crange=crange)
     datafile = '{0}/{1}.root'.format(config['datapath'], config['dataname'])
-    hists = []
-    with BareRootFile(datafile) as f:
-        for histname in [
-            'hist_Beam2MoveX_bunch{0}Add', 'hist_Beam2MoveY_bunch{0}Add',
-            'hist_Beam1MoveX_bunch{0}Add', 'hist_Beam1MoveY_bunch{0}Add'
-        ]:
-            hist = f.Get(histname.format(bcid))
-            hist.SetDirectory(0)
-            hists.append(hist)
+    hists = load_bi_hists(datafile, [bcid])[bcid]
     vtxresx = config['vtxresx']
     vtxresy = config['vtxresy']
     scaling = config['scaling']
     model.set_vtxres(vtxresx / scaling, vtxresy / scaling)
-    fitter = (lambda c, h, n, r: lambda m: fit_shape(m, c, h, n, r))(
-        bcid, hists, name, crange
+    options = parse_options(argv)
+    if options['cache']:
+        cache = FitCache()
+    else:
+        cache = None
+    ncpu = options['ncpu']
+    numpy = options['numpy']
+    fitter = (
+        lambda c, h, n, r, k, p, v: lambda m, g: fit_shape(
+            m, c, h, n, r, k, p, v, progress=g
+        )
+    )(bcid, hists, name, crange, cache, ncpu, numpy)
+    window = ParameterConstWindow(
+        model, fitter, ModelCache(model, hists, crange)
     )
-    window = ParameterConstWindow(model, fitter)
 
 if __name__ == '__main__':
     main()
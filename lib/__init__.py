@@ -1,12 +1,19 @@
 __all__ = [
+    'batch',
+    'cache',
     'closure',
     'compile',
     'correction',
     'fit',
+    'incremental',
     'io',
     'plot',
     'prepare',
+    'profiling',
+    'results',
     'shape',
+    'stats',
+    'store',
     'submit',
     'vars',
 ]
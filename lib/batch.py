@@ -0,0 +1,88 @@
+"""Provides functions for fitting several BCIDs in one process.
+
+parse_bcids: Parse list of BCIDs from command line argument.
+parse_options: Parse fit options from command line arguments.
+run_batch: Run a task for several BCIDs, optionally in worker processes.
+"""
+
+from multiprocessing import Pool
+from traceback import print_exc
+
+_task = None
+
+def parse_bcids(arg, bcids):
+    """Parse a list of BCIDs from a command line argument.
+
+    arg: Comma-separated list of BCIDs, or 'all'.
+    bcids: List of valid BCIDs (from JSON config).
+    Returns empty list if any of the BCIDs is not valid.
+    """
+    if arg == 'all':
+        return list(bcids)
+    try:
+        result = [int(bcid) for bcid in arg.split(',')]
+    except ValueError:
+        return []
+    if any(bcid not in bcids for bcid in result):
+        return []
+    return result
+
+def parse_options(args):
+    """Parse the fit options from command line arguments.
+
+    args: List of command line arguments.
+    Returns dict with cache, multires and numpy (bool, set by -cache,
+    -multires and -numpy) and ncpu and jobs (int, set by -ncpu=N and -jobs=N,
+    default 1). Raises RuntimeError on invalid options.
+    """
+    options = {
+        'cache': '-cache' in args, 'multires': '-multires' in args,
+        'numpy': '-numpy' in args, 'ncpu': 1, 'jobs': 1,
+    }
+    for arg in args:
+        for name in ('ncpu', 'jobs'):
+            prefix = '-{0}='.format(name)
+            if not arg.startswith(prefix):
+                continue
+            try:
+                options[name] = int(arg[len(prefix):])
+            except ValueError:
+                options[name] = 0
+            if options[name] < 1:
+                raise RuntimeError(
+                    'Usage: {0}N with a positive integer N.'.format(prefix)
+                )
+    if options['cache'] and options['multires']:
+        raise RuntimeError('Options -cache and -multires cannot be combined.')
+    return options
+
+def _run(bcid):
+    try:
+        _task(bcid)
+    except Exception:
+        print '<<< Error (BCID {0}):'.format(bcid)
+        print_exc()
+        return bcid
+    return None
+
+def run_batch(task, bcids, jobs=1):
+    """Run a task for several BCIDs.
+
+    task: Function that takes a BCID as argument.
+    bcids: List of BCIDs.
+    jobs: Number of worker processes. They are forked when this function is
+          called, so that everything loaded before (ROOT, plugins, data) is
+          shared and not loaded again.
+    Failures of single BCIDs are reported and do not stop the others.
+    Returns list of BCIDs that failed.
+    """
+    global _task
+    _task = task
+    if jobs > 1 and len(bcids) > 1:
+        pool = Pool(min(jobs, len(bcids)))
+        failed = pool.map(_run, bcids, chunksize=1)
+        pool.close()
+        pool.join()
+    else:
+        failed = [_run(bcid) for bcid in bcids]
+    return [bcid for bcid in failed if bcid is not None]
@@ -0,0 +1,243 @@
+"""Provides a persistent cache for fit results.
+
+FitCache: Cache of fit results keyed by data, model and configuration.
+hist_digest: Compute hash of histogram contents.
+"""
+
+from contextlib import contextmanager
+from fcntl import flock, LOCK_EX, LOCK_UN
+from hashlib import sha1
+from json import dump, dumps, load
+from os import getpid, makedirs, remove, rename
+from os.path import basename, exists
+from time import time
+
+from ROOT import RooAbsReal
+
+from lib.fit import fit, make_datahist
+from lib.io import BareRootFile, hist_array, NamedFloat
+
+def hist_digest(hist):
+    """Compute a hash of the binning and bin contents of a histogram."""
+    digest = sha1()
+    for axis in (hist.GetXaxis(), hist.GetYaxis()):
+        digest.update('{0} {1!r} {2!r};'.format(
+            axis.GetNbins(), axis.GetXmin(), axis.GetXmax()
+        ))
+    digest.update(hist_array(hist).tostring())
+    return digest.hexdigest()
+
+class FitCache:
+    """Persistent cache of fit results with LRU eviction.
+
+    __init__: Initialize.
+    configuration: Return fit configuration of a model.
+    key: Compute cache key of a fit.
+    lookup: Restore a cached fit result.
+    store: Store a fit result.
+    warmstart: Assign start values from the closest cached result.
+    fit: Fit beam shapes, using cached results where possible.
+    """
+
+    def __init__(self, path='cache/fits', maxsize=200):
+        """Initialize the cache.
+
+        path: Directory in which results and index are stored.
+        maxsize: Maximum number of stored results.
+        """
+        self.path = path
+        self.maxsize = maxsize
+        if not exists(path):
+            makedirs(path)
+
+    def _index_name(self):
+        return '{0}/index.json'.format(self.path)
+
+    def _read_index(self):
+        if not exists(self._index_name()):
+            return {}
+        try:
+            with open(self._index_name()) as f:
+                return load(f)
+        except ValueError:
+            return {}
+
+    def _write_index(self, index):
+        temp = '{0}.{1}'.format(self._index_name(), getpid())
+        with open(temp, 'w') as f:
+            dump(index, f, indent=4, separators=(',',': '))
+        rename(temp, self._index_name())
+
+    @contextmanager
+    def _locked(self):
+        """Lock the index against concurrent read-modify-write cycles."""
+        with open('{0}/index.lock'.format(self.path), 'w') as lock:
+            flock(lock, LOCK_EX)
+            try:
+                yield
+            finally:
+                flock(lock, LOCK_UN)
+
+    @staticmethod
+    def configuration(model):
+        """Return start values, boundaries and constness of all parameters.
+
+        Includes the vertex resolution, which is a (constant) parameter.
+        """
+        config = {}
+        for par in model.parameters():
+            if par.is_formula():
+                continue
+            config[par.GetName()] = [
+                par.getVal(), par.getMin(), par.getMax(), bool(par.isConstant())
+            ]
+        return config
+
+    def key(self, model, hists, fitname, eps):
+        """Compute the cache key of a fit.
+
+        model: Beam shape model (derived from BeamShapeCore).
+        hists: List of four TH2F with BI data.
+        fitname: Name identifying the fit method.
+        eps: Value of convergence criteria.
+        Returns 2-tuple of data key and full key.
+        """
+        datakey = sha1(' '.join([hist_digest(h) for h in hists])).hexdigest()
+        config = dumps({
+            'model': model.name(),
+            'parameters': self.configuration(model),
+            'crange': [model.xvar().getMin(), model.xvar().getMax()],
+            'fitmethod': fitname,
+            'eps': eps,
+        }, sort_keys=True)
+        return datakey, sha1(datakey+config).hexdigest()
+
+    def lookup(self, model, key):
+        """Restore a cached fit result and assign its parameter values.
+
+        Returns RooFitResult, or None if the key is not cached.
+        """
+        index = self._read_index()
+        if key not in index:
+            return None
+        filename = '{0}/{1}.root'.format(self.path, key)
+        if not exists(filename):
+            return None
+        with BareRootFile(filename) as f:
+            result = f.get('fitResult')
+            for par in model.parameters():
+                if par.is_formula():
+                    continue
+                value = f.Get('final/{0}'.format(par.GetName()))
+                error = f.Get('final/{0}_error'.format(par.GetName()))
+                if value and error:
+                    par.setVal(value.GetVal())
+                    par.setError(error.GetVal())
+        with self._locked():
+            index = self._read_index()
+            if key in index:
+                index[key]['used'] = time()
+                self._write_index(index)
+        return result
+
+    def store(self, model, key, datakey, fitname, config, result):
+        """Store a fit result and evict least recently used results.
+
+        config: Configuration of the model before the fit.
+        """
+        filename = '{0}/{1}.root'.format(self.path, key)
+        with BareRootFile(filename, 'RECREATE') as f:
+            result.Write('fitResult')
+            f.mkdir('final').cd()
+            for par in model.parameters():
+                if par.is_formula():
+                    continue
+                NamedFloat(par.GetName(), par.getVal()).Write()
+                NamedFloat(
+                    '{0}_error'.format(par.GetName()), par.getError()
+                ).Write()
+        with self._locked():
+            index = self._read_index()
+            index[key] = {
+                'model': model.name(), 'data': datakey, 'fitmethod': fitname,
+                'initial': config, 'final': self.configuration(model),
+                'used': time()
+            }
+            for old in sorted(index, key=lambda k: index[k]['used'])[
+                :max(len(index)-self.maxsize, 0)
+            ]:
+                del index[old]
+                if exists('{0}/{1}.root'.format(self.path, old)):
+                    remove('{0}/{1}.root'.format(self.path, old))
+            self._write_index(index)
+
+    def warmstart(self, model, datakey, fitname):
+        """Assign start values from the closest cached result.
+
+        Only results for the same model, data and fit method are considered.
+        The distance is computed from the start values of the free parameters,
+        normalized to their ranges. Returns the key of the used result.
+        """
+        config = self.configuration(model)
+        free = [n for n, (v, lo, hi, const) in config.iteritems() if not const]
+        index = self._read_index()
+        best, bestdist = None, None
+        for key, entry in index.iteritems():
+            if (
+                entry['model'] != model.name() or entry['data'] != datakey
+                or entry['fitmethod'] != fitname
+            ):
+                continue
+            dist = 0.0
+            for name in free:
+                if name not in entry['initial']:
+                    continue
+                value, lo, hi, __ = config[name]
+                if hi > lo:
+                    dist += ((entry['initial'][name][0]-value)/(hi-lo))**2
+            if bestdist is None or dist < bestdist:
+                best, bestdist = key, dist
+        if best is None:
+            return None
+        final = index[best]['final']
+        for name in free:
+            if name not in final:
+                continue
+            par = model.parameter(name)
+            par.setVal(min(max(final[name][0], par.getMin()), par.getMax()))
+        print '<<< Warm start from cached fit {0}'.format(best)
+        return best
+
+    def fit(
+        self, model, hists, fitmethod, eps=1.0e-7, fitname=None,
+        warmstart=True, fitter=fit
+    ):
+        """Fit beam shapes to Beam Imaging data, using cached results.
+
+        Arguments and return values are the same as for lib.fit.fit.
+        fitname: Name identifying the fit method (default: name and location
+                 of its code, so that lambdas of different scripts differ).
+        warmstart: Set true to start from the closest cached result on a miss.
+        fitter: Fit function (fit or fit_numpy) used on a miss.
+        """
+        if fitname is None and fitter is not fit:
+            fitname = '{0}:{1}'.format(fitter.__name__, fitmethod)
+        elif fitname is None:
+            code = fitmethod.func_code
+            fitname = '{0}:{1}:{2}'.format(
+                basename(code.co_filename), code.co_firstlineno,
+                fitmethod.__name__
+            )
+        datakey, key = self.key(model, hists, fitname, eps)
+        result = self.lookup(model, key)
+        if result is not None:
+            print '<<< Use cached fit {0}'.format(key)
+            RooAbsReal.defaultIntegratorConfig().setEpsAbs(eps)
+            RooAbsReal.defaultIntegratorConfig().setEpsRel(eps)
+            return result, model.model_functions(), make_datahist(model, hists)
+        config = self.configuration(model)
+        if warmstart:
+            self.warmstart(model, datakey, fitname)
+        result, modfuncs, datahist = fitter(model, hists, fitmethod, eps=eps)
+        self.store(model, key, datakey, fitname, config, result)
+        return result, modfuncs, datahist
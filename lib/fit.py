@@ -1,6 +1,9 @@
 """Provides functions for fitting of BI data.
 
 fit: Fit beam shapes to Beam Imaging data.
+fit_numpy: Fit beam shapes with vectorized model and TMinuit.
+fit_multires: Fit beam shapes on progressively finer binnings.
+make_datahist: Convert BI histograms to RooDataHist.
 model_hist: Create model histogram (based on bin integrals).
 model_hist_fast: Create model histogram (based on bin centers).
 data_hist: Create data histogram.
@@ -9,11 +12,17 @@ overlap_variations: Compute overlap integral with errors.
 residual_hist: Create residual histograms.
 """
 
+from array import array
+
+from numpy import float64, fromiter, log, maximum, where
 from ROOT import (
-    RooAbsReal, RooArgList, RooArgSet, RooCategory, RooDataHist, RooFit,
-    RooSimultaneous, TH2D, TRandom3
+    Double, Long, RooAbsReal, RooArgList, RooArgSet, RooCategory, RooDataHist,
+    RooFit, RooRealVar, RooSimultaneous, TH2D, TMinuit, TRandom3
 )
 
+from lib.io import hist_array
+from plugins.fitresult import make_fit_result
+
 ic = [('1','X'),('1','Y'),('2','X'),('2','Y')]
 
 def fit(model, hists, fitmethod, eps=1.0e-7):
@@ -28,13 +37,8 @@ def fit(model, hists, fitmethod, eps=1.0e-7):
     RooAbsReal.defaultIntegratorConfig().setEpsAbs(eps)
     RooAbsReal.defaultIntegratorConfig().setEpsRel(eps)
     modfuncs = model.model_functions()
+    datahist = make_datahist(model, hists)
 
-    datahist = [RooDataHist(
-        'scan{0}Beam{1}RestDataHist'.format(c, i),
-        'scan{0}Beam{1}RestDataHist'.format(c, i),
-        RooArgList(model.xvar(), model.yvar()),
-        hists[j]
-    ) for j, (i,c) in enumerate(ic)]
     sample = RooCategory('sample', 'sample')
     for (i,c) in ic:
         sample.defineType('{0}_ScanData_Beam{1}Rest'.format(c, i))
@@ -54,6 +58,174 @@ def fit(model, hists, fitmethod, eps=1.0e-7):
     result = fitmethod(simpdf, combdata)
     return result, modfuncs, datahist
 
+def fit_numpy(
+    model, hists, fitmethod='nll', eps=1.0e-7, integrals=False, points=3
+):
+    """Fit beam shapes to Beam Imaging data with a vectorized model.
+
+    model: Beam shape model (derived from BeamShapeCore).
+    hists: List of four TH2F with BI data.
+    fitmethod: 'nll' (binned likelihood, as RooAbsPdf.fitTo) or 'chisq'
+               (chi-square with asymmetric errors, as MyRooChi2Var).
+    eps: Precision of the numerical integrator used by the returned model
+         functions. It does not affect the minimization, which always uses
+         the default MIGRAD tolerance.
+    integrals: Set true to use bin integrals instead of bin centers.
+    points: Number of nodes per axis and bin for bin integrals.
+    The model (see BeamShapeCore.vectorized_model) is evaluated with NumPy on
+    all four histograms at once and minimized with TMinuit (MIGRAD and HESSE).
+    Returns the same as fit; the fit result is a RooFitResult.
+    """
+    if fitmethod not in ('nll', 'chisq'):
+        msg = 'fit_numpy: Unknown fit method! ({0})'.format(fitmethod)
+        raise ValueError(msg)
+    RooAbsReal.defaultIntegratorConfig().setEpsAbs(eps)
+    RooAbsReal.defaultIntegratorConfig().setEpsRel(eps)
+
+    xaxis, yaxis = hists[0].GetXaxis(), hists[0].GetYaxis()
+    xedges = fromiter((
+        xaxis.GetBinLowEdge(i) for i in range(1, xaxis.GetNbins()+2)
+    ), dtype=float64)
+    yedges = fromiter((
+        yaxis.GetBinLowEdge(i) for i in range(1, yaxis.GetNbins()+2)
+    ), dtype=float64)
+    area = (yedges[1:]-yedges[:-1])[:, None]*(xedges[1:]-xedges[:-1])[None, :]
+    counts, masks, errors = [], [], []
+    for hist in hists:
+        count = hist_array(hist)[1:-1, 1:-1].astype(float64)
+        mask = count > 0.0
+        counts.append(count)
+        masks.append(mask)
+        if fitmethod == 'chisq':
+            errlo, errup = count.copy(), count.copy()
+            for ybin, xbin in zip(*mask.nonzero()):
+                errlo[ybin, xbin] = hist.GetBinErrorLow(xbin+1, ybin+1)
+                errup[ybin, xbin] = hist.GetBinErrorUp(xbin+1, ybin+1)
+            errors.append((errlo[mask], errup[mask]))
+
+    def objective():
+        probs = model.vectorized_model(xedges, yedges, integrals, points)
+        value = 0.0
+        for j, prob in enumerate(probs):
+            mask = masks[j]
+            if fitmethod == 'nll':
+                density = maximum(prob[mask]/area[mask], 1.0e-300)
+                value -= (counts[j][mask]*log(density)).sum()
+            else:
+                data = counts[j][mask]
+                expected = prob[mask]*counts[j].sum()
+                errlo, errup = errors[j]
+                error = where(expected < data, errlo, errup)
+                value += (((data-expected)/error)**2).sum()
+        return value
+
+    free = [
+        p for p in model.parameters()
+        if not p.is_formula() and not p.isConstant()
+    ]
+    const = [
+        p for p in model.parameters() if not p.is_formula() and p.isConstant()
+    ]
+    def snapshot(pars):
+        result = []
+        for par in pars:
+            var = RooRealVar(
+                par.GetName(), par.GetName(), par.getVal(), par.getMin(),
+                par.getMax()
+            )
+            var.setError(par.getError())
+            var.setConstant(par.isConstant())
+            result.append(var)
+        return result
+    constpars, initpars = snapshot(const), snapshot(free)
+
+    def fcn(npar, gin, f, par, iflag):
+        for i, p in enumerate(free):
+            p.setVal(par[i])
+        f[0] = objective()
+    minuit = TMinuit(len(free))
+    minuit.SetPrintLevel(1)
+    minuit.SetFCN(fcn)
+    minuit.SetErrorDef({'nll': 0.5, 'chisq': 1.0}[fitmethod])
+    for i, par in enumerate(free):
+        if par.getError() > 0.0:
+            step = par.getError()
+        else:
+            step = 0.1*(par.getMax()-par.getMin())
+        minuit.DefineParameter(
+            i, par.GetName(), par.getVal(), step, par.getMin(), par.getMax()
+        )
+    ierflg = Long(0)
+    minuit.mnexcm('MIGRAD', array('d', [5000.0, 1.0]), 2, ierflg)
+    status = int(ierflg)
+    minuit.mnexcm('HESSE', array('d', [5000.0]), 1, ierflg)
+
+    for i, par in enumerate(free):
+        value, error = Double(0.0), Double(0.0)
+        minuit.GetParameter(i, value, error)
+        par.setVal(value)
+        par.setError(error)
+    fmin, fedm, errdef = Double(0.0), Double(0.0), Double(0.0)
+    npari, nparx, istat = Long(0), Long(0), Long(0)
+    minuit.mnstat(fmin, fedm, errdef, npari, nparx, istat)
+    emat = array('d', [0.0]*len(free)**2)
+    minuit.mnemat(emat, len(free))
+    covariance = [
+        emat[i*len(free):(i+1)*len(free)] for i in range(len(free))
+    ]
+    result = make_fit_result(
+        constpars, initpars, snapshot(free), float(fmin), float(fedm), status,
+        int(istat), covariance
+    )
+    return result, model.model_functions(), make_datahist(model, hists)
+
+def fit_multires(
+    model, hists, fitmethod, nbins=(95, 190), eps=1.0e-7, coarseeps=1.0e-5,
+    fitter=fit
+):
+    """Fit beam shapes to Beam Imaging data from coarse to fine binning.
+
+    model: Beam shape model (derived from BeamShapeCore).
+    hists: List of four TH2F with BI data.
+    fitmethod: Function(pdf, data) that fits pdf to data.
+    nbins: Numbers of bins of the coarse stages, in increasing order.
+    eps: Value of convergence criteria of the final stage.
+    coarseeps: Value of convergence criteria of the coarse stages.
+    fitter: Fit function (fit or fit_numpy) used for all stages.
+    Coarse histograms are obtained by merging bins, binnings that are not an
+    integer fraction of the original one are skipped. Each stage starts from
+    the parameter values of the previous one, whose uncertainties serve as
+    step sizes. The final stage fits the original histograms, its result is
+    returned in the same way as by fit.
+    """
+    for n in nbins:
+        groups = [(h.GetNbinsX() / n, h.GetNbinsY() / n) for h in hists]
+        if any(
+            gx < 2 or gy < 2 or gx*n != h.GetNbinsX() or gy*n != h.GetNbinsY()
+            for (gx, gy), h in zip(groups, hists)
+        ):
+            continue
+        print '<<< Fit with {0} bins'.format(n)
+        coarse = [hist.Rebin2D(
+            gx, gy, '{0}_{1}bins'.format(hist.GetName(), n)
+        ) for (gx, gy), hist in zip(groups, hists)]
+        fitter(model, coarse, fitmethod, eps=coarseeps)
+    return fitter(model, hists, fitmethod, eps=eps)
+
+def make_datahist(model, hists):
+    """Convert the four BI histograms to RooDataHist objects.
+
+    model: Beam shape model (derived from BeamShapeCore).
+    hists: List of four TH2F with BI data.
+    """
+    datahist = [RooDataHist(
+        'scan{0}Beam{1}RestDataHist'.format(c, i),
+        'scan{0}Beam{1}RestDataHist'.format(c, i),
+        RooArgList(model.xvar(), model.yvar()),
+        hists[j]
+    ) for j, (i,c) in enumerate(ic)]
+    return datahist
+
 def model_hist(xvar, yvar, modfuncs, nbins=95, crange=(-10.0, 10.0)):
     """Construct histogram of model functions, based on bin integrals.
 
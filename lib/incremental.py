@@ -0,0 +1,224 @@
+"""Provides incremental accumulation of Beam Imaging histograms.
+
+HistogramAccumulator: Fold raw files into persistent histogram sums.
+"""
+
+from array import array
+from json import dumps, loads
+from os import getpid, rename, stat
+from os.path import exists
+
+from ROOT import gROOT, TH1F, TH2D, TH2F
+
+from lib.io import BareRootFile, hist_array, NamedString
+from lib.prepare import (
+    binnings, draw_ranges, make_trees, read_step_index, step_ranges
+)
+
+scans = ('1X', '1Y', '2X', '2Y')
+
+class HistogramAccumulator:
+    """Fold raw files into persistent per-scan and per-BCID histogram sums.
+
+    __init__: Initialize and load state from disk.
+    processed: Return whether a raw file was already folded in.
+    add_file: Fold a raw file into the sums.
+    save: Write state to disk.
+    histograms: Return BI and error histograms of the accumulated data.
+
+    The state consists of the vertex positions in master binning (relative to
+    a reference offset fixed by the first file with data), the sums of vertex
+    positions to determine the offset, the vertex error histograms and the
+    list of processed files. It is written to a single ROOT file, so that it
+    is consistent with the list of processed files at any time.
+    """
+
+    def __init__(self, filename, times, bcids, mintrk, scaling, crange):
+        """Initialize and load state from disk (if existing).
+
+        filename: Name of ROOT file with the state.
+        times: Dictionary of scans with lists of 2-tuples (begin & end
+               timestamp of scan steps).
+        bcids: List of bunch crossings (int).
+        mintrk: Minimal number of tracks (int) for the vertex selection.
+        scaling: Float by which the coordinates are rescaled.
+        crange: 2-tuple of limits of the coordinates.
+        """
+        self.filename = filename
+        self.times = times
+        self.bcids = bcids
+        self.mintrk = mintrk
+        self.scaling = scaling
+        self.crange = crange
+        self.nbins = binnings['master']
+        self.width = (crange[1]-crange[0])/self.nbins
+        # Margin of 20% of the range for shifts of the offset, the first files
+        # might only cover part of a scan
+        self.pad = int(0.2*self.nbins)
+        self.state = {
+            'mintrk': mintrk, 'scaling': scaling, 'files': {}, 'offsets': {}
+        }
+        self.sums = {}
+        gROOT.cd()
+        self.xerror = TH1F('acc_xerror', '', 100, 0.0, 0.03)
+        self.yerror = TH1F('acc_yerror', '', 100, 0.0, 0.03)
+        self.stats = TH2D('acc_stats', '', 1, -1.0e6, 1.0e6, 1, -1.0e6, 1.0e6)
+        if exists(filename):
+            with BareRootFile(filename) as f:
+                self.state = loads(f.get_val('state'))
+                for key in self.state['offsets']:
+                    self.sums[str(key)] = f.get(str(key))
+                self.xerror = f.get('acc_xerror')
+                self.yerror = f.get('acc_yerror')
+            # TTree::Draw fills histograms found in the current directory
+            for hist in self.sums.values() + [self.xerror, self.yerror]:
+                hist.SetDirectory(gROOT)
+            if (
+                self.state['mintrk'] != mintrk
+                or self.state['scaling'] != scaling
+            ):
+                msg = 'HistogramAccumulator: State {0} was created with ' \
+                      'other selection!'.format(filename)
+                raise ValueError(msg)
+
+    @staticmethod
+    def _file_id(filename):
+        info = stat(filename)
+        return [info.st_size, int(info.st_mtime)]
+
+    def processed(self, filename):
+        """Return whether a raw file was already folded in.
+
+        Files that changed since are reported, but not processed again.
+        """
+        if filename not in self.state['files']:
+            return False
+        if self.state['files'][filename] != self._file_id(filename):
+            print '<<< Warning: {0} changed after it was processed' \
+                  .format(filename)
+        return True
+
+    def _new_sum(self, key):
+        lo = self.crange[0]-self.pad*self.width
+        hi = self.crange[1]+self.pad*self.width
+        gROOT.cd()
+        return TH2F(
+            key, key, self.nbins+2*self.pad, lo, hi,
+            self.nbins+2*self.pad, lo, hi
+        )
+
+    def add_file(self, filename, qualities=None):
+        """Fold a raw file into the sums (in one pass over the file)."""
+        alltimes = []
+        first = {}
+        for scan in scans:
+            first[scan] = (len(alltimes), len(self.times[scan]))
+            alltimes += self.times[scan]
+        trees = make_trees(
+            [filename], alltimes, self.bcids, self.mintrk, verbose=False,
+            qualities=qualities
+        )
+        gROOT.cd()
+        condition = 'vtx_nTrk>={0}'.format(self.mintrk)
+        values = array('d', [0.0]*7)
+        for bcid, tree in trees.iteritems():
+            index = read_step_index(tree)
+            for scan in scans:
+                ranges = step_ranges(
+                    index, range(first[scan][0], sum(first[scan]))
+                )
+                if not ranges:
+                    continue
+                key = 'hist_Beam{0}Move{1}_bunch{2}Add' \
+                      .format(scan[0], scan[1], bcid)
+                self.stats.Reset()
+                draw_ranges(
+                    tree, 'vtx_y/{0}:vtx_x/{0}'.format(self.scaling),
+                    'acc_stats', condition, ranges
+                )
+                self.stats.GetStats(values)
+                if values[0] == 0.0:
+                    continue
+                if key not in self.state['offsets']:
+                    self.state['offsets'][key] = {
+                        'reference': [
+                            round(values[2]/values[0], 2),
+                            round(values[4]/values[0], 2)
+                        ],
+                        'sum': [0.0, 0.0], 'n': 0.0
+                    }
+                    self.sums[key] = self._new_sum(key)
+                offset = self.state['offsets'][key]
+                offset['sum'][0] += values[2]
+                offset['sum'][1] += values[4]
+                offset['n'] += values[0]
+                draw_ranges(
+                    tree, 'vtx_y/{0}-{1}:vtx_x/{0}-{2}'.format(
+                        self.scaling, offset['reference'][1],
+                        offset['reference'][0]
+                    ), key, condition, ranges
+                )
+                draw_ranges(
+                    tree, 'vtx_xError', 'acc_xerror', condition, ranges
+                )
+                draw_ranges(
+                    tree, 'vtx_yError', 'acc_yerror', condition, ranges
+                )
+        self.state['files'][filename] = self._file_id(filename)
+
+    def save(self):
+        """Write state to disk (replacing the previous one atomically)."""
+        tmpname = '{0}.{1}.tmp'.format(self.filename, getpid())
+        with BareRootFile(tmpname, 'RECREATE') as f:
+            for hist in self.sums.itervalues():
+                hist.Write()
+            self.xerror.Write()
+            self.yerror.Write()
+            NamedString('state', dumps(self.state)).Write()
+        rename(tmpname, self.filename)
+
+    def histograms(self, nbins):
+        """Return BI and error histograms of the accumulated data.
+
+        nbins: Number of bins in each dimension (must divide master binning).
+        returns list of TH2F (named as by make_histograms) and TH1F xerror and
+        yerror.
+        The histograms are centered on the offset of all data so far, up to a
+        shift by less than half a bin of the master binning.
+        """
+        hists = []
+        group = self.nbins/nbins
+        if group*nbins != self.nbins:
+            msg = 'HistogramAccumulator: {0} bins are not a fraction of {1} ' \
+                  'bins!'.format(nbins, self.nbins)
+            raise ValueError(msg)
+        for key in sorted(self.sums):
+            offset = self.state['offsets'][key]
+            shift = []
+            for c in range(2):
+                value = round(offset['sum'][c]/offset['n'], 2)
+                bins = int(round((value-offset['reference'][c])/self.width))
+                if abs(bins) > self.pad:
+                    print '<<< Warning: Offset of {0} out of margin'.format(key)
+                    bins = max(-self.pad, min(self.pad, bins))
+                shift.append(bins)
+            hist = TH2F(
+                '{0}_new'.format(key), key, nbins, self.crange[0],
+                self.crange[1], nbins, self.crange[0], self.crange[1]
+            )
+            hist.SetDirectory(0)
+            hist.SetName(key)
+            source = hist_array(self.sums[key])
+            xlo = 1+self.pad+shift[0]
+            ylo = 1+self.pad+shift[1]
+            window = source[ylo:ylo+self.nbins, xlo:xlo+self.nbins]
+            hist_array(hist)[1:-1, 1:-1] = window.reshape(
+                nbins, group, nbins, group
+            ).sum(axis=(1, 3))
+            hist.SetEntries(window.sum())
+            hists.append(hist)
+        xerror = self.xerror.Clone('xerror')
+        yerror = self.yerror.Clone('yerror')
+        xerror.SetDirectory(0)
+        yerror.SetDirectory(0)
+        return hists, xerror, yerror
@@ -8,6 +8,9 @@ NamedString: Create and write a string value.
 NamedFloat: Create and write a float value.
 Timestamp: Create and write a timestamp.
 copy_directory: Writes all objects in directory to new directory.
+hist_array: Return NumPy view of histogram bin contents.
+shard_name: Return name of per-BCID shard of a BI histogram file.
+load_bi_hists: Load BI histograms of several BCIDs.
 """
 
 from array import array
@@ -17,6 +20,8 @@ from os.path import exists
 from re import IGNORECASE, match
 from time import strftime, sleep
 
+from numpy import float32, float64, frombuffer, int32
+
 from ROOT import gROOT, TChain, TDirectory, TFile, TNamed, TParameter, TTree
 
 if not exists('results'):
@@ -321,3 +326,68 @@ def copy_directory(newdir, olddir, condition=None):
             newdir.cd()
             obj.Write(key.GetName())
             del obj
+
+def hist_array(hist):
+    """Return a NumPy view of the bin contents of a 2D histogram.
+
+    hist: TH2F, TH2D or TH2I.
+    The array includes under- and overflow bins, is indexed as [ybin, xbin]
+    and shares its memory with the histogram.
+    """
+    nx, ny = hist.GetNbinsX()+2, hist.GetNbinsY()+2
+    try:
+        dtype = {'F': float32, 'D': float64, 'I': int32}[hist.ClassName()[-1]]
+    except KeyError:
+        msg = 'hist_array: Unsupported histogram class {0}!' \
+              .format(hist.ClassName())
+        raise TypeError(msg)
+    buf = hist.GetArray()
+    buf.SetSize(nx*ny)
+    return frombuffer(buf, dtype=dtype, count=nx*ny).reshape(ny, nx)
+
+def shard_name(datafile, bcid):
+    """Return name of the per-BCID shard of a BI histogram file.
+
+    The shards of <name>.root are <name>/bcid<bcid>.root, they contain the
+    four BI histograms of one BCID.
+    """
+    return '{0}/bcid{1}.root'.format(datafile[:-5], bcid)
+
+def load_bi_hists(datafile, bcids, arrays=False):
+    """Load the four BI histograms of several BCIDs.
+
+    datafile: Name of ROOT file with BI histograms.
+    bcids: List of BCIDs.
+    arrays: Set true to also return NumPy views of the bin contents.
+    Returns dict of lists of four TH2F (beam 1 at rest in X and Y scan, beam
+    2 at rest in X and Y scan) keyed by BCID. With arrays, the lists contain
+    2-tuples of TH2F and its view (as returned by hist_array).
+    The histograms of a BCID are read from its shard (see shard_name) if it
+    exists, otherwise all BCIDs are read from datafile in one pass.
+    """
+    histnames = [
+        'hist_Beam2MoveX_bunch{0}Add', 'hist_Beam2MoveY_bunch{0}Add',
+        'hist_Beam1MoveX_bunch{0}Add', 'hist_Beam1MoveY_bunch{0}Add'
+    ]
+    def read(f, bcid):
+        hists = []
+        for histname in histnames:
+            hist = f.get(histname.format(bcid))
+            if arrays:
+                hists.append((hist, hist_array(hist)))
+            else:
+                hists.append(hist)
+        return hists
+    result = {}
+    remaining = []
+    for bcid in bcids:
+        if exists(shard_name(datafile, bcid)):
+            with BareRootFile(shard_name(datafile, bcid)) as f:
+                result[bcid] = read(f, bcid)
+        else:
+            remaining.append(bcid)
+    if remaining:
+        with BareRootFile(datafile) as f:
+            for bcid in remaining:
+                result[bcid] = read(f, bcid)
+    return result
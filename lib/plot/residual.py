@@ -5,13 +5,47 @@ RadialResidualPlot: Plot residuals projected to radial axis.
 AngularResidualPlot: Plot residuals projected to angular axis.
 """
 
-from math import atan, pi
+from math import pi
+
+from numpy import (
+    arctan, array, errstate, float64, ones_like, sqrt, unique, where
+)
 
 from ROOT import TF1, TLatex, TPad, TProfile
 from ROOT.TH1 import kPoisson
 
+from lib.io import hist_array
 from lib.plot.plot import ColorBase, PlotBase, SingleHistBase
 
+def _bin_centers(axis):
+    """Return NumPy array of the bin centers of an axis."""
+    return array([
+        axis.GetBinCenter(i+1) for i in range(axis.GetNbins())
+    ], dtype=float64)
+
+def _pulls(data, model, skipzero=False):
+    """Return coordinates and pulls of all bins as flat NumPy arrays.
+
+    The asymmetric Poisson errors of the data are evaluated by ROOT once per
+    distinct bin content.
+    """
+    data.SetBinErrorOption(kPoisson)
+    d = hist_array(data)[1:-1, 1:-1].astype(float64)
+    m = hist_array(model)[1:-1, 1:-1].astype(float64)
+    nx = data.GetXaxis().GetNbins()
+    values, first, inverse = unique(d, return_index=True, return_inverse=True)
+    low, up = [], []
+    for index in first:
+        ybin, xbin = divmod(int(index), nx)
+        low.append(data.GetBinErrorLow(xbin+1, ybin+1))
+        up.append(data.GetBinErrorUp(xbin+1, ybin+1))
+    inverse = inverse.reshape(d.shape)
+    e = where(m < d, array(low)[inverse], array(up)[inverse])
+    x = _bin_centers(data.GetXaxis())[None, :].repeat(d.shape[0], axis=0)
+    y = _bin_centers(data.GetYaxis())[:, None].repeat(d.shape[1], axis=1)
+    mask = (d != 0.0) if skipzero else ones_like(d, dtype=bool)
+    return x[mask], y[mask], (d-m)[mask]/e[mask]
+
 class ResidualPlot(ColorBase):
     """Plot two-dimensional residuals.
 
@@ -25,12 +59,10 @@ class ResidualPlot(ColorBase):
         self._ytitle = 'y [cm]'
         self._ztitle = 'Pulls'
         self.zrange(-5.0, 5.0)
-        for xbin in range(self.xaxis().GetNbins()+2):
-            for ybin in range(self.yaxis().GetNbins()+2):
-                if self.get_bin(xbin, ybin) < -4.9999:
-                    self.set_bin(-4.9999, xbin, ybin)
-                if self.get_bin(xbin, ybin) == 0.0:
-                    self.set_bin(-10.0, xbin, ybin)
+        # Clamp pulls below the range and hide empty bins (in place)
+        pulls = hist_array(self._graph)
+        pulls[pulls < -4.9999] = -4.9999
+        pulls[pulls == 0.0] = -10.0
 
 class RadialResidualPlot(SingleHistBase):
     """Plot residuals projected to one radial dimension.
@@ -55,28 +87,19 @@ class RadialResidualPlot(SingleHistBase):
     def create_residual(
         data, model, nbins=None, maxr=None, calcr=None, skipzero=False
     ):
-        """Create radial residual histogram."""
+        """Create radial residual histogram.
+
+        calcr: Function of the x and y coordinates (NumPy arrays).
+        """
         if nbins is None:
             nbins = data.GetXaxis().GetNbins()
         if maxr is None:
             maxr = data.GetXaxis().GetXmax()
         if calcr is None:
-            calcr = lambda x, y: (x**2+y**2)**0.5
-        data.SetBinErrorOption(kPoisson)
+            calcr = lambda x, y: sqrt(x**2+y**2)
+        x, y, pulls = _pulls(data, model, skipzero=skipzero)
         res = TProfile('radialRes', '', nbins, 0.0, maxr)
-        for xbin in range(data.GetXaxis().GetNbins()):
-            for ybin in range(data.GetYaxis().GetNbins()):
-                d = data.GetBinContent(xbin+1, ybin+1)
-                if skipzero and d == 0.0:
-                    continue
-                m = model.GetBinContent(xbin+1, ybin+1)
-                if m < d:
-                    e = data.GetBinErrorLow(xbin+1, ybin+1)
-                else:
-                    e = data.GetBinErrorUp(xbin+1, ybin+1)
-                x = data.GetXaxis().GetBinCenter(xbin+1)
-                y = data.GetYaxis().GetBinCenter(ybin+1)
-                res.Fill(calcr(x, y), (d-m)/e)
+        res.FillN(len(pulls), calcr(x, y), pulls, ones_like(pulls))
         return res
 
     def chisq(self):
@@ -107,26 +130,19 @@ class AngularResidualPlot(SingleHistBase):
 
     @staticmethod
     def create_residual(data, model, nbins=None, calcphi=None, skipzero=False):
-        """Create angular residual histogram."""
+        """Create angular residual histogram.
+
+        calcphi: Function of the x and y coordinates (NumPy arrays).
+        """
         if nbins is None:
             nbins = data.GetXaxis().GetNbins()
         if calcphi is None:
-            calcphi = lambda x, y: atan(x/y)
-        data.SetBinErrorOption(kPoisson)
+            calcphi = lambda x, y: arctan(x/y)
+        x, y, pulls = _pulls(data, model, skipzero=skipzero)
         res = TProfile('angularRes', '', nbins, -0.5*pi, 0.5*pi)
-        for xbin in range(data.GetXaxis().GetNbins()):
-            for ybin in range(data.GetYaxis().GetNbins()):
-                d = data.GetBinContent(xbin+1, ybin+1)
-                if skipzero and d == 0.0:
-                    continue
-                m = model.GetBinContent(xbin+1, ybin+1)
-                if m < d:
-                    e = data.GetBinErrorLow(xbin+1, ybin+1)
-                else:
-                    e = data.GetBinErrorUp(xbin+1, ybin+1)
-                x = data.GetXaxis().GetBinCenter(xbin+1)
-                y = data.GetYaxis().GetBinCenter(ybin+1)
-                res.Fill(calcphi(x, y), (d-m)/e)
+        with errstate(divide='ignore'):
+            phi = calcphi(x, y)
+        res.FillN(len(pulls), phi, pulls, ones_like(pulls))
         return res
 
     def chisq(self):
@@ -1,16 +1,37 @@
 """Provides function for preparation of Beam Imaging data.
 
+binnings: Numbers of bins of the standard binnings.
 make_filelist: Scan raw files for needed data.
 make_trees: Create Beam Imaging trees from raw data.
+write_tree: Write created tree with a storage profile.
+read_step_index: Read scan step index of created trees.
+step_ranges: Return entry ranges of scan steps.
 make_histograms: Create Beam Imaging histograms from created trees.
+make_vdmhistos: Create Beam Imaging histograms from VdM scan trees.
+rebin_histograms: Derive histograms with coarser binning.
+quicklook_name: Return name of quick-look histograms.
 """
 
+from json import dumps, loads
 from os import listdir, stat
 from os.path import exists
 
-from ROOT import gDirectory, TFile, TH1F, TH2F
+from ROOT import gDirectory, gROOT, SetOwnership, TFile, TH1F, TH2F
 
-from lib.io import RootChain, RootTree
+from lib.io import NamedString, RootChain, RootTree
+
+# 'master' is only used to derive the other binnings by merging bins
+binnings = {'master': 1520, 'many': 760, 'some': 190, 'few': 95}
+
+# Storage profiles of created trees (see make_trees and write_tree)
+# compact: Integer vtx_nTrk, no error branches without resolutions
+# compression: ROOT compression setting (100*algorithm+level), None for the
+#              default of the file; 404 is LZ4 at level 4, which favours fast
+#              decompression over size
+storage_profiles = {
+    'default': {'compact': False, 'compression': None},
+    'compact': {'compact': True, 'compression': 404},
+}
 
 def make_filelist(
     directories, times, treename='lumi/tree', timestamp='timeStamp_begin',
@@ -51,7 +72,7 @@ def make_filelist(
 
 def make_trees(
     filelist, times, bcids, mintrk=0, verbose=True, noerror=False,
-    qualities=None
+    qualities=None, compact=False
 ):
     """Run over raw data and collect Beam Imaging data in trees.
 
@@ -62,7 +83,12 @@ def make_trees(
     verbose: Set true to print progress to stdout.
     noerror: Set true to not compute resolutions.
     qualities: tuple of boolean fields that are required.
+    compact: Set true to store vtx_nTrk as integer and to omit vtx_xError and
+             vtx_yError if noerror is set.
     returns list of ROOT trees.
+    The vertices are sorted by scan step. The first entry of each scan step
+    (and the total number of entries) are stored as JSON list in the user info
+    of the trees (scanstepIndex), see read_step_index.
     """
     chain = RootChain('lumi/tree')
     chain.add_files(filelist)
@@ -84,15 +110,21 @@ def make_trees(
         qualities = ('vtx_isGood', '!vtx_isFake')
     for quality in qualities:
         chain.add_fields([(quality if quality[0]!='!' else quality[1:], 'b', 200),])
-    trees = {b: RootTree('bunch{0}Add'.format(b)) for b in bcids}
-    for tree in trees.itervalues():
+    def new_tree(bcid):
+        tree = RootTree('bunch{0}Add'.format(bcid))
         tree.branch_f('vtx_x')
         tree.branch_f('vtx_y')
-        tree.branch_f('vtx_xError')
-        tree.branch_f('vtx_yError')
-        tree.branch_f('vtx_nTrk')
+        if not compact or not noerror:
+            tree.branch_f('vtx_xError')
+            tree.branch_f('vtx_yError')
+        if compact:
+            tree.branch_i('vtx_nTrk')
+        else:
+            tree.branch_f('vtx_nTrk')
         tree.branch_i('scanstep')
         tree.branch_i('timestamp')
+        return tree
+    steptrees = {b: [new_tree(b) for step in times] for b in bcids}
     for event in chain.events(verbose):
         if event['nVtx'] <= 0:
             continue
@@ -110,8 +142,9 @@ def make_trees(
             break
         else:
             continue
-        trees[bcid].set('scanstep', scanstep)
-        trees[bcid].set('timestamp', event['timeStamp_begin'])
+        tree = steptrees[bcid][scanstep]
+        tree.set('scanstep', scanstep)
+        tree.set('timestamp', event['timeStamp_begin'])
         for vtx in range(event['nVtx']):
             for quality in qualities:
                 if quality[0]!='!':
@@ -122,16 +155,137 @@ def make_trees(
                         continue
             if event['vtx_nTrk'][vtx] < mintrk:
                 continue
-            trees[bcid].set('vtx_x', event['vtx_x'][vtx])
-            trees[bcid].set('vtx_y', event['vtx_y'][vtx])
-            trees[bcid].set('vtx_xError', 0.0 if noerror else event['vtx_xError'][vtx])
-            trees[bcid].set('vtx_yError', 0.0 if noerror else event['vtx_yError'][vtx])
-            trees[bcid].set('vtx_nTrk', event['vtx_nTrk'][vtx])
-            trees[bcid].Fill()
+            tree.set('vtx_x', event['vtx_x'][vtx])
+            tree.set('vtx_y', event['vtx_y'][vtx])
+            if not noerror:
+                tree.set('vtx_xError', event['vtx_xError'][vtx])
+                tree.set('vtx_yError', event['vtx_yError'][vtx])
+            elif not compact:
+                tree.set('vtx_xError', 0.0)
+                tree.set('vtx_yError', 0.0)
+            tree.set('vtx_nTrk', event['vtx_nTrk'][vtx])
+            tree.Fill()
+    trees = {}
+    for bcid, parts in steptrees.iteritems():
+        # Append the steps to the tree of the first step one by one and free
+        # each of them right away, so that the vertices are not held twice
+        tree = parts[0]
+        index = [0, tree.GetEntries()]
+        for i in range(1, len(parts)):
+            part = parts[i]
+            parts[i] = None
+            index.append(index[-1]+part.GetEntries())
+            tree.CopyAddresses(part)
+            tree.CopyEntries(part)
+            part.ResetBranchAddresses()
+            del part
+        tree.GetUserInfo().Add(NamedString('scanstepIndex', dumps(index)))
+        trees[bcid] = tree
     return trees
 
+def write_tree(tree, name, compression=None):
+    """Write tree created by make_trees to the current directory.
+
+    tree: ROOT tree (as returned by make_trees).
+    name: Name of the written tree.
+    compression: ROOT compression setting (100*algorithm+level) of the
+                 branches. If specified, the tree is copied scan step by scan
+                 step and each scan step starts a new cluster of baskets, so
+                 that reading a scan step does not decompress its neighbours.
+                 Otherwise, the tree is written as it is.
+    """
+    if compression is None:
+        tree.SetName(name)
+        tree.Write(name)
+        return
+    index = loads(tree.GetUserInfo().FindObject('scanstepIndex').GetTitle())
+    tree.SetName(name)
+    copy = tree.CloneTree(0)
+    for branch in copy.GetListOfBranches():
+        branch.SetCompressionSettings(compression)
+    copy.SetAutoFlush(0)
+    directory = copy.GetDirectory()
+    # The entries of each step are copied in C++ via a temporary tree in
+    # memory, which CopyEntries appends to the copy
+    gROOT.cd()
+    for step in range(len(index)-1):
+        nentries = index[step+1]-index[step]
+        if nentries == 0:
+            continue
+        part = tree.CopyTree('', '', nentries, index[step])
+        SetOwnership(part, True)
+        copy.CopyEntries(part)
+        del part
+        copy.FlushBaskets()
+    directory.cd()
+    if not copy.GetUserInfo().FindObject('scanstepIndex'):
+        copy.GetUserInfo().Add(NamedString('scanstepIndex', dumps(index)))
+    copy.Write(name)
+
+def read_step_index(tree):
+    """Read the scan step index of trees created by make_trees.
+
+    tree: TTree or TChain.
+    returns list of 2-tuples (first entry of tree in chain, list of first
+    entries of scan steps), or None if one of the trees has no index.
+    """
+    if not tree.InheritsFrom('TChain'):
+        index = tree.GetUserInfo().FindObject('scanstepIndex')
+        if not index:
+            return None
+        return [(0, loads(index.GetTitle()))]
+    result = []
+    offset = 0
+    for element in tree.GetListOfFiles():
+        f = TFile.Open(element.GetTitle())
+        if not f:
+            return None
+        part = f.Get(element.GetName())
+        index = part.GetUserInfo().FindObject('scanstepIndex') \
+                if part else None
+        if not index:
+            f.Close()
+            return None
+        result.append((offset, loads(index.GetTitle())))
+        offset += part.GetEntries()
+        f.Close()
+    return result
+
+def step_ranges(index, steps):
+    """Return entry ranges of the given scan steps.
+
+    index: Scan step index (from read_step_index).
+    steps: List of scan steps (int).
+    returns list of 2-tuples (first entry, number of entries), adjacent
+    ranges are merged.
+    """
+    ranges = []
+    for offset, first in index:
+        for step in sorted(set(steps)):
+            if step < 0 or step+1 >= len(first):
+                continue
+            begin, end = offset+first[step], offset+first[step+1]
+            if begin == end:
+                continue
+            if ranges and sum(ranges[-1]) == begin:
+                ranges[-1] = (ranges[-1][0], ranges[-1][1]+end-begin)
+            else:
+                ranges.append((begin, end-begin))
+    return ranges
+
+def draw_ranges(tree, varexp, histname, selection, ranges):
+    """Fill existing histogram from entry ranges of a tree."""
+    n = 0
+    for first, nentries in ranges:
+        n += tree.Draw(
+            '{0}>>+{1}'.format(varexp, histname), selection, 'goff', nentries,
+            first
+        )
+    return n
+
 def make_histograms(
-    trees, nbins, mintrk, scaling=1.0, verbose=False, extracond=None
+    trees, nbins, mintrk, scaling=1.0, verbose=False, extracond=None,
+    steps=None
 ):
     """Run over created trees and select Beam Imaging data for histograms.
 
@@ -140,6 +294,8 @@ def make_histograms(
     mintrk: Minimal number of tracks (int) for the event selection.
     scaling: Float by which the histograms are rescaled (x=xraw/scaling).
     extracond: Additional condition to be applied to selected data.
+    steps: List of scan steps to be used (default: all). Only their entry
+           ranges are read if the trees have a scan step index.
     returns dictionary with histograms.
     """
     if extracond is None:
@@ -150,20 +306,39 @@ def make_histograms(
     for i, tree in enumerate(trees.itervalues()):
         name = 'hist_{0}'.format(tree.GetName())
         condition = 'vtx_nTrk>={0}{1}'.format(mintrk, extracond)
+        index = None if steps is None else read_step_index(tree)
+        if steps is not None and index is None:
+            condition = '{0} && ({1})'.format(condition, ' || '.join(
+                'scanstep=={0}'.format(step) for step in steps
+            ))
 
-        draw1 = 'vtx_y/{0}:vtx_x/{0}>>hnew{1}'.format(scaling, i)
-        n = tree.Draw(draw1, condition, 'goff')
-        hist1 = gDirectory.Get('hnew{0}'.format(i))
+        if index is None:
+            draw1 = 'vtx_y/{0}:vtx_x/{0}>>hnew{1}'.format(scaling, i)
+            n = tree.Draw(draw1, condition, 'goff')
+            hist1 = gDirectory.Get('hnew{0}'.format(i))
+        else:
+            ranges = step_ranges(index, steps)
+            # One wide bin: the mean is computed from the exact values
+            hist1 = TH2F(
+                'hnew{0}'.format(i), '', 1, -1.0e6, 1.0e6, 1, -1.0e6, 1.0e6
+            )
+            draw1 = 'vtx_y/{0}:vtx_x/{0}'.format(scaling)
+            n = draw_ranges(
+                tree, draw1, 'hnew{0}'.format(i), condition, ranges
+            )
 
         offx = round(hist1.GetMean(1), 2)
         offy = round(hist1.GetMean(2), 2)
         if verbose:
             print '<<< {0} entries with offset {1}, {2}'.format(n, offx, offy)
 
-        draw2 = 'vtx_y/{0}-{1}:vtx_x/{0}-{2}>>{3}' \
-                .format(scaling, offy, offx, name)
+        draw2 = 'vtx_y/{0}-{1}:vtx_x/{0}-{2}' \
+                .format(scaling, offy, offx)
         hist2 = TH2F(name, name, nbins, -10.0, 10.0, nbins, -10.0, 10.0)
-        tree.Draw(draw2, condition, 'goff')
+        if index is None:
+            tree.Draw('{0}>>{1}'.format(draw2, name), condition, 'goff')
+        else:
+            draw_ranges(tree, draw2, name, condition, ranges)
 
         hists[name] = hist2
     return hists
@@ -181,28 +356,90 @@ def make_vdmhistos(
     scaling: Float by which the histograms are rescaled (x=xraw/scaling).
     crange: 2-tuple of limits of the coordinates.
     returns dictionary with histograms.
+    If the trees have a scan step index, the shift of each scan step is
+    applied as a constant to its entry range.
     """
     hists = {}
     for i, tree in enumerate(trees.itervalues()):
         name = 'hist_{0}'.format(tree.GetName())
         condition = 'vtx_nTrk>={0}'.format(mintrk)#' && scanstep>=2'
+        index = read_step_index(tree)
 
-        draw1 = '(vtx_y{2:+.8f}*scanstep)/{0}:(vtx_x{1:+.8f}*scanstep)/{0}>>hnew{3}' \
-                .format(scaling, -1.0*stepsize[0], -1.0*stepsize[1], i)
-        n = tree.Draw(draw1, condition, 'goff')
-        hist1 = gDirectory.Get('hnew{0}'.format(i))
+        if index is None:
+            draw1 = '(vtx_y{2:+.8f}*scanstep)/{0}:(vtx_x{1:+.8f}*scanstep)/{0}>>hnew{3}' \
+                    .format(scaling, -1.0*stepsize[0], -1.0*stepsize[1], i)
+            n = tree.Draw(draw1, condition, 'goff')
+            hist1 = gDirectory.Get('hnew{0}'.format(i))
+        else:
+            nsteps = max(len(first)-1 for offset, first in index)
+            blocks = [(
+                -1.0*stepsize[0]*step, -1.0*stepsize[1]*step,
+                step_ranges(index, [step])
+            ) for step in range(nsteps)]
+            # One wide bin: the mean is computed from the exact values
+            hist1 = TH2F(
+                'hnew{0}'.format(i), '', 1, -1.0e6, 1.0e6, 1, -1.0e6, 1.0e6
+            )
+            n = 0
+            for shiftx, shifty, ranges in blocks:
+                draw1 = '(vtx_y{2:+.8f})/{0}:(vtx_x{1:+.8f})/{0}' \
+                        .format(scaling, shiftx, shifty)
+                n += draw_ranges(
+                    tree, draw1, 'hnew{0}'.format(i), condition, ranges
+                )
 
         offx = round(hist1.GetMean(1), 2)
         offy = round(hist1.GetMean(2), 2)
         if verbose:
             print '<<< {0} entries with offset {1}, {2}'.format(n, offx, offy)
 
-        draw2 = '(vtx_y{2:+.8f}*scanstep)/{0}{4:+f}:(vtx_x{1:+.8f}*scanstep)/{0}{3:+f}>>{5}' \
-                .format(scaling, -1.0*stepsize[0], -1.0*stepsize[1], -1.0*offx, -1.0*offy, name)
         hist2 = TH2F(
             name, name, nbins, crange[0], crange[1], nbins, crange[0], crange[1]
         )
-        tree.Draw(draw2, condition, 'goff')
+        if index is None:
+            draw2 = '(vtx_y{2:+.8f}*scanstep)/{0}{4:+f}:(vtx_x{1:+.8f}*scanstep)/{0}{3:+f}>>{5}' \
+                    .format(scaling, -1.0*stepsize[0], -1.0*stepsize[1], -1.0*offx, -1.0*offy, name)
+            tree.Draw(draw2, condition, 'goff')
+        else:
+            for shiftx, shifty, ranges in blocks:
+                draw2 = '(vtx_y{2:+.8f})/{0}{4:+f}:(vtx_x{1:+.8f})/{0}{3:+f}' \
+                        .format(scaling, shiftx, shifty, -1.0*offx, -1.0*offy)
+                draw_ranges(tree, draw2, name, condition, ranges)
 
         hists[name] = hist2
     return hists
+
+def rebin_histograms(hists, nbins):
+    """Derive histograms with coarser binning by merging bins.
+
+    hists: Dictionary of TH2 with BI data (or error TH1, which are copied).
+    nbins: Number of bins in each dimension, must be an integer fraction of
+           the number of bins of the 2D histograms.
+    returns dictionary with histograms of the same names.
+    """
+    result = {}
+    for name, hist in hists.iteritems():
+        if hist.GetDimension() == 1:
+            new = hist.Clone('{0}_rebin'.format(name))
+        else:
+            nx, ny = hist.GetNbinsX(), hist.GetNbinsY()
+            if nx % nbins or ny % nbins:
+                msg = 'rebin_histograms: {0} bins are not a fraction of ' \
+                      '{1}x{2} bins! ({3})'.format(nbins, nx, ny, name)
+                raise ValueError(msg)
+            new = hist.Rebin2D(nx/nbins, ny/nbins, '{0}_rebin'.format(name))
+        new.SetDirectory(0)
+        new.SetName(name)
+        result[name] = new
+    return result
+
+def quicklook_name(name):
+    """Return name of the quick-look histograms of full histograms.
+
+    name: Name of the full histograms (as in their JSON config).
+    The quick-look part is inserted before the suffix _extra, as
+    prepare_histograms does.
+    """
+    if name.endswith('_extra'):
+        return '{0}_quicklook_extra'.format(name[:-6])
+    return '{0}_quicklook'.format(name)
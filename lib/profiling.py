@@ -0,0 +1,97 @@
+"""Provides lightweight profiling of analysis jobs.
+
+Profiler: Collect stage timings, model evaluations and peak memory.
+pdf_counters: Return numbers of model evaluations and integrals.
+"""
+
+from json import dumps, loads
+from resource import getrusage, RUSAGE_CHILDREN, RUSAGE_SELF
+from time import time
+
+from lib.io import NamedString
+from plugins.dg import DoubleGauss_V1, DoubleGauss_V2
+from plugins.sg import SingleGauss_V1, SingleGauss_V2
+from plugins.tg import TripleGauss_V1, TripleGauss_V2
+
+pdfs = (
+    SingleGauss_V1, SingleGauss_V2, DoubleGauss_V1, DoubleGauss_V2,
+    TripleGauss_V1, TripleGauss_V2
+)
+
+def pdf_counters():
+    """Return numbers of evaluations and integrals of the model functions.
+
+    Counts calls in this process only (not in processes forked by RooFit).
+    """
+    return (
+        sum(pdf.evalCount for pdf in pdfs),
+        sum(pdf.integralCount for pdf in pdfs)
+    )
+
+class Profiler:
+    """Collect timings, counters and peak memory of a job.
+
+    __init__: Initialize.
+    stage: Time a stage (use in with-statement).
+    metrics: Return collected metrics.
+    write: Write metrics to current directory.
+    read: Read metrics from file (static).
+    """
+
+    def __init__(self):
+        """Initialize profiler and start the clock."""
+        self._start = time()
+        self._stages = []
+        self._current = None
+
+    def stage(self, name):
+        """Time a stage of the job.
+
+        name: Name of the stage (string).
+        Returns self for use in a with-statement. Besides the duration, the
+        numbers of model evaluations and integrals are recorded.
+        """
+        self._current = name
+        return self
+
+    def __enter__(self):
+        self._stage_start = time()
+        self._stage_counters = pdf_counters()
+        return self
+
+    def __exit__(self, ex_type, ex_value, ex_traceback):
+        evaluations, integrals = pdf_counters()
+        self._stages.append({
+            'name': self._current,
+            'time': time()-self._stage_start,
+            'evaluations': evaluations-self._stage_counters[0],
+            'integrals': integrals-self._stage_counters[1],
+        })
+        self._current = None
+        return False
+
+    def metrics(self):
+        """Return collected metrics as dict.
+
+        Peak memory is the maximum resident set size (in MB) of this process
+        and of its finished child processes.
+        """
+        return {
+            'stages': self._stages,
+            'total_time': time()-self._start,
+            'evaluations': sum(s['evaluations'] for s in self._stages),
+            'integrals': sum(s['integrals'] for s in self._stages),
+            'peak_memory': getrusage(RUSAGE_SELF).ru_maxrss/1024.0,
+            'peak_memory_children': getrusage(
+                RUSAGE_CHILDREN
+            ).ru_maxrss/1024.0,
+        }
+
+    def write(self, key='profile'):
+        """Write metrics (as JSON string) to current directory."""
+        NamedString(key, dumps(self.metrics(), sort_keys=True)).Write()
+
+    @staticmethod
+    def read(f, key='profile'):
+        """Read metrics from file (BareRootFile) as dict."""
+        return loads(f.get(key).GetTitle())
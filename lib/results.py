@@ -0,0 +1,268 @@
+"""Provides a persistent index of the results of all fits.
+
+ResultsIndex: Query scalar results by fill, variant, model and BCID.
+parse_name: Split the name of a results file into its parts.
+read_results: Read scalar results from a results file.
+record_results: Add a results file to the index.
+"""
+
+from json import dump, load
+from os import getpid, listdir, mkdir, remove, rename
+from os.path import basename, exists, getmtime
+from re import match
+
+from lib.io import BareRootFile
+from lib.stats import read_stats
+from lib.store import append_results, write_fill
+
+indexpath = 'results/index'
+indexfile = 'results/index.json'
+
+keys = ('version', 'name', 'model', 'bcid')
+
+def parse_name(filename):
+    """Split the name of a results file into its parts.
+
+    Returns dict with version (int), name, fill (int), variant, best (bool),
+    model, bcid (int) and timestamp, or None if it is not a fit result.
+    """
+    m = match(
+        r'^BeamImaging_v(\d+)_(Fill(\d+)_(.+?))(_best)?_([A-Za-z]+)_bcid(\d+)_'
+        r'(\d{6}_\d{6})\.root$', basename(filename)
+    )
+    if not m:
+        return None
+    return {
+        'version': int(m.group(1)), 'name': m.group(2),
+        'fill': int(m.group(3)), 'variant': m.group(4),
+        'best': bool(m.group(5)), 'model': m.group(6),
+        'bcid': int(m.group(7)), 'timestamp': m.group(8),
+    }
+
+def read_results(filename):
+    """Read scalar results from a results file.
+
+    Returns dict of fields (float) and dict of final parameters (2-tuples of
+    value and error).
+    """
+    fields = {}
+    parameters = {}
+    with BareRootFile(filename) as f:
+        def value(name):
+            obj = f.Get(name)
+            return obj.GetVal() if obj else None
+        scans = ('X1', 'Y1', 'X2', 'Y2')
+        chisqs = [value('chisq{0}'.format(scan)) for scan in scans]
+        dofs = [value('dof{0}'.format(scan)) for scan in scans]
+        if None not in chisqs + dofs:
+            fields['chisq'] = sum(chisqs)
+            fields['dof'] = sum(dofs)
+        for name in (
+            'overlap_true', 'overlap_average', 'overlap_rms', 'scaling'
+        ):
+            if value(name) is not None:
+                fields[name] = value(name)
+        if f.Get('provisional'):
+            fields['provisional'] = 1.0
+        result = f.Get('fitResult')
+        if result:
+            fields['min_nll'] = result.minNll()
+        for treename, field in (
+            ('corrTree', 'overlap_diff'),
+            ('rndmzd_corrTree', 'rndmzd_overlap_diff'),
+        ):
+            try:
+                stats = read_stats(f, treename)['overlapDiff']
+            except NameError:
+                continue
+            if stats['n']:
+                fields[field] = stats['mean']
+                fields['{0}_error'.format(field)] = stats['rms']
+        directory = f.Get('final')
+        if directory:
+            for key in directory.GetListOfKeys():
+                name = key.GetName()
+                if name.endswith('_error'):
+                    continue
+                error = directory.Get('{0}_error'.format(name))
+                parameters[name] = (
+                    directory.Get(name).GetVal(),
+                    error.GetVal() if error else 0.0
+                )
+    return fields, parameters
+
+def _entry_name(filename):
+    return '{0}/{1}.json'.format(indexpath, basename(filename)[:-5])
+
+def _write_json(filename, content):
+    """Write JSON file atomically, so that readers never see partial files."""
+    tmpname = '{0}.{1}.tmp'.format(filename, getpid())
+    with open(tmpname, 'w') as f:
+        dump(content, f, sort_keys=True)
+    rename(tmpname, filename)
+
+def _make_entry(filename):
+    entry = parse_name(filename)
+    if entry is None:
+        return None
+    entry['file'] = basename(filename)
+    entry['mtime'] = getmtime(filename)
+    entry['fields'], entry['parameters'] = read_results(filename)
+    if not exists(indexpath):
+        try:
+            mkdir(indexpath)
+        except OSError:
+            pass
+    _write_json(_entry_name(filename), entry)
+    return entry
+
+def record_results(filename):
+    """Add a results file to the index.
+
+    To be called once a results file is complete. Each file gets its own
+    entry file, so that concurrent jobs do not compete for the index. The
+    entry is also appended to the columnar store of its fill.
+    """
+    entry = _make_entry(filename)
+    if entry is not None:
+        append_results(entry)
+    return entry
+
+class ResultsIndex:
+    """Query scalar results of all fits.
+
+    __init__: Initialize and update index.
+    update: Pick up new and changed results files.
+    select: Return entries of the latest results files.
+    find: Return entry of the latest matching results file.
+    value: Return value of a field of an entry.
+    table: Return values of a field as nested lists.
+
+    Fields are chisq, dof, chisq_dof, min_nll, overlap_true, overlap_average,
+    overlap_rms, overlap_diff, rndmzd_overlap_diff (each of the latter two
+    also with _error), scaling, provisional (1 for quick-look fits) and the
+    names of the final fit parameters (with _error for their uncertainties).
+    """
+
+    def __init__(self, dofs=None, update=True):
+        """Initialize and load index from disk.
+
+        dofs: Dictionary of model names with numbers of independent
+              parameters (required for chisq_dof).
+        update: Scan results directory for new and changed files.
+        """
+        self.dofs = dofs or {}
+        self.entries = {}
+        if exists(indexfile):
+            with open(indexfile) as f:
+                self.entries = load(f)
+        if update:
+            self.update()
+
+    def update(self):
+        """Pick up new and changed results files and write index to disk.
+
+        Results files are only opened if they have no up-to-date entry. The
+        columnar stores of fills with changes are rewritten.
+        """
+        changed = set()
+        files = set(f for f in listdir('results') if parse_name(f))
+        for filename in list(self.entries):
+            if filename not in files:
+                changed.add(self.entries[filename]['fill'])
+                del self.entries[filename]
+        for filename in sorted(files):
+            fullname = 'results/{0}'.format(filename)
+            mtime = getmtime(fullname)
+            entry = self.entries.get(filename)
+            if entry is not None and entry['mtime'] == mtime:
+                continue
+            entry = None
+            if exists(_entry_name(fullname)):
+                with open(_entry_name(fullname)) as f:
+                    entry = load(f)
+                if entry['mtime'] != mtime:
+                    entry = None
+            if entry is None:
+                try:
+                    entry = _make_entry(fullname)
+                except Exception as e:
+                    print '<<< Warning: Failed to index {0}: {1}' \
+                          .format(filename, e)
+                    continue
+            self.entries[filename] = entry
+            changed.add(entry['fill'])
+        if exists(indexpath):
+            for name in listdir(indexpath):
+                if name.endswith('.json') and \
+                   not exists('results/{0}.root'.format(name[:-5])):
+                    remove('{0}/{1}'.format(indexpath, name))
+        if changed:
+            _write_json(indexfile, self.entries)
+        for fill in changed:
+            write_fill(fill, [
+                e for e in self.entries.itervalues() if e['fill'] == fill
+            ])
+
+    def select(self, **criteria):
+        """Return entries of the latest results files matching the criteria.
+
+        criteria: Values of version, name, fill, variant, best, model and/or
+                  bcid (lists and tuples match any of their elements).
+        Only the latest file per version, name, model and BCID is returned.
+        """
+        latest = {}
+        for entry in self.entries.itervalues():
+            for key, val in criteria.iteritems():
+                if isinstance(val, (list, tuple)):
+                    if entry[key] not in val:
+                        break
+                elif entry[key] != val:
+                    break
+            else:
+                key = tuple(entry[k] for k in keys)
+                if key not in latest or \
+                   entry['timestamp'] > latest[key]['timestamp']:
+                    latest[key] = entry
+        return sorted(latest.values(), key=lambda e: [e[k] for k in keys])
+
+    def find(self, **criteria):
+        """Return entry of the latest results file matching the criteria."""
+        entries = self.select(**criteria)
+        if not entries:
+            return None
+        return max(entries, key=lambda e: e['timestamp'])
+
+    def value(self, entry, field):
+        """Return value of a field of an entry (NaN if not available)."""
+        if entry is None:
+            return float('nan')
+        fields = entry['fields']
+        if field == 'chisq_dof':
+            if 'chisq' not in fields or entry['model'] not in self.dofs:
+                return float('nan')
+            return fields['chisq']/(fields['dof']-self.dofs[entry['model']])
+        if field in fields:
+            return fields[field]
+        if field in entry['parameters']:
+            return entry['parameters'][field][0]
+        if field.endswith('_error') and field[:-6] in entry['parameters']:
+            return entry['parameters'][field[:-6]][1]
+        return float('nan')
+
+    def table(self, field, rows, columns, **criteria):
+        """Return values of a field as nested lists.
+
+        field: Name of the field.
+        rows, columns: 2-tuples of criterion name and list of its values.
+        criteria: Further criteria (as for select).
+        Returns list (rows) of lists (columns), NaN where no result exists.
+        """
+        table = []
+        for row in rows[1]:
+            table.append([])
+            for column in columns[1]:
+                criteria[rows[0]] = row
+                criteria[columns[0]] = column
+                table[-1].append(self.value(self.find(**criteria), field))
+        return table
@@ -17,6 +17,7 @@ class DoubleGaussCore(SingleGaussCore):
     physics_parameters: List of names of physics parameters.
     __init__: Initialize.
     dof: Return parameter number.
+    components: Return names of beam shape components.
     model_functions: Create fit model functions.
     overlap: Compute beam shape overlap.
     assign_overlap: Assign parameter values to overlap function.
@@ -44,6 +45,11 @@ class DoubleGaussCore(SingleGaussCore):
         """Return number of independent parameters."""
         return 18
 
+    @staticmethod
+    def components():
+        """Return names of the Gaussian components of each beam."""
+        return ['N', 'M']
+
     def model_functions(self):
         """Create functions for the fit model of the Beam Imaging scan."""
         x1 = DoubleGauss_V1(
@@ -212,6 +218,7 @@ class DoubleGaussFit(DoubleGaussCore):
             )(nameA)
             parB = FormulaVar(nameB, formulaB, arglistB, errorB)
             self._physics_parameters[nameB] = parB
+        self.snapshot()
 
     @staticmethod
     def name():
@@ -263,6 +270,7 @@ class DoubleGaussToy(DoubleGaussCore):
             )(nameA)
             parB = FormulaVar(nameB, formulaB, arglistB, errorB)
             self._physics_parameters[nameB] = parB
+        self.snapshot()
 
     @staticmethod
     def name():
@@ -375,6 +383,7 @@ class SuperGaussFit(DoubleGaussCore):
             )(nameC)
             parB = FormulaVar(nameB, formulaB, arglistB, errorB)
             self._physics_parameters[nameB] = parB
+        self.snapshot()
 
     @staticmethod
     def name():
@@ -502,6 +511,7 @@ class SuperGaussToy(DoubleGaussCore):
             )(nameC)
             parB = FormulaVar(nameB, formulaB, arglistB, errorB)
             self._physics_parameters[nameB] = parB
+        self.snapshot()
 
     @staticmethod
     def name():
@@ -17,6 +17,7 @@ class SingleGaussCore(BeamShapeCore):
     physics_parameters: List of names of physics parameters.
     __init__: Initialize.
     dof: Return parameter number.
+    components: Return names of beam shape components.
     model_functions: Create fit model functions.
     gauss: Compute simple Gaussian.
     overlap: Compute beam shape overlap.
@@ -41,6 +42,11 @@ class SingleGaussCore(BeamShapeCore):
         """Return number of independent parameters."""
         return 10
 
+    @staticmethod
+    def components():
+        """Return names of the Gaussian components of each beam."""
+        return ['N']
+
     def model_functions(self):
         """Create functions for the fit model of the Beam Imaging scan."""
         x1 = SingleGauss_V1(
@@ -162,6 +168,7 @@ class SingleGauss(SingleGaussCore):
             # Weight
             par = RealVar(name, 1.0)
             self._physics_parameters[name] = par
+        self.snapshot()
 
     @staticmethod
     def name():
@@ -192,6 +199,7 @@ class SingleGaussUncorrelated(SingleGauss):
             par = self.parameter(name)
             par.setVal(0.0)
             par.setConstant()
+        self.snapshot()
 
     @staticmethod
     def name():
@@ -1,29 +1,106 @@
 """Provides base class for beam shape models.
 
 BeamShapeCore: Base class (abstract).
+gauss_term: Compute inverse covariance and normalization of a model term.
+term_density: Evaluate model terms on a grid.
+term_integral: Integrate a model term over a rectangle.
 """
 
 from json import load
-from math import copysign
+from math import acos, copysign, erf, pi
 from os.path import exists
+from re import match
 
+from numpy import array, exp, float64, newaxis, zeros
+from numpy.polynomial.legendre import leggauss
 from ROOT import TF2
 
 from lib.io import NamedFloat, RootFile
 from lib.vars import RealVar
 
+ic = [('1','X'),('1','Y'),('2','X'),('2','Y')]
+
+def gauss_term(
+    xwidth, ywidth, rho, xmarginv, ymarginv, vtxresx, vtxresy, weight
+):
+    """Compute inverse covariance matrix and normalization of a model term.
+
+    A term is the 2D beam shape of one beam, multiplied with the 1D marginal
+    beam shape of the other beam (inverse squared widths xmarginv, ymarginv,
+    one of them is zero) and convolved with the vertex resolution.
+    Returns list (xx, yy and xy element of inverse covariance, normalization,
+    weight), the same as gaussTerm in plugins/src/GaussTerm.h.
+    """
+    beamdet = xwidth**2*ywidth**2*(1.0-rho**2)
+    axx = ywidth**2/beamdet + xmarginv
+    ayy = xwidth**2/beamdet + ymarginv
+    axy = -rho*xwidth*ywidth/beamdet
+    adet = axx*ayy-axy**2
+    cxx = ayy/adet + vtxresx**2
+    cyy = axx/adet + vtxresy**2
+    cxy = -axy/adet
+    cdet = cxx*cyy-cxy**2
+    return [cyy/cdet, cxx/cdet, -cxy/cdet, 0.5/(pi*cdet**0.5), weight]
+
+def term_density(terms, x, y):
+    """Evaluate the sum of model terms on a grid.
+
+    terms: Array of terms (one per row, as returned by gauss_term).
+    x, y: Arrays of distances from the peak position along both axes.
+    Returns array indexed as [y, x].
+    """
+    x = x[newaxis, :]
+    y = y[:, newaxis]
+    result = zeros((y.shape[0], x.shape[1]), dtype=float64)
+    for sxx, syy, sxy, norm, weight in terms:
+        result += weight*norm*exp(-0.5*(x*x*sxx+y*y*syy+2.0*sxy*x*y))
+    return result
+
+nodes48, weights48 = leggauss(48)
+
+def term_integral(term, xlo, xhi, ylo, yhi):
+    """Integrate a model term over a rectangle relative to the peak position.
+
+    The integral over y is exact, the one over x uses a 48-point
+    Gauss-Legendre rule within eight standard deviations (same as
+    gaussTermIntegral in plugins/src/GaussTerm.h).
+    """
+    sxx, syy, sxy, norm, weight = term
+    det = sxx*syy-sxy**2
+    cxx, cyy, cxy = syy/det, sxx/det, -sxy/det
+    slope = cxy/cxx
+    yscale = (2.0*(cyy-cxy*slope))**0.5
+    xsigma = cxx**0.5
+    xlo = max(xlo, -8.0*xsigma)
+    xhi = min(xhi, 8.0*xsigma)
+    if xlo >= xhi:
+        return 0.0
+    x = 0.5*(xhi+xlo) + 0.5*(xhi-xlo)*nodes48
+    erfs = array([
+        erf((yhi-slope*v)/yscale) - erf((ylo-slope*v)/yscale) for v in x
+    ])
+    total = (weights48*exp(-0.5*x*x/cxx)*erfs).sum()
+    return weight*norm*2.0*pi/det**0.5 \
+           *0.25*(xhi-xlo)*total/((2.0*pi)**0.5*xsigma)
+
 class BeamShapeCore:
     """Core functionality for beam shapes (abstract).
 
     __init__: Initialize.
     name: Return model name (abstract).
     dof: Return parameter number (abstract).
+    components: Return names of beam shape components (abstract).
     xvar: Return x variable.
     yvar: Return y variable.
     parameter: Return specific variable.
     parameters: Iterate over parameters.
     set_vtxres: Set vertex resolution.
+    snapshot: Store state of parameters.
+    reset: Reset state of previous fit.
     load_json: Load values from JSON config.
+    load_model: Load values from fit result of another model.
+    model_terms: Return terms of the fit model functions.
+    vectorized_model: Evaluate fit model on histogram bins with NumPy.
     overlap: Compute beam shape overlap (abstract).
     assign_overlap: Assign parameter values to overlap function.
     overlap_func: Return beam shape overlap as TF2.
@@ -35,6 +112,7 @@ class BeamShapeCore:
         crange: 2-tuple of limits of the coordinates.
         """
         self.factor = 1.0
+        self._snapshot = {}
         self._variables = {}
         self._physics_parameters = {}
         self._fit_parameters = {}
@@ -67,6 +145,12 @@ class BeamShapeCore:
         msg = 'BeamShapeCore: Called dof() of abstract class!'
         raise NotImplementedError(msg)
 
+    @staticmethod
+    def components():
+        """Return names of the Gaussian components of each beam."""
+        msg = 'BeamShapeCore: Called components() of abstract class!'
+        raise NotImplementedError(msg)
+
     def xvar(self):
         """Return x variable."""
         return self._variables['xVar']
@@ -109,6 +193,39 @@ class BeamShapeCore:
         self.parameter('xVtxRes').setConstant(constant)
         self.parameter('yVtxRes').setConstant(constant)
 
+    def snapshot(self):
+        """Store value, boundaries, constness and error of all parameters.
+
+        Called at the end of the initialization of each model, the state is
+        restored by reset.
+        """
+        self._snapshot = {
+            par.GetName(): (
+                par.getVal(), par.getMin(), par.getMax(), par.isConstant(),
+                par.getError()
+            ) for par in self.parameters() if not par.is_formula()
+        }
+
+    def reset(self):
+        """Reset the state left by a previous fit.
+
+        Resets the scale factor and restores value, boundaries, constness and
+        error of all parameters as stored by snapshot (also the parameters
+        not set by load_json), so that each fit starts from the same state.
+        """
+        self.factor = 1.0
+        for par in self.parameters():
+            if par.is_formula():
+                continue
+            if par.GetName() not in self._snapshot:
+                par.setError(0.0)
+                continue
+            val, lo, hi, const, err = self._snapshot[par.GetName()]
+            par.set_range(lo, hi)
+            par.setVal(val)
+            par.setConstant(const)
+            par.setError(err)
+
     def load_json(self, parameterfile=None, random=None):
         """Loads parameter boundaries and initial values from JSON config.
 
@@ -154,10 +271,15 @@ class BeamShapeCore:
                 parameters.append(NamedFloat(name+'_ini', ini))
         return parameters
 
-    def load_root(self, filename):
+    def load_root(self, filename, parameters=None, narrow=True):
         """Loads parameter values from ROOT results file.
 
         filename: (Part of) name of ROOT file with fit results.
+        parameters: TParameter list (as returned by load_json) to be updated.
+        narrow: Set true to restrict the ranges to two standard deviations
+                around the values. Otherwise, only the initial values of free
+                parameters are set (restricted to the boundaries), e.g. to
+                start from the result of a quick-look fit.
         """
         with RootFile(filename) as f:
             for par in self.parameters():
@@ -165,12 +287,160 @@ class BeamShapeCore:
                     continue
                 value = f.Get('final/{0}'.format(par.GetName()))
                 error = f.Get('final/{0}_error'.format(par.GetName()))
-                if value and error:
+                if not narrow:
+                    if not value or par.isConstant():
+                        continue
+                    val = min(max(value.GetVal(), par.getMin()), par.getMax())
+                    par.setVal(val)
+                    for p in parameters or []:
+                        if p.GetName() == '{0}_ini'.format(par.GetName()):
+                            p.SetVal(val)
+                elif value and error:
                     val, err = value.GetVal(), error.GetVal()
                     par.setRange(val-2*err, val+2*err)
                     par.setVal(val)
                     par.setError(err)
 
+    def load_model(self, model, parameters=None):
+        """Loads initial values from the fit result of another model.
+
+        model: Beam shape model (derived from BeamShapeCore) after its fit.
+        parameters: TParameter list (as returned by load_json) to be updated.
+        Each free parameter takes the value of the parameter with the same name
+        in model. Otherwise, it is derived from the corresponding component of
+        the simpler model (e.g. rhoM1 from rhoN1 or xWidthN1Ratio from
+        xWidthN1 and xWidthM1). Values are restricted to the boundaries.
+        Constant parameters of model (e.g. w1N of SG) are not used, those
+        parameters keep their initial values.
+        """
+        def value(name):
+            source = model.parameter(name)
+            if not source.is_formula() and source.isConstant():
+                raise KeyError(name)
+            return source.val()
+        counterparts = [
+            ('^([xy])WidthN([12])Ratio$', lambda m: value(
+                '{0}WidthN{1}'.format(*m.groups())
+            ) / value('{0}WidthM{1}'.format(*m.groups()))),
+            ('^([xy])WidthM([12])$', lambda m: value(
+                '{0}WidthN{1}'.format(*m.groups())
+            )),
+            ('^([xy])WidthW([12])Diff$', lambda m: value(
+                '{0}WidthM{1}Diff'.format(*m.groups())
+            )),
+            ('^rhoM([12])$', lambda m: value('rhoN{0}'.format(*m.groups()))),
+            ('^rhoW([12])$', lambda m: value('rhoM{0}'.format(*m.groups()))),
+            ('^theta([12])$', lambda m: acos(
+                min(max(value('w{0}N'.format(*m.groups())), 0.0), 1.0)**0.5
+            )),
+        ]
+        for par in self.parameters():
+            if par.is_formula() or par.isConstant():
+                continue
+            name = par.GetName()
+            try:
+                val = value(name)
+            except KeyError:
+                for pattern, func in counterparts:
+                    found = match(pattern, name)
+                    if not found:
+                        continue
+                    try:
+                        val = func(found)
+                    except (KeyError, ZeroDivisionError):
+                        continue
+                    break
+                else:
+                    continue
+            val = min(max(val, par.getMin()), par.getMax())
+            par.setVal(val)
+            if parameters is not None:
+                for p in parameters:
+                    if p.GetName() == '{0}_ini'.format(name):
+                        p.SetVal(val)
+
+    def model_terms(self):
+        """Return the terms of the four fit model functions.
+
+        Returns list of 3-tuples (peak position in x and y, array of terms as
+        returned by gauss_term) in the order of the scans (X1, Y1, X2, Y2),
+        for the current parameter values. The terms are the same as the ones
+        of the model functions in plugins/src.
+        """
+        val = lambda name: self.parameter(name).val()
+        beams = {}
+        for beam in ('1', '2'):
+            names = self.components()
+            weights = [val('w{0}{1}'.format(beam, k)) for k in names[:-1]]
+            weights.append(1.0-sum(weights))
+            beams[beam] = [(
+                weight, val('xWidth{0}{1}'.format(k, beam)),
+                val('yWidth{0}{1}'.format(k, beam)),
+                val('rho{0}{1}'.format(k, beam))
+            ) for weight, k in zip(weights, names)]
+        vtxresx, vtxresy = val('xVtxRes'), val('yVtxRes')
+        result = []
+        for i, c in ic:
+            other = {'1': '2', '2': '1'}[i]
+            scan = {'X': '1', 'Y': '2'}[c]
+            terms = []
+            for weight, xwidth, ywidth, rho in beams[i]:
+                for margweight, margxwidth, margywidth, __ in beams[other]:
+                    if c == 'X':
+                        marg = (0.0, 1.0/margywidth**2)
+                    else:
+                        marg = (1.0/margxwidth**2, 0.0)
+                    terms.append(gauss_term(
+                        xwidth, ywidth, rho, marg[0], marg[1],
+                        vtxresx, vtxresy, weight*margweight
+                    ))
+            result.append((
+                val('x0{0}{1}'.format(i, scan)),
+                val('y0{0}{1}'.format(i, scan)), array(terms)
+            ))
+        return result
+
+    def vectorized_model(self, xedges, yedges, integrals=False, points=3):
+        """Evaluate the four fit model functions on histogram bins.
+
+        xedges, yedges: Arrays of bin edges (within the coordinate range).
+        integrals: Set true to integrate over the bins (Gauss-Legendre rule
+                   with points nodes per axis), otherwise the model is
+                   evaluated at the bin centers.
+        Returns list of four arrays (indexed as [y, x]) with the probability
+        content of each bin. The model functions are normalized on the
+        coordinate range, like the RooFit model functions.
+        """
+        xlo, xhi = self.xvar().getMin(), self.xvar().getMax()
+        ylo, yhi = self.yvar().getMin(), self.yvar().getMax()
+        xwidths = xedges[1:]-xedges[:-1]
+        ywidths = yedges[1:]-yedges[:-1]
+        if integrals:
+            nodes, weights = leggauss(points)
+            xs = (0.5*(xedges[1:]+xedges[:-1]))[:, newaxis] \
+                 + 0.5*xwidths[:, newaxis]*nodes[newaxis, :]
+            ys = (0.5*(yedges[1:]+yedges[:-1]))[:, newaxis] \
+                 + 0.5*ywidths[:, newaxis]*nodes[newaxis, :]
+            xw = (0.5*xwidths[:, newaxis]*weights[newaxis, :]).ravel()
+            yw = (0.5*ywidths[:, newaxis]*weights[newaxis, :]).ravel()
+            xs, ys = xs.ravel(), ys.ravel()
+        else:
+            xs, ys = 0.5*(xedges[1:]+xedges[:-1]), 0.5*(yedges[1:]+yedges[:-1])
+        result = []
+        for x0, y0, terms in self.model_terms():
+            norm = sum(
+                term_integral(t, xlo-x0, xhi-x0, ylo-y0, yhi-y0) for t in terms
+            )
+            values = term_density(terms, xs-x0, ys-y0)
+            if integrals:
+                values = (values*yw[:, newaxis]*xw[newaxis, :]).reshape(
+                    len(ywidths), points, len(xwidths), points
+                ).sum(axis=(1, 3))
+            else:
+                values = values*ywidths[:, newaxis]*xwidths[newaxis, :]
+            result.append(values/norm)
+        return result
+
     def overlap(self, x, par):
         """Compute product of the beam shapes.
 
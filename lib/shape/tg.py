@@ -19,6 +19,7 @@ class TripleGaussCore(DoubleGaussCore):
     physics_parameters: List of names of physics parameters.
     __init__: Initialize.
     dof: Return parameter number.
+    components: Return names of beam shape components.
     model_functions: Create fit model functions.
     overlap: Compute beam shape overlap.
     assign_overlap: Assign parameter values to overlap function.
@@ -49,6 +50,11 @@ class TripleGaussCore(DoubleGaussCore):
         """Return number of independent parameters."""
         return 26
 
+    @staticmethod
+    def components():
+        """Return names of the Gaussian components of each beam."""
+        return ['N', 'M', 'W']
+
     def model_functions(self):
         """Create functions for the fit model of the Beam Imaging scan."""
         x1 = TripleGauss_V1(
@@ -285,6 +291,7 @@ class TripleGaussFit(TripleGaussCore):
             )(nameD, nameE)
             parC = FormulaVar(nameC, formulaC, arglistC, errorC)
             self._physics_parameters[nameC] = parC
+        self.snapshot()
 
     @staticmethod
     def name():
@@ -355,6 +362,7 @@ class TripleGaussToy(TripleGaussCore):
             )(nameA, nameD)
             parC = FormulaVar(nameC, formulaC, arglistC, errorC)
             self._physics_parameters[nameC] = parC
+        self.snapshot()
 
     @staticmethod
     def name():
@@ -546,6 +554,7 @@ class SuperDoubleGaussFit(TripleGaussCore):
             )(nameL, nameD)
             parC = FormulaVar(nameC, formulaC, arglistC, errorC)
             self._physics_parameters[nameC] = parC
+        self.snapshot()
 
     @staticmethod
     def name():
@@ -752,6 +761,7 @@ class SuperDoubleGaussToy(TripleGaussCore):
             )(nameL, nameD)
             parC = FormulaVar(nameC, formulaC, arglistC, errorC)
             self._physics_parameters[nameC] = parC
+        self.snapshot()
 
     @staticmethod
     def name():
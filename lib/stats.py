@@ -0,0 +1,143 @@
+"""Provides summary statistics of result trees.
+
+tree_stats: Compute summary statistics of tree branches in one pass.
+write_stats: Write summary statistics of a tree to current directory.
+read_stats: Read summary statistics of a tree from file.
+fill_histograms: Fill several histograms in one pass over a tree.
+"""
+
+from json import dumps, loads
+
+from numpy import array, isfinite, percentile
+
+from ROOT import TH1, TH1F, TH2F, TTreeFormula
+
+from lib.io import NamedString
+
+quantiles = (2.5, 16.0, 50.0, 84.0, 97.5)
+
+_cache = {}
+
+def _branches(tree):
+    """Return names of all branches with a single number per entry."""
+    return [
+        leaf.GetName() for leaf in tree.GetListOfLeaves()
+        if leaf.GetLen() == 1 and not leaf.GetLeafCount()
+    ]
+
+def tree_stats(tree, branches=None):
+    """Compute summary statistics of tree branches in one pass over the tree.
+
+    tree: TTree (or TChain).
+    branches: List of branch names (default: all scalar branches).
+    Returns dict of branch names with dicts of n, mean, rms, min, max and
+    quantiles (list of values at the percentiles in quantiles). Values that
+    are not finite are not counted.
+    """
+    if branches is None:
+        branches = _branches(tree)
+    values = {branch: [] for branch in branches}
+    for entry in tree:
+        for branch in branches:
+            values[branch].append(getattr(entry, branch))
+    stats = {}
+    for branch in branches:
+        vals = array(values[branch], dtype=float)
+        vals = vals[isfinite(vals)]
+        if len(vals) == 0:
+            stats[branch] = {'n': 0}
+            continue
+        stats[branch] = {
+            'n': len(vals), 'mean': vals.mean(), 'rms': vals.std(),
+            'min': vals.min(), 'max': vals.max(),
+            'quantiles': list(percentile(vals, quantiles)),
+        }
+    return stats
+
+def write_stats(tree, branches=None):
+    """Write summary statistics of a tree to current directory.
+
+    They are stored as JSON string named after the tree with suffix _stats.
+    """
+    name = '{0}_stats'.format(tree.GetName())
+    NamedString(name, dumps(tree_stats(tree, branches))).Write()
+
+def read_stats(f, treename):
+    """Read summary statistics of a tree from file.
+
+    f: File (BareRootFile).
+    treename: Name of the tree.
+    For legacy files without stored statistics, they are computed in a
+    single pass over the tree, which is cached for further calls. Raises
+    NameError if neither statistics nor tree exist.
+    """
+    stored = f.Get('{0}_stats'.format(treename))
+    if stored:
+        return loads(stored.GetTitle())
+    key = (f.GetName(), treename)
+    if key not in _cache:
+        tree = f.Get(treename)
+        if not tree:
+            msg = 'read_stats: Neither statistics nor tree {0} in file {1}!' \
+                  .format(treename, f.GetName())
+            raise NameError(msg)
+        _cache[key] = tree_stats(tree)
+    return _cache[key]
+
+def fill_histograms(tree, selection, specs):
+    """Fill several histograms in one pass over a tree.
+
+    tree: TTree.
+    selection: Selection (as for TTree::Draw) common to all histograms, it
+               is evaluated once per entry.
+    specs: List of 3-tuples (expression, binning, name) or 4-tuples with an
+           additional selection for this histogram only.
+           expression: 'x' or 'y:x' (as for TTree::Draw).
+           binning: (nbins, lo, hi) or (nx, xlo, xhi, ny, ylo, yhi), or an
+                    existing histogram to be filled.
+    Returns dict of names with histograms.
+    """
+    def formula(name, expression):
+        result = TTreeFormula(name, expression, tree)
+        if not result.GetNdim():
+            msg = 'fill_histograms: Invalid expression {0}!'.format(expression)
+            raise ValueError(msg)
+        return result
+    common = formula('fill_selection', selection) if selection else None
+    hists = {}
+    fillers = []
+    for spec in specs:
+        expression, binning, name = spec[:3]
+        if isinstance(binning, TH1):
+            hist = binning
+        else:
+            hist = (TH1F if len(binning) == 3 else TH2F)(name, '', *binning)
+            hist.SetDirectory(0)
+        hists[name] = hist
+        variables = [
+            formula('{0}_var{1}'.format(name, i), part)
+            for i, part in enumerate(reversed(expression.split(':')))
+        ]
+        if len(spec) > 3 and spec[3]:
+            extra = formula('{0}_selection'.format(name), spec[3])
+        else:
+            extra = None
+        fillers.append((hist, variables, extra))
+    for entry in xrange(tree.GetEntries()):
+        tree.LoadTree(entry)
+        # GetNdata reads the branches needed by a formula for this entry
+        if common is not None and not (
+            common.GetNdata() and common.EvalInstance()
+        ):
+            continue
+        for hist, variables, extra in fillers:
+            if extra is not None and not (
+                extra.GetNdata() and extra.EvalInstance()
+            ):
+                continue
+            values = []
+            for variable in variables:
+                variable.GetNdata()
+                values.append(variable.EvalInstance())
+            hist.Fill(*values)
+    return hists
@@ -0,0 +1,169 @@
+"""Provides a columnar store of fit results, one file per fill.
+
+ResultsStore: Load and query the results of several fills.
+append_results: Add an entry of the results index to the store.
+write_fill: Replace the results of a fill in the store.
+"""
+
+from contextlib import contextmanager
+from fcntl import flock, LOCK_EX, LOCK_UN
+from os import getpid, listdir, mkdir, rename
+from os.path import exists
+
+from numpy import array, concatenate, full, isnan, load, savez_compressed
+
+storepath = 'results/store'
+
+# Column of the results file is called filename, file clashes with savez
+labels = ('filename', 'name', 'variant', 'model', 'timestamp')
+numbers = ('version', 'fill', 'bcid', 'best')
+keys = ('version', 'name', 'model', 'bcid')
+
+def _filename(fill):
+    return '{0}/Fill{1}.npz'.format(storepath, fill)
+
+@contextmanager
+def _locked(fill):
+    """Lock the store of a fill against concurrent writers."""
+    if not exists(storepath):
+        try:
+            mkdir(storepath)
+        except OSError:
+            pass
+    with open('{0}/Fill{1}.lock'.format(storepath, fill), 'w') as lock:
+        flock(lock, LOCK_EX)
+        try:
+            yield
+        finally:
+            flock(lock, LOCK_UN)
+
+def _row(entry):
+    """Convert an entry of the results index to a flat row."""
+    row = {label: str(entry[label]) for label in labels[1:]}
+    row['filename'] = str(entry['file'])
+    row.update({number: int(entry[number]) for number in numbers})
+    row.update(entry['fields'])
+    for par, (val, err) in entry['parameters'].iteritems():
+        row[str(par)] = val
+        row['{0}_error'.format(par)] = err
+    return row
+
+def _columns(rows):
+    """Convert list of rows to dict of NumPy arrays (NaN if missing)."""
+    names = set()
+    for row in rows:
+        names.update(row)
+    columns = {}
+    for name in names:
+        if name in labels:
+            columns[name] = array([row[name] for row in rows], dtype=str)
+        elif name in numbers:
+            columns[name] = array([row[name] for row in rows], dtype=int)
+        else:
+            columns[name] = array(
+                [row.get(name, float('nan')) for row in rows], dtype=float
+            )
+    return columns
+
+def _rows(columns):
+    """Convert dict of NumPy arrays to list of rows."""
+    if not columns:
+        return []
+    rows = [{} for __ in columns['filename']]
+    for name, column in columns.iteritems():
+        for row, value in zip(rows, column.tolist()):
+            if name in labels or name in numbers or not isnan(value):
+                row[name] = value
+    return rows
+
+def _read(fill):
+    if not exists(_filename(fill)):
+        return {}
+    with load(_filename(fill)) as f:
+        return {name: f[name] for name in f.files}
+
+def _write(fill, rows):
+    tmpname = '{0}/Fill{1}.{2}.tmp.npz'.format(storepath, fill, getpid())
+    savez_compressed(tmpname, **_columns(rows))
+    rename(tmpname, _filename(fill))
+
+def append_results(entry):
+    """Add an entry of the results index to the store of its fill.
+
+    An existing row of the same results file is replaced.
+    """
+    row = _row(entry)
+    with _locked(row['fill']):
+        rows = [
+            r for r in _rows(_read(row['fill'])) if r['filename'] != row['filename']
+        ]
+        _write(row['fill'], rows+[row])
+
+def write_fill(fill, entries):
+    """Replace the results of a fill in the store by the given entries."""
+    with _locked(fill):
+        _write(fill, [_row(entry) for entry in entries])
+
+class ResultsStore:
+    """Load and query the results of several fills.
+
+    __init__: Initialize and load the stores of the fills.
+    select: Return columns of the matching results.
+
+    Columns are filename, name, variant, model, timestamp, version, fill, bcid,
+    best and all fields and parameters of the results index (NaN where a
+    result does not have them).
+    """
+
+    def __init__(self, fills=None):
+        """Initialize and load the stores of the fills (default: all)."""
+        if fills is None:
+            fills = sorted(
+                int(f[4:-4]) for f in listdir(storepath)
+                if f.startswith('Fill') and f.endswith('.npz')
+            ) if exists(storepath) else []
+        stores = [_read(fill) for fill in fills]
+        stores = [store for store in stores if store]
+        self.columns = {}
+        if not stores:
+            return
+        names = set()
+        for store in stores:
+            names.update(store)
+        for name in names:
+            self.columns[name] = concatenate([
+                store[name] if name in store
+                else full(len(store['filename']), float('nan'))
+                for store in stores
+            ])
+
+    def select(self, latest=True, **criteria):
+        """Return dict of columns of the matching results.
+
+        latest: Only return the latest result per version, name, model and
+                BCID.
+        criteria: Values of labels and numbers (lists and tuples match any of
+                  their elements).
+        """
+        if not self.columns:
+            return {}
+        mask = full(len(self.columns['filename']), True)
+        for name, value in criteria.iteritems():
+            if not isinstance(value, (list, tuple)):
+                value = [value]
+            selected = full(len(mask), False)
+            for val in value:
+                selected |= self.columns[name] == val
+            mask &= selected
+        if latest:
+            seen = set()
+            order = self.columns['timestamp'].argsort()[::-1]
+            for i in order:
+                key = tuple(self.columns[k][i] for k in keys)
+                if mask[i] and key in seen:
+                    mask[i] = False
+                elif mask[i]:
+                    seen.add(key)
+        return {
+            name: column[mask] for name, column in self.columns.iteritems()
+        }
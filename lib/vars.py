@@ -5,7 +5,9 @@ FormulaVar: Variable that depends on other variables.
 ArgList: List of variables.
 """
 
-from ROOT import RooArgList, RooFit, RooFormulaVar, RooRealVar
+from ROOT import RooArgList, RooFit, RooRealVar
+
+from plugins.formula import compile_formula, FunctionVar
 
 class RealVar(RooRealVar):
     """A variable that takes a value.
@@ -70,7 +72,7 @@ class RealVar(RooRealVar):
         self._fixed_maximum = higher
         self.set_range(self.getMin(), self.getMax())
 
-class FormulaVar(RooFormulaVar):
+class FormulaVar(FunctionVar):
     """A variable that depends on other variables.
 
     __init__: Initialize.
@@ -85,8 +87,13 @@ class FormulaVar(RooFormulaVar):
 
         Takes a name, a formula (strings), an list of variables (RooArgList) the
         variable depends on, and (optionally) an error (function).
+        The formula is compiled to a C++ function of the variables instead of
+        being interpreted at every evaluation.
         """
-        RooFormulaVar.__init__(self, name, name, formula, arglist)
+        names = [arglist.at(i).GetName() for i in range(arglist.getSize())]
+        FunctionVar.__init__(
+            self, name, name, arglist, compile_formula(formula, names)
+        )
         self.set_error(error)
 
     def set_error(self, error):
@@ -1,15 +1,21 @@
 from json import dump, load
 from math import isnan
+from multiprocessing import Pool
 from os import mkdir
-from os.path import exists
+from os.path import basename, exists, getmtime
 from re import match
 from shutil import copyfile
 from sys import argv
+from traceback import print_exc
 
-from ROOT import gDirectory, TF1, TH1F
+from ROOT import gROOT, TF1
 
-from lib.io import RootFile
+from lib.batch import parse_options
+from lib.io import BareRootFile, RootFile
 from lib.plot.residual import CombinedResidualPlot, ResidualPlot
+from lib.profiling import Profiler
+from lib.results import ResultsIndex
+from lib.stats import read_stats
 from lib.plot.summary import ChiSquareSummary, CorrectionSummary
 from lib.shape.dg import DoubleGaussFit, SuperGaussFit
 from lib.shape.sg import SingleGauss, SingleGaussUncorrelated
@@ -18,7 +24,8 @@ from lib.shape.tg import SuperDoubleGaussFit, TripleGaussFit
 result_fields = (
     'overlapIntegral', 'overlapDiff', 'randomized ovDiff', 'chiSq', 'd.o.f.',
     'chiSq/dof', 'neg.log.lik.', 'time of fit', 'time of simulation',
-    'time of residuals', 'time of randomization', 'scaling'
+    'time of residuals', 'time of randomization', 'scaling', 'run time',
+    'run time per stage', 'model evaluations', 'peak memory'
 )
 
 summary_fields = (
@@ -26,6 +33,12 @@ summary_fields = (
     ('overlapDiff', '%1$.3f&#37;<br />&plusmn;%2$.3f&#37;')
 )
 
+# Summary fields: (field in results index, field of error, factor)
+summary_results = {
+    'chiSq/dof': ('chisq_dof', None, 1.0),
+    'overlapDiff': ('overlap_diff', 'overlap_diff_error', 100.0),
+}
+
 longnames = {
     'SG': 'Single Gauss', 'DG': 'Double Gauss', 'TG': 'TripleGauss',
     'SupG': 'Super Gauss', 'SupDG': 'Super Double Gauss',
@@ -43,28 +56,18 @@ def get_result(result, f, model):
             val = f.get('overlap_true').GetVal()
             err = f.get('overlap_rms').GetVal()
             if val < 0.0:
-                hist = TH1F('thisoverlap', '', 1000, 0.0, 1.0)
-                f.Get('corrTree').Draw('overlapTrue>>thisoverlap', '', 'goff')
-                val = hist.GetMean()
-                err = hist.GetRMS()
+                stats = read_stats(f, 'corrTree')['overlapTrue']
+                val, err = stats['mean'], stats['rms']
             return '{:.3e}<br />&plusmn;{:.3e}'.format(val, err)
         elif match('^overlapDiff$', result):
-            try:
-                hist = f.get('overlap_diff')
-            except NameError:
-                f.Get('corrTree').Draw('overlapDiff>>hnew', '', 'goff')
-                val = gDirectory.Get('hnew').GetMean()
-                mini, maxi = val-0.5, val+0.5
-                hist = TH1F('myoverlap', '', 1000, mini, maxi)
-                f.Get('corrTree').Draw('overlapDiff>>myoverlap', '', 'goff')
-            val = hist.GetMean()*100.0
-            err = hist.GetRMS()*100.0
+            stats = read_stats(f, 'corrTree')['overlapDiff']
+            val = stats['mean']*100.0
+            err = stats['rms']*100.0
             return '{:.3f}&#37;<br />&plusmn;{:.3f}&#37;'.format(val, err)
         elif match('^randomized ovDiff$', result):
-            hist = TH1F('myoverlap', '', 1000, -0.5, 0.5)
-            f.Get('rndmzd_corrTree').Draw('overlapDiff>>myoverlap', '', 'goff')
-            val = hist.GetMean()*100.0
-            err = hist.GetRMS()*100.0
+            stats = read_stats(f, 'rndmzd_corrTree')['overlapDiff']
+            val = stats['mean']*100.0
+            err = stats['rms']*100.0
             return '{:.3f}&#37;<br />&plusmn;{:.3f}&#37;'.format(val, err)
         elif match('^chiSq$', result):
             val = (
@@ -102,12 +105,32 @@ def get_result(result, f, model):
         elif match('^scaling$', result):
             val = f.get('scaling').GetVal()*1.0e4
             return '1={:.2f}&micro;m'.format(val)
+        elif match('^run time$', result):
+            val = Profiler.read(f)['total_time']
+            return '{:.0f}s'.format(val)
+        elif match('^run time per stage$', result):
+            return '<br />'.join(
+                '{0}: {1:.1f}s'.format(stage['name'], stage['time'])
+                for stage in Profiler.read(f)['stages']
+            )
+        elif match('^model evaluations$', result):
+            metrics = Profiler.read(f)
+            return '{0}<br />({1} integrals)'.format(
+                metrics['evaluations'], metrics['integrals']
+            )
+        elif match('^peak memory$', result):
+            metrics = Profiler.read(f)
+            return '{0:.0f}MB<br />({1:.0f}MB children)'.format(
+                metrics['peak_memory'], metrics['peak_memory_children']
+            )
         else:
             raise NameError()
     except NameError:
         return ''
     except TypeError:
         return ''
+    except KeyError:
+        return ''
 
 def get_parameter(par, f):
     try:
@@ -136,34 +159,8 @@ def get_fitpar(par, f):
         return ''
     return '{0:.3f}'.format(val)
 
-def get_summary(summary, f, model):
-    try:
-        if match('^chiSq/dof$', summary):
-            val = (
-                f.get('chisqX1').GetVal() + f.get('chisqX2').GetVal()
-                + f.get('chisqY1').GetVal() + f.get('chisqY2').GetVal()
-            ) / (
-                f.get('dofX1').GetVal() + f.get('dofX2').GetVal()
-                + f.get('dofY1').GetVal() + f.get('dofY2').GetVal()
-                - model.dof()
-            )
-            err = 0.0
-            return (val, err)
-        elif match('^overlapDiff$', summary):
-            try:
-                hist = f.get('overlap_diff')
-            except NameError:
-                hist = TH1F('myoverlap', '', 1000, -0.5, 0.5)
-                f.Get('corrTree').Draw('overlapDiff>>myoverlap', '', 'goff')
-            val = hist.GetMean()*100.0
-            err = hist.GetRMS()*100.0
-            return (val, err)
-        else:
-            raise NameError()
-    except NameError:
-        return (float('nan'), float('nan'))
-
 def make_plots(names, bcid, models, fill, version=1, wip=False):
+    jobs = []
     prefix = names[0][:names[0].index('_')]
     names = [name[len(prefix)+1:] for name in names]
     # if version > 1:
@@ -208,64 +205,140 @@ def make_plots(names, bcid, models, fill, version=1, wip=False):
                     json['physics'][fld][name] = get_parameter(fld, f)
                 for fld in mod.fit_parameters:
                     json['fits'][fld][name] = get_fitpar(fld, f)
-                reshists = [(
-                    f.Get('residualHist{0}'.format(c)),
-                    f.Get('dataHist{0}'.format(c)),
-                    f.Get('modelHist{0}'.format(c))
-                ) for c in ('X1', 'Y1', 'X2', 'Y2')]
-                for hres, hdat, hmod in reshists:
-                    hres.SetDirectory(0)
-                    hdat.SetDirectory(0)
-                    hmod.SetDirectory(0)
                 chisq = [(
                     -1.0 if f.get('dof{0}'.format(c)).GetVal()==0 else
                     f.get('chisq{0}'.format(c)).GetVal()
                     / f.get('dof{0}'.format(c)).GetVal()
                 ) for c in ('X1', 'Y1', 'X2', 'Y2')]
-            for (hres, hdat, hmod), csq in zip(reshists, chisq):
-                c = hres.GetName()[-2:]
-                plot = ResidualPlot(hres, fill=fill, workinprogress=wip)
-                pave = plot.add_pave(0.61, 0.79, 0.88, 0.88)
-                pave('Scan {0}, BCID {1}'.format(c, bcid))
-                pave('{0} fit'.format(json['modelname']))
-                pave('#chi^{{2}}/d.o.f. = {0:.4f}'.format(csq))
-                plotname = '{0}_res_{1}_{2}_bcid{3}_{4}'.format(
-                    prefix, name, mod.name(), bcid, c
-                )
-                plot.draw()
-                plot.SaveAs('{0}/{1}.png'.format(path, plotname))
-                plot.SaveAs('{0}/{1}.pdf'.format(path, plotname))
-                plot.Close()
-                plot = CombinedResidualPlot(
-                    hdat, hmod, nbins=50,
-                    maxr=0.012 if fill in (5527, 5563) else 0.04,
-                    fill=fill, workinprogress=wip
-                )
-                plot._y1range = (-1.9, 1.9)
-                plot._y2range = (-0.59, 0.59)
-                pave = plot.add_pave(0.61, 0.815, 0.88, 0.88)
-                pave('Scan {0}, BCID {1}'.format(c, bcid))
-                pave('{0} fit'.format(json['modelname']))
-                plotname = '{0}_comb_{1}_{2}_bcid{3}_{4}'.format(
-                    prefix, name, mod.name(), bcid, c
-                )
-                plot.SetName(plotname)
-                plot._above = True
-                plot.draw()
-                zero = TF1('zero', '0.0', -1.6, 1.6)
-                zero.SetLineColor(1)
-                zero.SetLineWidth(1)
-                zero.SetLineStyle(3)
-                plot.cd(1)
-                zero.Draw('SAME')
-                plot.cd(2)
-                zero.Draw('SAME')
-                plot.cd()
-                plot.SaveAs('{0}/{1}.png'.format(path, plotname))
-                plot.SaveAs('{0}/{1}.pdf'.format(path, plotname))
-                plot.Close()
+                jobs.append({
+                    'source': f.filename, 'path': path, 'prefix': prefix,
+                    'name': name, 'model': mod.name(),
+                    'modelname': json['modelname'], 'bcid': bcid,
+                    'fill': fill, 'wip': wip, 'chisq': chisq
+                })
         with open('{0}/data.json'.format(path), 'w') as f:
             dump(json, f, dump)
+    return jobs
+
+def plot_files(job):
+    files = []
+    for kind in ('res', 'comb'):
+        for c in ('X1', 'Y1', 'X2', 'Y2'):
+            plotname = '{0}_{1}_{2}_{3}_bcid{4}_{5}'.format(
+                job['prefix'], kind, job['name'], job['model'], job['bcid'], c
+            )
+            for ext in ('png', 'pdf'):
+                files.append('{0}/{1}.{2}'.format(job['path'], plotname, ext))
+    return files
+
+def render_plots(job):
+    prefix, name, bcid = job['prefix'], job['name'], job['bcid']
+    path, fill, wip = job['path'], job['fill'], job['wip']
+    with BareRootFile(job['source']) as f:
+        reshists = [(
+            f.Get('residualHist{0}'.format(c)),
+            f.Get('dataHist{0}'.format(c)),
+            f.Get('modelHist{0}'.format(c))
+        ) for c in ('X1', 'Y1', 'X2', 'Y2')]
+        for hres, hdat, hmod in reshists:
+            hres.SetDirectory(0)
+            hdat.SetDirectory(0)
+            hmod.SetDirectory(0)
+    for (hres, hdat, hmod), csq in zip(reshists, job['chisq']):
+        c = hres.GetName()[-2:]
+        plot = ResidualPlot(hres, fill=fill, workinprogress=wip)
+        pave = plot.add_pave(0.61, 0.79, 0.88, 0.88)
+        pave('Scan {0}, BCID {1}'.format(c, bcid))
+        pave('{0} fit'.format(job['modelname']))
+        pave('#chi^{{2}}/d.o.f. = {0:.4f}'.format(csq))
+        plotname = '{0}_res_{1}_{2}_bcid{3}_{4}'.format(
+            prefix, name, job['model'], bcid, c
+        )
+        plot.draw()
+        plot.SaveAs('{0}/{1}.png'.format(path, plotname))
+        plot.SaveAs('{0}/{1}.pdf'.format(path, plotname))
+        plot.Close()
+        plot = CombinedResidualPlot(
+            hdat, hmod, nbins=50,
+            maxr=0.012 if fill in (5527, 5563) else 0.04,
+            fill=fill, workinprogress=wip
+        )
+        plot._y1range = (-1.9, 1.9)
+        plot._y2range = (-0.59, 0.59)
+        pave = plot.add_pave(0.61, 0.815, 0.88, 0.88)
+        pave('Scan {0}, BCID {1}'.format(c, bcid))
+        pave('{0} fit'.format(job['modelname']))
+        plotname = '{0}_comb_{1}_{2}_bcid{3}_{4}'.format(
+            prefix, name, job['model'], bcid, c
+        )
+        plot.SetName(plotname)
+        plot._above = True
+        plot.draw()
+        zero = TF1('zero', '0.0', -1.6, 1.6)
+        zero.SetLineColor(1)
+        zero.SetLineWidth(1)
+        zero.SetLineStyle(3)
+        plot.cd(1)
+        zero.Draw('SAME')
+        plot.cd(2)
+        zero.Draw('SAME')
+        plot.cd()
+        plot.SaveAs('{0}/{1}.png'.format(path, plotname))
+        plot.SaveAs('{0}/{1}.pdf'.format(path, plotname))
+        plot.Close()
+
+def _render(job):
+    try:
+        render_plots(job)
+    except Exception:
+        print '<<< Error ({0}):'.format(job['source'])
+        print_exc()
+        return False
+    return True
+
+def render_all(jobs, ncpu=1, force=False):
+    if not jobs:
+        return
+    gROOT.SetBatch(True)
+    manifestname = 'web/{0}/manifest.json'.format(jobs[0]['prefix'])
+    if exists(manifestname):
+        with open(manifestname) as f:
+            manifest = load(f)
+    else:
+        manifest = {}
+    todo = []
+    for job in jobs:
+        key = '{0}/{1}'.format(job['path'], job['name'])
+        source = {
+            'source': basename(job['source']),
+            'mtime': getmtime(job['source'])
+        }
+        entry = manifest.get(key, {})
+        if not force and all(
+            entry.get(k) == v for k, v in source.iteritems()
+        ) and all(
+            exists(p) and getmtime(p) >= source['mtime']
+            for p in plot_files(job)
+        ):
+            continue
+        todo.append((key, source, job))
+    print '<<< Render {0} of {1} plot sets ({2} up to date)'.format(
+        len(todo), len(jobs), len(jobs)-len(todo)
+    )
+    if ncpu > 1 and len(todo) > 1:
+        pool = Pool(min(ncpu, len(todo)))
+        success = pool.map(_render, [job for __, __, job in todo], chunksize=1)
+        pool.close()
+        pool.join()
+    else:
+        success = [_render(job) for __, __, job in todo]
+    for (key, source, job), ok in zip(todo, success):
+        if ok:
+            manifest[key] = dict(source, outputs=[
+                basename(p) for p in plot_files(job)
+            ])
+    with open(manifestname, 'w') as f:
+        dump(manifest, f, indent=4, sort_keys=True)
 
 def make_summary(names, bcids, models, fill, wip=True):
     prefix = names[0][:names[0].index('_')]
@@ -289,36 +362,30 @@ def make_summary(names, bcids, models, fill, wip=True):
             name: [[None for c in bcids] for m in models] for name in names
         } for s in summary_fields}
     }
+    index = ResultsIndex(dofs={m.name(): m.dof() for m in models})
     for name in names:
         for i, mod in enumerate(models):
+            version = 1
+            if mod.name().startswith('Sup'):
+                version = 2
+            if v3 and mod.name() == 'SupDG':
+                version = 3
+            elif v4 and mod.name() == 'SupDG':
+                version = 4
             for j, bcid in enumerate(bcids):
-                filename = 'BeamImaging_{{0}}_{0}_{1}{{1}}_{2}_bcid{3}'.format(
-                    prefix, name, mod.name(), bcid
+                entry = index.find(
+                    version=version, name='{0}_{1}'.format(prefix, name),
+                    model=mod.name(), bcid=bcid, best=version in (3, 4)
                 )
-                versions = ['v1']
-                # if mod.name() in ('DG', 'TG', 'SupG'):
-                if mod.name().startswith('Sup'):
-                    # versions.append('v2')
-                    versions = ['v2']
-                if v3 and mod.name() == 'SupDG':
-                    # versions.append('v3')
-                    versions = ['v3']
-                elif v4 and mod.name() == 'SupDG':
-                    versions = ['v4']
-                bestchisq = 1.0e9
-                for version in versions:
-                    if version in ('v3', 'v4'):
-                        extra = '_best'
-                    else:
-                        extra = ''
-                    with RootFile(filename.format(version, extra)) as f:
-                        csq = get_summary('chiSq/dof', f, mod)[0]
-                        if isnan(csq) or csq > bestchisq:
-                            continue
-                        for fld, __ in summary_fields:
-                            json['summaries'][fld][name][i][j] = get_summary(
-                                fld, f, mod
-                            )
+                for fld, __ in summary_fields:
+                    field, error, factor = summary_results[fld]
+                    val = index.value(entry, field)
+                    if isnan(val):
+                        continue
+                    err = index.value(entry, error) if error else 0.0
+                    json['summaries'][fld][name][i][j] = (
+                        val*factor, err*factor
+                    )
         corrections = json['summaries']['overlapDiff'][name]
         plot = CorrectionSummary(
             [m.name() for m in models], bcids, corrections, fill=fill,
@@ -441,8 +508,11 @@ def main():
             version = int(argv[j][1:])
         else:
             version = 1
+        ncpu = parse_options(argv)['jobs']
+        jobs = []
         for bcid in bcids:
-            make_plots(names, bcid, models, fill, version=version)
+            jobs += make_plots(names, bcid, models, fill, version=version)
+        render_all(jobs, ncpu=ncpu, force=bool('-force' in argv))
 
 if __name__ == '__main__':
     main()
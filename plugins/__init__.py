@@ -1,6 +1,8 @@
 __all__ = [
     'chisq',
     'dg',
+    'fitresult',
+    'formula',
     'sg',
     'tg',
     'toy',
@@ -6,11 +6,16 @@ chi2FitTo: Perform a chi-square minimization using MyRooChi2Var.
 from lib.compile import require
 require('plugins/src', 'MyRooChi2Var')
 
-from ROOT import Double, MyRooChi2Var as Chi2Var, RooMinimizer
+from ROOT import Double, MyRooChi2Var as Chi2Var, RooFit, RooMinimizer
 
-def chi2FitTo(pdf, data):
-    """Perform a chi-square minimization using MyRooChi2Var."""
-    chi2 = Chi2Var('chi2', 'chi2', pdf, data)
+def chi2FitTo(pdf, data, ncpu=1):
+    """Perform a chi-square minimization using MyRooChi2Var.
+
+    ncpu: Number of processes among which the bins are interleaved.
+    """
+    chi2 = Chi2Var(
+        'chi2', 'chi2', pdf, data, RooFit.NumCPU(ncpu, RooFit.Interleave)
+    )
     m = RooMinimizer(chi2)
     m.setPrintEvalErrors(10)
     m.setPrintLevel(1)
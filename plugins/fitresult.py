@@ -0,0 +1,39 @@
+"""Import FitResultBuilder class from ROOT.
+
+make_fit_result: Create RooFitResult from the output of a minimizer.
+"""
+
+from lib.compile import require
+require('plugins/src', 'FitResultBuilder')
+
+from ROOT import FitResultBuilder, RooArgList, SetOwnership, TMatrixDSym
+
+def make_fit_result(
+    constpars, initpars, finalpars, minnll, edm, status, covqual, covariance
+):
+    """Create a RooFitResult from the output of a minimizer.
+
+    constpars, initpars, finalpars: Lists of RooRealVar with the values of the
+                                    constant parameters, and of the free
+                                    parameters before and after the fit.
+    minnll, edm: Minimum value and estimated distance to minimum.
+    status, covqual: Status of minimization and quality of covariance matrix.
+    covariance: Covariance matrix of the free parameters (nested lists).
+    """
+    arglists = []
+    for pars in (constpars, initpars, finalpars):
+        arglist = RooArgList()
+        for par in pars:
+            arglist.add(par)
+        arglists.append(arglist)
+    matrix = TMatrixDSym(len(finalpars))
+    for i, row in enumerate(covariance):
+        for j, value in enumerate(row):
+            matrix[i][j] = value
+    builder = FitResultBuilder('fitResult', 'Result of fit')
+    result = builder.build(
+        arglists[0], arglists[1], arglists[2], minnll, edm, status, covqual,
+        matrix
+    )
+    SetOwnership(result, True)
+    return result
@@ -0,0 +1,116 @@
+"""Import FunctionVar class from ROOT and compile formulas for it.
+
+translate: Translate formula to C++ expression.
+compile_formula: Compile formula to function and return its address.
+"""
+
+from hashlib import sha1
+from re import findall
+
+from lib.compile import require
+require('plugins/src', 'FunctionVar')
+
+from ROOT import FunctionVar, gInterpreter
+
+functions = {
+    'sqrt': 'TMath::Sqrt', 'exp': 'TMath::Exp', 'log': 'TMath::Log',
+    'sin': 'TMath::Sin', 'cos': 'TMath::Cos', 'tan': 'TMath::Tan',
+    'abs': 'TMath::Abs', 'max': 'TMath::Max', 'min': 'TMath::Min',
+}
+compiled = {}
+
+def translate(formula, names):
+    """Translate a formula in RooFormulaVar syntax to a C++ expression.
+
+    formula: Formula (string) with variables referred to by name.
+    names: List of variable names, the variables are replaced by p[i].
+    Supports +, -, *, /, ^ (power), brackets and the functions listed in
+    functions. Numbers are doubles (as in RooFormulaVar). Raises ValueError
+    on other input.
+    """
+    tokens = findall(
+        r'\d+\.?\d*(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?|\w+|\S', formula
+    )
+    position = [0]
+    def peek():
+        if position[0] < len(tokens):
+            return tokens[position[0]]
+        return None
+    def take(expected=None):
+        token = peek()
+        if token is None or (expected is not None and token != expected):
+            msg = 'translate: Expected {0} in formula! ({1})' \
+                  .format(expected or 'operand', formula)
+            raise ValueError(msg)
+        position[0] += 1
+        return token
+    def expression():
+        result = term()
+        while peek() in ('+', '-'):
+            result = '{0}{1}{2}'.format(result, take(), term())
+        return result
+    def term():
+        result = unary()
+        while peek() in ('*', '/'):
+            result = '{0}{1}{2}'.format(result, take(), unary())
+        return result
+    def unary():
+        if peek() in ('+', '-'):
+            return '({0}{1})'.format(take(), unary())
+        return power()
+    def power():
+        result = atom()
+        if peek() == '^':
+            take()
+            result = 'TMath::Power({0},{1})'.format(result, unary())
+        return result
+    def atom():
+        token = take()
+        if token == '(':
+            result = expression()
+            take(')')
+            return '({0})'.format(result)
+        if token[0].isdigit() or token[0] == '.':
+            # RooFormulaVar treats all numbers as doubles, C++ would use
+            # integer arithmetic for 1/2
+            return 'Double_t({0})'.format(token)
+        if token in names:
+            return 'p[{0}]'.format(names.index(token))
+        if token in functions and peek() == '(':
+            take('(')
+            arguments = [expression()]
+            while peek() == ',':
+                take()
+                arguments.append(expression())
+            take(')')
+            return '{0}({1})'.format(functions[token], ','.join(arguments))
+        msg = 'translate: Unknown symbol {0} in formula! ({1})' \
+              .format(token, formula)
+        raise ValueError(msg)
+    result = expression()
+    if peek() is not None:
+        msg = 'translate: Unexpected {0} in formula! ({1})' \
+              .format(peek(), formula)
+        raise ValueError(msg)
+    return result
+
+def compile_formula(formula, names):
+    """Compile a formula to a C++ function and return its address.
+
+    formula: Formula (string) with variables referred to by name.
+    names: List of variable names in the order of the argument list.
+    Functions are declared to the interpreter once per process and reused for
+    identical expressions.
+    """
+    code = translate(formula, names)
+    if code not in compiled:
+        funcname = 'formula_{0}'.format(sha1(code).hexdigest()[:16])
+        gInterpreter.Declare(
+            '#include "TMath.h"\n'
+            'Double_t {0}(const Double_t* p) {{ return {1}; }}'
+            .format(funcname, code)
+        )
+        compiled[code] = gInterpreter.ProcessLine(
+            '(Long_t) &{0};'.format(funcname)
+        )
+    return compiled[code]
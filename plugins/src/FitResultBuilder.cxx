@@ -0,0 +1,48 @@
+#include "Riostream.h"
+#include "FitResultBuilder.h"
+#include "RooFitResult.h"
+#include "TMath.h"
+#include "TMatrixDSym.h"
+
+#include <vector>
+
+ClassImp(FitResultBuilder)
+
+FitResultBuilder::FitResultBuilder(const char* name, const char* title):
+    RooFitResult(name, title)
+{}
+
+RooFitResult* FitResultBuilder::build(
+    const RooArgList& constPars, const RooArgList& initPars,
+    const RooArgList& finalPars, Double_t minNll, Double_t edm,
+    Int_t status, Int_t covQual, const TMatrixDSym& covariance
+)
+{
+    setConstParList(constPars);
+    setInitParList(initPars);
+    setFinalParList(finalPars);
+    setMinNLL(minNll);
+    setEDM(edm);
+    setStatus(status);
+    setCovQual(covQual);
+
+    // Correlation matrix and global correlation coefficients
+    const Int_t n = covariance.GetNrows();
+    TMatrixDSym correlation(n);
+    TMatrixDSym inverse(covariance);
+    Double_t det;
+    inverse.Invert(&det);
+    std::vector<double> globalCC(n);
+    for (Int_t i=0; i<n; i++)
+    {
+        for (Int_t j=0; j<n; j++)
+            correlation(i, j) = covariance(i, j)/TMath::Sqrt(
+                covariance(i, i)*covariance(j, j)
+            );
+        const Double_t product = covariance(i, i)*inverse(i, i);
+        globalCC[i] = product > 1.0 ? TMath::Sqrt(1.0-1.0/product) : 0.0;
+    }
+    fillCorrMatrix(globalCC, correlation, covariance);
+
+    return new RooFitResult(*this);
+}
@@ -0,0 +1,23 @@
+#ifndef FITRESULTBUILDER
+#define FITRESULTBUILDER
+
+#include "RooArgList.h"
+#include "RooFitResult.h"
+#include "TMatrixDSym.h"
+
+// Assembles a RooFitResult from the output of a minimizer that does not run
+// through RooFit, so that it can be stored like the results of RooFit fits.
+class FitResultBuilder : public RooFitResult {
+public:
+    FitResultBuilder(const char* name=0, const char* title=0);
+    inline virtual ~FitResultBuilder() {};
+    RooFitResult* build(
+        const RooArgList& constPars, const RooArgList& initPars,
+        const RooArgList& finalPars, Double_t minNll, Double_t edm,
+        Int_t status, Int_t covQual, const TMatrixDSym& covariance
+    );
+private:
+    ClassDef(FitResultBuilder, 1)
+};
+
+#endif
@@ -0,0 +1,32 @@
+#include "Riostream.h"
+#include "FunctionVar.h"
+#include "RooAbsReal.h"
+#include "TError.h"
+
+ClassImp(FunctionVar)
+
+FunctionVar::FunctionVar(
+    const char *name, const char *title, const RooArgList& _args,
+    Long_t _function
+):
+    RooAbsReal(name, title),
+    args("args", "args", this),
+    function((FunctionVarFunc) _function)
+{
+    R__ASSERT(_args.getSize() <= maxArgs);
+    args.add(_args);
+}
+
+FunctionVar::FunctionVar(const FunctionVar& other, const char* name):
+    RooAbsReal(other, name),
+    args("args", this, other.args),
+    function(other.function)
+{}
+
+Double_t FunctionVar::evaluate() const
+{
+    Double_t values[maxArgs];
+    for (Int_t i=0; i<args.getSize(); i++)
+        values[i] = ((RooAbsReal&) args[i]).getVal();
+    return function(values);
+}
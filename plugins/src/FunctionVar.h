@@ -0,0 +1,34 @@
+#ifndef FUNCTIONVAR
+#define FUNCTIONVAR
+
+#include "RooAbsReal.h"
+#include "RooArgList.h"
+#include "RooListProxy.h"
+
+// Real-valued function of other variables, evaluated by a compiled function
+// that takes the array of the variable values.
+typedef Double_t (*FunctionVarFunc)(const Double_t*);
+
+class FunctionVar : public RooAbsReal {
+public:
+    FunctionVar() {};
+    FunctionVar(
+        const char *name, const char *title, const RooArgList& _args,
+        Long_t _function
+    );
+    FunctionVar(const FunctionVar& other, const char* name=0);
+    virtual TObject* clone(const char* newname) const {
+        return new FunctionVar(*this, newname);
+    };
+    inline virtual ~FunctionVar() {};
+    static const Int_t maxArgs = 16;
+protected:
+    RooListProxy args;
+    FunctionVarFunc function; //! Compiled function
+
+    Double_t evaluate() const;
+private:
+    ClassDef(FunctionVar, 1)
+};
+
+#endif
@@ -0,0 +1,3 @@
+#ifdef __CINT__
+#pragma link C++ class FunctionVar+;
+#endif
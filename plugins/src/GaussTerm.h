@@ -0,0 +1,129 @@
+#ifndef GAUSSTERM
+#define GAUSSTERM
+
+#include "TMath.h"
+
+// A term of the model functions is the 2D Gaussian (correlated) beam shape
+// of one beam, multiplied with the 1D marginal beam shape of the other beam
+// and convolved with the vertex resolution. The term only depends on the
+// shape parameters, so it is described by five numbers: the elements of the
+// inverse covariance matrix (xx, yy, xy), the normalization and the weight.
+
+// Compute the inverse covariance matrix and normalization of a term.
+// xMargInv and yMargInv are the inverse squared widths of the marginal beam
+// shape (one of them is zero).
+inline void gaussTerm(
+    Double_t* term, Double_t xWidth, Double_t yWidth, Double_t rho,
+    Double_t xMargInv, Double_t yMargInv, Double_t vtxResX, Double_t vtxResY,
+    Double_t weight
+)
+{
+    // Inverse of the beam covariance plus the marginal beam shape
+    const Double_t beamDet = xWidth*xWidth*yWidth*yWidth*(1.0-rho*rho);
+    const Double_t axx = yWidth*yWidth/beamDet + xMargInv;
+    const Double_t ayy = xWidth*xWidth/beamDet + yMargInv;
+    const Double_t axy = -rho*xWidth*yWidth/beamDet;
+    // Its inverse plus the vertex resolution
+    const Double_t aDet = axx*ayy-axy*axy;
+    const Double_t cxx = ayy/aDet + vtxResX*vtxResX;
+    const Double_t cyy = axx/aDet + vtxResY*vtxResY;
+    const Double_t cxy = -axy/aDet;
+    const Double_t cDet = cxx*cyy-cxy*cxy;
+    term[0] = cyy/cDet;
+    term[1] = cxx/cDet;
+    term[2] = -cxy/cDet;
+    term[3] = 1.0/(2*3.14159*TMath::Sqrt(cDet));
+    term[4] = weight;
+}
+
+// Evaluate a term at the given distance from the peak position.
+inline Double_t gaussTermEval(const Double_t* term, Double_t x, Double_t y)
+{
+    return term[4]*term[3]*TMath::Exp(
+        -0.5*(x*x*term[0]+y*y*term[1]+2*term[2]*x*y)
+    );
+}
+
+// Positive nodes and weights of the 48-point Gauss-Legendre rule
+const Double_t gaussLegendreNodes[24] = {
+    9.9877100725242607e-01, 9.9353017226635076e-01, 9.8412458372282685e-01,
+    9.7059159254624727e-01, 9.5298770316043080e-01, 9.3138669070655433e-01,
+    9.0587913671556963e-01, 8.7657202027424785e-01, 8.4358826162439349e-01,
+    8.0706620402944262e-01, 7.6715903251574036e-01, 7.2403413092381463e-01,
+    6.7787237963266389e-01, 6.2886739677651360e-01, 5.7722472608397268e-01,
+    5.2316097472223300e-01, 4.6690290475095841e-01, 4.0868648199071672e-01,
+    3.4875588629216075e-01, 2.8736248735545555e-01, 2.2476379039468905e-01,
+    1.6122235606889171e-01, 9.7004699209462697e-02, 3.2380170962869367e-02
+};
+const Double_t gaussLegendreWeights[24] = {
+    3.1533460523059625e-03, 7.3275539012762078e-03, 1.1477234579234590e-02,
+    1.5579315722943856e-02, 1.9616160457355571e-02, 2.3570760839324342e-02,
+    2.7426509708356882e-02, 3.1167227832798100e-02, 3.4777222564770449e-02,
+    3.8241351065830723e-02, 4.1545082943464776e-02, 4.4674560856694294e-02,
+    4.7616658492490548e-02, 5.0359035553854473e-02, 5.2890189485193660e-02,
+    5.5199503699984172e-02, 5.7277292100403152e-02, 5.9114839698395566e-02,
+    6.0704439165893860e-02, 6.2039423159892679e-02, 6.3114192286254048e-02,
+    6.3924238584648171e-02, 6.4466164435950102e-02, 6.4737696812683862e-02
+};
+
+// Integrate a term over a rectangle (relative to the peak position).
+// The integral over y is done exactly using the conditional distribution for
+// given x, the one over x with the 48-point Gauss-Legendre rule within eight
+// standard deviations, which is accurate to better than 1e-10.
+inline Double_t gaussTermIntegral(
+    const Double_t* term, Double_t xlo, Double_t xhi, Double_t ylo,
+    Double_t yhi
+)
+{
+    // Covariance matrix
+    const Double_t det = term[0]*term[1]-term[2]*term[2];
+    const Double_t cxx = term[1]/det;
+    const Double_t cyy = term[0]/det;
+    const Double_t cxy = -term[2]/det;
+    // Conditional distribution of y for given x
+    const Double_t slope = cxy/cxx;
+    const Double_t yScale = TMath::Sqrt(2.0*(cyy-cxy*slope));
+
+    const Double_t xSigma = TMath::Sqrt(cxx);
+    xlo = TMath::Max(xlo, -8.0*xSigma);
+    xhi = TMath::Min(xhi, 8.0*xSigma);
+    if (xlo >= xhi)
+        return 0.0;
+    const Double_t center = 0.5*(xhi+xlo);
+    const Double_t halfWidth = 0.5*(xhi-xlo);
+    Double_t sum = 0.0;
+    for (Int_t i=0; i<24; i++)
+    {
+        for (Int_t sign=-1; sign<=1; sign+=2)
+        {
+            const Double_t x = center+sign*halfWidth*gaussLegendreNodes[i];
+            sum += gaussLegendreWeights[i]*TMath::Exp(-0.5*x*x/cxx)*(
+                TMath::Erf((yhi-slope*x)/yScale)
+                - TMath::Erf((ylo-slope*x)/yScale)
+            );
+        }
+    }
+    // Integral over the full plane times probability content of rectangle
+    return term[4]*term[3]*2.0*TMath::Pi()/TMath::Sqrt(det)
+           *0.5*halfWidth*sum/(TMath::Sqrt(2.0*TMath::Pi())*xSigma);
+}
+
+// Check whether parameter values differ from the cached ones and update
+// the cache if so.
+inline Bool_t gaussTermDirty(
+    Double_t* cache, const Double_t* values, Int_t n
+)
+{
+    Bool_t dirty = kFALSE;
+    for (Int_t i=0; i<n; i++)
+    {
+        if (cache[i] != values[i])
+        {
+            cache[i] = values[i];
+            dirty = kTRUE;
+        }
+    }
+    return dirty;
+}
+
+#endif
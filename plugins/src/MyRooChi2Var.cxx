@@ -26,6 +26,8 @@
 #include "RooAbsDataStore.h"
 #include "RooAddition.h"
 
+#include <algorithm>
+
 using namespace std;
 
 ClassImp(MyRooChi2Var)
@@ -39,7 +41,8 @@ MyRooChi2Var::MyRooChi2Var(
     RooChi2Var(
         name, title, func, data, arg1, arg2, arg3,
         arg4, arg5, arg6, arg7, arg8, arg9
-    )
+    ),
+    _sparseValid(kFALSE)
 {}
 
 MyRooChi2Var::MyRooChi2Var(
@@ -51,7 +54,8 @@ MyRooChi2Var::MyRooChi2Var(
     RooChi2Var(
         name, title, pdf, data, arg1, arg2, arg3,
         arg4, arg5, arg6, arg7, arg8, arg9
-    )
+    ),
+    _sparseValid(kFALSE)
 {}
 
 MyRooChi2Var::MyRooChi2Var(
@@ -63,7 +67,8 @@ MyRooChi2Var::MyRooChi2Var(
     RooChi2Var(
         name, title, pdf, data, extended, rangeName, addCoefRangeName,
         nCPU, interleave, verbose, splitCutRange, etype
-    )
+    ),
+    _sparseValid(kFALSE)
 {}
 
 MyRooChi2Var::MyRooChi2Var(
@@ -75,25 +80,59 @@ MyRooChi2Var::MyRooChi2Var(
     RooChi2Var(
         name, title, func, data, projDeps, funcMode, rangeName,
         addCoefRangeName, nCPU, interleave, verbose, splitCutRange, etype
-    )
+    ),
+    _sparseValid(kFALSE)
 {}
 
 MyRooChi2Var::MyRooChi2Var(const MyRooChi2Var& other, const char* name):
-    RooChi2Var(other, name)
+    RooChi2Var(other, name),
+    _sparseValid(kFALSE)
 {}
 
 MyRooChi2Var::~MyRooChi2Var()
 {}
 
+void MyRooChi2Var::buildSparseBins() const
+{
+    // The data do not change during the fit, so the non-empty bins and their
+    // volumes and errors are collected once. Bins are kept in index order.
+    RooDataHist* hdata = (RooDataHist*) _dataClone;
+    _sparseIndex.clear();
+    _sparseWeight.clear();
+    _sparseVolume.clear();
+    _sparseErrLo.clear();
+    _sparseErrHi.clear();
+    for(Int_t i=0; i<hdata->numEntries(); i++)
+    {
+        hdata->get(i);
+        if (!hdata->valid())
+            continue;
+        const Double_t nData = hdata->weight();
+        if (0.0 == nData * nData)
+            continue;
+        Double_t eIntLo(0), eIntHi(0);
+        if(_etype != RooAbsData::Expected)
+            hdata->weightError(eIntLo, eIntHi, _etype);
+        _sparseIndex.push_back(i);
+        _sparseWeight.push_back(nData);
+        _sparseVolume.push_back(hdata->binVolume());
+        _sparseErrLo.push_back(eIntLo);
+        _sparseErrHi.push_back(eIntHi);
+    }
+    _sparseValid = kTRUE;
+}
+
 Double_t MyRooChi2Var::evaluatePartition(
     Int_t firstEvent, Int_t lastEvent, Int_t stepSize
 ) const
 {
-    Int_t i;
     Double_t result(0), carry(0);
 
     _dataClone->store()->recalculateCache(_projDeps, firstEvent, lastEvent, stepSize, kFALSE);
 
+    if (!_sparseValid)
+        buildSparseBins();
+
     Double_t normFactor(1);
     switch (_funcMode)
     {
@@ -108,33 +147,29 @@ Double_t MyRooChi2Var::evaluatePartition(
             break;
     }
 
+    // Only non-empty bins contribute, so the model is evaluated only there.
     RooDataHist* hdata = (RooDataHist*) _dataClone;
-    for(i=firstEvent; i<lastEvent; i+=stepSize)
+    const UInt_t nSparse = _sparseIndex.size();
+    UInt_t k = lower_bound(
+        _sparseIndex.begin(), _sparseIndex.end(), firstEvent
+    ) - _sparseIndex.begin();
+    for(; k<nSparse && _sparseIndex[k]<lastEvent; k++)
     {
-        hdata->get(i);
-        if (!hdata->valid())
+        const Int_t i = _sparseIndex[k];
+        if ((i-firstEvent) % stepSize)
             continue;
+        hdata->get(i);
 
-        const Double_t nData = hdata->weight();
-        const Double_t nPdf = _funcClone->getVal(_normSet) * normFactor * hdata->binVolume();
+        const Double_t nData = _sparseWeight[k];
+        const Double_t nPdf = _funcClone->getVal(_normSet) * normFactor * _sparseVolume[k];
         const Double_t eExt = nPdf-nData;
 
         Double_t eInt;
         if(_etype != RooAbsData::Expected)
-        {
-            Double_t eIntLo, eIntHi;
-            hdata->weightError(eIntLo, eIntHi, _etype);
-            eInt = (eExt>0) ? eIntHi : eIntLo;
-        }
+            eInt = (eExt>0) ? _sparseErrHi[k] : _sparseErrLo[k];
         else
-        {
             eInt = sqrt(nPdf);
-        }
 
-        if (0.0 == nData * nData)
-            continue;
-        if (0.0 == eInt * eInt && 0.0 == nData * nData && 0.0 == nPdf * nPdf)
-            continue;
         if (0.0 == eInt * eInt)
         {
             coutE(Eval) << "RooChi2Var::RooChi2Var(" << GetName()
@@ -24,6 +24,8 @@
 #include "RooDataHist.h"
 #include "RooAbsPdf.h"
 
+#include <vector>
+
 class MyRooChi2Var : public RooChi2Var {
 public:
     MyRooChi2Var(
@@ -77,7 +79,14 @@ protected:
         Int_t firstEvent, Int_t lastEvent, Int_t stepSize
     ) const;
 private:
-    ClassDef(MyRooChi2Var, 1)
+    void buildSparseBins() const;
+    mutable Bool_t _sparseValid; //! Non-empty bins have been collected
+    mutable std::vector<Int_t> _sparseIndex; //! Indices of non-empty bins
+    mutable std::vector<Double_t> _sparseWeight; //! Contents of non-empty bins
+    mutable std::vector<Double_t> _sparseVolume; //! Volumes of non-empty bins
+    mutable std::vector<Double_t> _sparseErrLo; //! Lower errors of non-empty bins
+    mutable std::vector<Double_t> _sparseErrHi; //! Upper errors of non-empty bins
+    ClassDef(MyRooChi2Var, 2)
 };
 
 #endif
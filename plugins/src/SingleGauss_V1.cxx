@@ -4,10 +4,14 @@
 #include "RooAbsCategory.h"
 #include <math.h>
 #include "TMath.h"
-#include "TMatrix.h"
+#include "GaussTerm.h"
+#include "RooArgSet.h"
 
 ClassImp(SingleGauss_V1)
 
+Long64_t SingleGauss_V1::evalCount = 0;
+Long64_t SingleGauss_V1::integralCount = 0;
+
 SingleGauss_V1::SingleGauss_V1(
     const char *name, const char *title,
     RooAbsReal& _xVar,
@@ -66,32 +70,49 @@ SingleGauss_V1::SingleGauss_V1(const SingleGauss_V1& other, const char* name):
     vtxResY("vtxResY", this, other.vtxResY)
 {}
 
+void SingleGauss_V1::updateTerms() const
+{
+    const Double_t values[6] = {
+        rho_N1, xWidthN1, yWidthN1, yWidthN2, vtxResX, vtxResY
+    };
+    if (!gaussTermDirty(_cacheValues, values, 6) && _cacheValid)
+        return;
+    const Double_t margInvN2 = 1.0/TMath::Power(yWidthN2, 2.0);
+    gaussTerm(
+        _terms[0], xWidthN1, yWidthN1, rho_N1, 0.0, margInvN2,
+        vtxResX, vtxResY, 1.0
+    );
+    _cacheValid = kTRUE;
+}
+
 Double_t SingleGauss_V1::evaluate() const
 {
-    TMatrix beamN1(2,2);
-    beamN1(0,0) = TMath::Power(xWidthN1, 2.0);
-    beamN1(1,1) = TMath::Power(yWidthN1, 2.0);
-    beamN1(1,0) = rho_N1*xWidthN1*yWidthN1;
-    beamN1(0,1) = rho_N1*xWidthN1*yWidthN1;
-    TMatrix beamN1_Inv(TMatrix::kInverted, beamN1);
-    TMatrix beamN2MargInv(2,2);
-    beamN2MargInv(0,0) = 0.0;
-    beamN2MargInv(1,1) = 1./TMath::Power(yWidthN2, 2.0);
-    beamN2MargInv(0,1) = 0.0;
-    beamN2MargInv(1,0) = 0.0;
-    TMatrix vtxResSq(2,2);
-    vtxResSq(0,0) = TMath::Power(vtxResX, 2.0);
-    vtxResSq(1,1) = TMath::Power(vtxResY, 2.0);
-    vtxResSq(0,1) = 0.0;
-    vtxResSq(1,0) = 0.0;
-    TMatrix sigmaN1N2FinalInv(2,2);
-    sigmaN1N2FinalInv = ((beamN1_Inv+beamN2MargInv).Invert()+vtxResSq).Invert();
+    evalCount++;
+    updateTerms();
+    const Double_t x = xVar-x0;
+    const Double_t y = yVar-y0;
+    return gaussTermEval(_terms[0], x, y);
+}
 
-    fitFuncN1N2->SetParameter(0, sigmaN1N2FinalInv(0,0));
-    fitFuncN1N2->SetParameter(1, sigmaN1N2FinalInv(1,1));
-    fitFuncN1N2->SetParameter(2, sigmaN1N2FinalInv(1,0));
-    fitFuncN1N2->SetParameter(3, (sigmaN1N2FinalInv.Invert()).Determinant());
+Int_t SingleGauss_V1::getAnalyticalIntegral(
+    RooArgSet& allVars, RooArgSet& analVars, const char* /*rangeName*/
+) const
+{
+    if (matchArgs(allVars, analVars, xVar, yVar))
+        return 1;
+    return 0;
+}
 
-    double combVal = fitFuncN1N2->Eval(xVar-x0, yVar-y0);
-    return combVal;
+Double_t SingleGauss_V1::analyticalIntegral(
+    Int_t code, const char* rangeName
+) const
+{
+    R__ASSERT(code == 1);
+    integralCount++;
+    updateTerms();
+    const Double_t xlo = xVar.min(rangeName)-x0;
+    const Double_t xhi = xVar.max(rangeName)-x0;
+    const Double_t ylo = yVar.min(rangeName)-y0;
+    const Double_t yhi = yVar.max(rangeName)-y0;
+    return gaussTermIntegral(_terms[0], xlo, xhi, ylo, yhi);
 }
@@ -6,7 +6,6 @@
 #include "RooCategoryProxy.h"
 #include "RooAbsReal.h"
 #include "RooAbsCategory.h"
-#include "TF2.h"
 
 class TripleGauss_V1 : public RooAbsPdf {
 public:
@@ -65,6 +64,12 @@ public:
         return new TripleGauss_V1(*this, newname);
     };
     inline virtual ~TripleGauss_V1() {};
+    Int_t getAnalyticalIntegral(
+        RooArgSet& allVars, RooArgSet& analVars, const char* rangeName=0
+    ) const;
+    Double_t analyticalIntegral(Int_t code, const char* rangeName=0) const;
+    static Long64_t evalCount; // Number of evaluations (for profiling)
+    static Long64_t integralCount; // Number of integrals (for profiling)
 protected:
     RooRealProxy xVar;
     RooRealProxy yVar;
@@ -89,19 +94,14 @@ protected:
     RooRealProxy vtxResX;
     RooRealProxy vtxResY;
 
-    TF2 *fitFuncN1N2 = new TF2("fitFuncN1N2", "[4]*1./(2*3.14159*TMath::Sqrt([3]))*TMath::Exp(-0.5*(TMath::Power(x[0],2.0)*[0]+TMath::Power(x[1],2.0)*[1]+2*[2]*x[0]*x[1]))", -30, 30, -30, 30);
-    TF2 *fitFuncN1M2 = new TF2("fitFuncN1M2", "[4]*1./(2*3.14159*TMath::Sqrt([3]))*TMath::Exp(-0.5*(TMath::Power(x[0],2.0)*[0]+TMath::Power(x[1],2.0)*[1]+2*[2]*x[0]*x[1]))", -30, 30, -30, 30);
-    TF2 *fitFuncN1W2 = new TF2("fitFuncN1W2", "[4]*1./(2*3.14159*TMath::Sqrt([3]))*TMath::Exp(-0.5*(TMath::Power(x[0],2.0)*[0]+TMath::Power(x[1],2.0)*[1]+2*[2]*x[0]*x[1]))", -30, 30, -30, 30);
-    TF2 *fitFuncM1N2 = new TF2("fitFuncM1N2", "[4]*1./(2*3.14159*TMath::Sqrt([3]))*TMath::Exp(-0.5*(TMath::Power(x[0],2.0)*[0]+TMath::Power(x[1],2.0)*[1]+2*[2]*x[0]*x[1]))", -30, 30, -30, 30);
-    TF2 *fitFuncM1M2 = new TF2("fitFuncM1M2", "[4]*1./(2*3.14159*TMath::Sqrt([3]))*TMath::Exp(-0.5*(TMath::Power(x[0],2.0)*[0]+TMath::Power(x[1],2.0)*[1]+2*[2]*x[0]*x[1]))", -30, 30, -30, 30);
-    TF2 *fitFuncM1W2 = new TF2("fitFuncM1W2", "[4]*1./(2*3.14159*TMath::Sqrt([3]))*TMath::Exp(-0.5*(TMath::Power(x[0],2.0)*[0]+TMath::Power(x[1],2.0)*[1]+2*[2]*x[0]*x[1]))", -30, 30, -30, 30);
-    TF2 *fitFuncW1N2 = new TF2("fitFuncW1N2", "[4]*1./(2*3.14159*TMath::Sqrt([3]))*TMath::Exp(-0.5*(TMath::Power(x[0],2.0)*[0]+TMath::Power(x[1],2.0)*[1]+2*[2]*x[0]*x[1]))", -30, 30, -30, 30);
-    TF2 *fitFuncW1M2 = new TF2("fitFuncW1M2", "[4]*1./(2*3.14159*TMath::Sqrt([3]))*TMath::Exp(-0.5*(TMath::Power(x[0],2.0)*[0]+TMath::Power(x[1],2.0)*[1]+2*[2]*x[0]*x[1]))", -30, 30, -30, 30);
-    TF2 *fitFuncW1W2 = new TF2("fitFuncW1W2", "[4]*1./(2*3.14159*TMath::Sqrt([3]))*TMath::Exp(-0.5*(TMath::Power(x[0],2.0)*[0]+TMath::Power(x[1],2.0)*[1]+2*[2]*x[0]*x[1]))", -30, 30, -30, 30);
+    mutable Bool_t _cacheValid = kFALSE; //! Cached terms are up to date
+    mutable Double_t _cacheValues[18]; //! Parameter values of cached terms
+    mutable Double_t _terms[9][5]; //! Cached terms (see GaussTerm.h)
 
+    void updateTerms() const;
     Double_t evaluate() const;
 private:
-    ClassDef(TripleGauss_V1, 1)
+    ClassDef(TripleGauss_V1, 2)
 };
 
 #endif
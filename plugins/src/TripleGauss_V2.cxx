@@ -4,10 +4,14 @@
 #include "RooAbsCategory.h"
 #include <math.h>
 #include "TMath.h"
-#include "TMatrix.h"
+#include "GaussTerm.h"
+#include "RooArgSet.h"
 
 ClassImp(TripleGauss_V2)
 
+Long64_t TripleGauss_V2::evalCount = 0;
+Long64_t TripleGauss_V2::integralCount = 0;
+
 TripleGauss_V2::TripleGauss_V2(
     const char *name, const char *title,
     RooAbsReal& _xVar,
@@ -116,127 +120,91 @@ TripleGauss_V2::TripleGauss_V2(const TripleGauss_V2& other, const char* name):
     vtxResY("vtxResY", this, other.vtxResY)
 {}
 
-Double_t TripleGauss_V2::evaluate() const
+void TripleGauss_V2::updateTerms() const
 {
-    TMatrix beamN1(2,2);
-    beamN1(0,0) = TMath::Power(xWidthN1, 2.0);
-    beamN1(1,1) = TMath::Power(yWidthN1, 2.0);
-    beamN1(1,0) = rho_N1*xWidthN1*yWidthN1;
-    beamN1(0,1) = rho_N1*xWidthN1*yWidthN1;
-    TMatrix beamM1(2,2);
-    beamM1(0,0) = TMath::Power(xWidthM1, 2.0);
-    beamM1(1,1) = TMath::Power(yWidthM1, 2.0);
-    beamM1(1,0) = rho_M1*xWidthM1*yWidthM1;
-    beamM1(0,1) = rho_M1*xWidthM1*yWidthM1;
-    TMatrix beamW1(2,2);
-    beamW1(0,0) = TMath::Power(xWidthW1, 2.0);
-    beamW1(1,1) = TMath::Power(yWidthW1, 2.0);
-    beamW1(1,0) = rho_W1*xWidthW1*yWidthW1;
-    beamW1(0,1) = rho_W1*xWidthW1*yWidthW1;
-    TMatrix beamN1_Inv(TMatrix::kInverted, beamN1);
-    TMatrix beamM1_Inv(TMatrix::kInverted, beamM1);
-    TMatrix beamW1_Inv(TMatrix::kInverted, beamW1);
-    TMatrix beamN2MargInv(2,2);
-    beamN2MargInv(0,0) = 1.0/TMath::Power(yWidthN2, 2.0);
-    beamN2MargInv(1,1) = 0.0;
-    beamN2MargInv(0,1) = 0.0;
-    beamN2MargInv(1,0) = 0.0;
-    TMatrix beamM2MargInv(2,2);
-    beamM2MargInv(0,0) = 1.0/TMath::Power(yWidthM2, 2.0);
-    beamM2MargInv(1,1) = 0.0;
-    beamM2MargInv(0,1) = 0.0;
-    beamM2MargInv(1,0) = 0.0;
-    TMatrix beamW2MargInv(2,2);
-    beamW2MargInv(0,0) = 1.0/TMath::Power(yWidthW2, 2.0);
-    beamW2MargInv(1,1) = 0.0;
-    beamW2MargInv(0,1) = 0.0;
-    beamW2MargInv(1,0) = 0.0;
-    TMatrix vtxResSq(2,2);
-    vtxResSq(0,0) = TMath::Power(vtxResX, 2.0);
-    vtxResSq(1,1) = TMath::Power(vtxResY, 2.0);
-    vtxResSq(0,1) = 0.0;
-    vtxResSq(1,0) = 0.0;
-    TMatrix sigmaN1N2FinalInv(2,2);
-    TMatrix sigmaN1M2FinalInv(2,2);
-    TMatrix sigmaN1W2FinalInv(2,2);
-    TMatrix sigmaM1N2FinalInv(2,2);
-    TMatrix sigmaM1M2FinalInv(2,2);
-    TMatrix sigmaM1W2FinalInv(2,2);
-    TMatrix sigmaW1N2FinalInv(2,2);
-    TMatrix sigmaW1M2FinalInv(2,2);
-    TMatrix sigmaW1W2FinalInv(2,2);
-    sigmaN1N2FinalInv = ((beamN1_Inv+beamN2MargInv).Invert()+vtxResSq).Invert();
-    sigmaN1M2FinalInv = ((beamN1_Inv+beamM2MargInv).Invert()+vtxResSq).Invert();
-    sigmaN1W2FinalInv = ((beamN1_Inv+beamW2MargInv).Invert()+vtxResSq).Invert();
-    sigmaM1N2FinalInv = ((beamM1_Inv+beamN2MargInv).Invert()+vtxResSq).Invert();
-    sigmaM1M2FinalInv = ((beamM1_Inv+beamM2MargInv).Invert()+vtxResSq).Invert();
-    sigmaM1W2FinalInv = ((beamM1_Inv+beamW2MargInv).Invert()+vtxResSq).Invert();
-    sigmaW1N2FinalInv = ((beamW1_Inv+beamN2MargInv).Invert()+vtxResSq).Invert();
-    sigmaW1M2FinalInv = ((beamW1_Inv+beamM2MargInv).Invert()+vtxResSq).Invert();
-    sigmaW1W2FinalInv = ((beamW1_Inv+beamW2MargInv).Invert()+vtxResSq).Invert();
-
-    fitFuncN1N2->SetParameter(0, sigmaN1N2FinalInv(0,0));
-    fitFuncN1N2->SetParameter(1, sigmaN1N2FinalInv(1,1));
-    fitFuncN1N2->SetParameter(2, sigmaN1N2FinalInv(1,0));
-    fitFuncN1N2->SetParameter(3, (sigmaN1N2FinalInv.Invert()).Determinant());
-    fitFuncN1N2->SetParameter(4, w1N*w2N);
-
-    fitFuncN1M2->SetParameter(0, sigmaN1M2FinalInv(0,0));
-    fitFuncN1M2->SetParameter(1, sigmaN1M2FinalInv(1,1));
-    fitFuncN1M2->SetParameter(2, sigmaN1M2FinalInv(1,0));
-    fitFuncN1M2->SetParameter(3, (sigmaN1M2FinalInv.Invert()).Determinant());
-    fitFuncN1M2->SetParameter(4, w1N*w2M);
-
-    fitFuncN1W2->SetParameter(0, sigmaN1W2FinalInv(0,0));
-    fitFuncN1W2->SetParameter(1, sigmaN1W2FinalInv(1,1));
-    fitFuncN1W2->SetParameter(2, sigmaN1W2FinalInv(1,0));
-    fitFuncN1W2->SetParameter(3, (sigmaN1W2FinalInv.Invert()).Determinant());
-    fitFuncN1W2->SetParameter(4, w1N*(1.0-w2N-w2M));
-
-    fitFuncM1N2->SetParameter(0, sigmaM1N2FinalInv(0,0));
-    fitFuncM1N2->SetParameter(1, sigmaM1N2FinalInv(1,1));
-    fitFuncM1N2->SetParameter(2, sigmaM1N2FinalInv(1,0));
-    fitFuncM1N2->SetParameter(3, (sigmaM1N2FinalInv.Invert()).Determinant());
-    fitFuncM1N2->SetParameter(4, w1M*w2N);
-
-    fitFuncM1M2->SetParameter(0, sigmaM1M2FinalInv(0,0));
-    fitFuncM1M2->SetParameter(1, sigmaM1M2FinalInv(1,1));
-    fitFuncM1M2->SetParameter(2, sigmaM1M2FinalInv(1,0));
-    fitFuncM1M2->SetParameter(3, (sigmaM1M2FinalInv.Invert()).Determinant());
-    fitFuncM1M2->SetParameter(4, w1M*w2M);
-
-    fitFuncM1W2->SetParameter(0, sigmaM1W2FinalInv(0,0));
-    fitFuncM1W2->SetParameter(1, sigmaM1W2FinalInv(1,1));
-    fitFuncM1W2->SetParameter(2, sigmaM1W2FinalInv(1,0));
-    fitFuncM1W2->SetParameter(3, (sigmaM1W2FinalInv.Invert()).Determinant());
-    fitFuncM1W2->SetParameter(4, w1M*(1.0-w2N-w2M));
-
-    fitFuncW1N2->SetParameter(0, sigmaW1N2FinalInv(0,0));
-    fitFuncW1N2->SetParameter(1, sigmaW1N2FinalInv(1,1));
-    fitFuncW1N2->SetParameter(2, sigmaW1N2FinalInv(1,0));
-    fitFuncW1N2->SetParameter(3, (sigmaW1N2FinalInv.Invert()).Determinant());
-    fitFuncW1N2->SetParameter(4, (1.0-w1N-w1M)*w2N);
+    const Double_t values[18] = {
+        w1N, w1M, rho_N1, xWidthN1, yWidthN1, rho_M1, xWidthM1, yWidthM1,
+        rho_W1, xWidthW1, yWidthW1, w2N, w2M, yWidthN2, yWidthM2, yWidthW2,
+        vtxResX, vtxResY
+    };
+    if (!gaussTermDirty(_cacheValues, values, 18) && _cacheValid)
+        return;
+    const Double_t margInvN2 = 1.0/TMath::Power(yWidthN2, 2.0);
+    const Double_t margInvM2 = 1.0/TMath::Power(yWidthM2, 2.0);
+    const Double_t margInvW2 = 1.0/TMath::Power(yWidthW2, 2.0);
+    gaussTerm(
+        _terms[0], xWidthN1, yWidthN1, rho_N1, margInvN2, 0.0,
+        vtxResX, vtxResY, w1N*w2N
+    );
+    gaussTerm(
+        _terms[1], xWidthN1, yWidthN1, rho_N1, margInvM2, 0.0,
+        vtxResX, vtxResY, w1N*w2M
+    );
+    gaussTerm(
+        _terms[2], xWidthN1, yWidthN1, rho_N1, margInvW2, 0.0,
+        vtxResX, vtxResY, w1N*(1.0-w2N-w2M)
+    );
+    gaussTerm(
+        _terms[3], xWidthM1, yWidthM1, rho_M1, margInvN2, 0.0,
+        vtxResX, vtxResY, w1M*w2N
+    );
+    gaussTerm(
+        _terms[4], xWidthM1, yWidthM1, rho_M1, margInvM2, 0.0,
+        vtxResX, vtxResY, w1M*w2M
+    );
+    gaussTerm(
+        _terms[5], xWidthM1, yWidthM1, rho_M1, margInvW2, 0.0,
+        vtxResX, vtxResY, w1M*(1.0-w2N-w2M)
+    );
+    gaussTerm(
+        _terms[6], xWidthW1, yWidthW1, rho_W1, margInvN2, 0.0,
+        vtxResX, vtxResY, (1.0-w1N-w1M)*w2N
+    );
+    gaussTerm(
+        _terms[7], xWidthW1, yWidthW1, rho_W1, margInvM2, 0.0,
+        vtxResX, vtxResY, (1.0-w1N-w1M)*w2M
+    );
+    gaussTerm(
+        _terms[8], xWidthW1, yWidthW1, rho_W1, margInvW2, 0.0,
+        vtxResX, vtxResY, (1.0-w1N-w1M)*(1.0-w2N-w2M)
+    );
+    _cacheValid = kTRUE;
+}
 
-    fitFuncW1M2->SetParameter(0, sigmaW1M2FinalInv(0,0));
-    fitFuncW1M2->SetParameter(1, sigmaW1M2FinalInv(1,1));
-    fitFuncW1M2->SetParameter(2, sigmaW1M2FinalInv(1,0));
-    fitFuncW1M2->SetParameter(3, (sigmaW1M2FinalInv.Invert()).Determinant());
-    fitFuncW1M2->SetParameter(4, (1.0-w1N-w1M)*w2M);
+Double_t TripleGauss_V2::evaluate() const
+{
+    evalCount++;
+    updateTerms();
+    const Double_t x = xVar-x0;
+    const Double_t y = yVar-y0;
+    Double_t combVal = 0.0;
+    for (Int_t i=0; i<9; i++)
+        combVal += gaussTermEval(_terms[i], x, y);
+    return combVal;
+}
 
-    fitFuncW1W2->SetParameter(0, sigmaW1W2FinalInv(0,0));
-    fitFuncW1W2->SetParameter(1, sigmaW1W2FinalInv(1,1));
-    fitFuncW1W2->SetParameter(2, sigmaW1W2FinalInv(1,0));
-    fitFuncW1W2->SetParameter(3, (sigmaW1W2FinalInv.Invert()).Determinant());
-    fitFuncW1W2->SetParameter(4, (1.0-w1N-w1M)*(1.0-w2N-w2M));
+Int_t TripleGauss_V2::getAnalyticalIntegral(
+    RooArgSet& allVars, RooArgSet& analVars, const char* /*rangeName*/
+) const
+{
+    if (matchArgs(allVars, analVars, xVar, yVar))
+        return 1;
+    return 0;
+}
 
-    double combVal = fitFuncN1N2->Eval(xVar-x0, yVar-y0)
-                   + fitFuncN1M2->Eval(xVar-x0, yVar-y0)
-                   + fitFuncN1W2->Eval(xVar-x0, yVar-y0)
-                   + fitFuncM1N2->Eval(xVar-x0, yVar-y0)
-                   + fitFuncM1M2->Eval(xVar-x0, yVar-y0)
-                   + fitFuncM1W2->Eval(xVar-x0, yVar-y0)
-                   + fitFuncW1N2->Eval(xVar-x0, yVar-y0)
-                   + fitFuncW1M2->Eval(xVar-x0, yVar-y0)
-                   + fitFuncW1W2->Eval(xVar-x0, yVar-y0);
-    return combVal;
+Double_t TripleGauss_V2::analyticalIntegral(
+    Int_t code, const char* rangeName
+) const
+{
+    R__ASSERT(code == 1);
+    integralCount++;
+    updateTerms();
+    const Double_t xlo = xVar.min(rangeName)-x0;
+    const Double_t xhi = xVar.max(rangeName)-x0;
+    const Double_t ylo = yVar.min(rangeName)-y0;
+    const Double_t yhi = yVar.max(rangeName)-y0;
+    Double_t integral = 0.0;
+    for (Int_t i=0; i<9; i++)
+        integral += gaussTermIntegral(_terms[i], xlo, xhi, ylo, yhi);
+    return integral;
 }
@@ -1,18 +1,27 @@
 from json import dump, load
-from os import listdir, mkdir
+from os import listdir, mkdir, stat
 from os.path import exists
+from re import search, subn
+from shutil import rmtree
 from string import replace
 from sys import argv
 
 from ROOT import TChain, TH1F
 
-from lib.io import BareRootFile, NamedFloat, NamedString, Timestamp
-from lib.prepare import make_histograms, make_vdmhistos
+from lib.incremental import HistogramAccumulator
+from lib.io import (
+    BareRootFile, NamedFloat, NamedString, shard_name, Timestamp
+)
+from lib.prepare import (
+    binnings, make_histograms, make_vdmhistos, quicklook_name,
+    rebin_histograms
+)
 
 def prepare_histograms(
     configfile, outputpath, suffix, nbins, mintrk, scaling=1.0, verbose=False,
     stepsize=None, stepsize1Y=None, stepsize2X=None, stepsize2Y=None,
-    extracond=None, singlepair=False
+    extracond=None, singlepair=False, derive=(), steps=None, quicklook=None,
+    shards=False
 ):
     scans = ['1X', '1Y', '2X', '2Y']
     if singlepair:
@@ -30,16 +39,25 @@ def prepare_histograms(
     yerror = TH1F('yerror', '', 100, 0.0, 0.03)
     histograms = []
     if stepsize is None:
-        steps = False
+        vdmsteps = False
     elif None in (stepsize1Y, stepsize2X, stepsize2Y):
-        steps = {
+        vdmsteps = {
             '1X': (stepsize[0], 0.0), '1Y': (0.0, stepsize[1]),
             '2X': (-stepsize[0], 0.0), '2Y': (0.0, -stepsize[1])
         }
     else:
-        steps = {
+        vdmsteps = {
             '1X': stepsize, '1Y': stepsize1Y, '2X': stepsize2X, '2Y': stepsize2Y
         }
+    condition = 'vtx_nTrk>={0}'.format(mintrk)
+    if quicklook is not None:
+        # Deterministic subsample: every quicklook-th vertex of each tree
+        sample = 'Entry$%{0}==0'.format(quicklook)
+        condition = '{0}&&{1}'.format(condition, sample)
+        if extracond is None:
+            extracond = sample
+        else:
+            extracond = '({0})&&{1}'.format(extracond, sample)
     if heavyion:
         crange = (-20.0, 20.0)
     else:
@@ -58,34 +76,39 @@ def prepare_histograms(
                 trees[bcid].SetName(replace(trees[bcid].GetName(), 'Beam1', 'Beam2'))
         if stepsize:
             hists = make_vdmhistos(
-                trees, nbins, mintrk, steps[scan],
+                trees, nbins, mintrk, vdmsteps[scan],
                 scaling=scaling, crange=crange, verbose=verbose
             )
         else:
             hists = make_histograms(
                 trees, nbins, mintrk, scaling=scaling, verbose=verbose,
-                extracond=extracond
+                extracond=extracond, steps=steps
             )
         for hist in hists.itervalues():
             hist.SetDirectory(0)
             histograms.append(hist)
         if not singlepair or not scan.startswith('2'):
-            condition = 'vtx_nTrk>={0}'.format(mintrk)
             errx = TH1F('errx', '', 100, 0.0, 0.03)
             erry = TH1F('erry', '', 100, 0.0, 0.03)
             for tree in trees.itervalues():
+                # Compact trees without resolutions have no error branches
+                if not tree.GetBranch('vtx_xError'):
+                    continue
                 tree.Draw('vtx_xError>>+errx', condition, 'goff')
                 tree.Draw('vtx_yError>>+erry', condition, 'goff')
             xerror.Add(errx)
             yerror.Add(erry)
             errx.Delete()
             erry.Delete()
+    name = '{0}_{1}'.format(name, suffix)
+    if quicklook is not None:
+        name = quicklook_name(name)
     output = {
         'fill': fill,
-        'name': '{0}_{1}'.format(name, suffix),
+        'name': name,
         'bcids': bcids,
         'datapath': outputpath,
-        'dataname': '{0}_{1}'.format(name, suffix),
+        'dataname': name,
         'vtxresx': round(xerror.GetMean(), 6),
         'vtxresy': round(yerror.GetMean(), 6),
         'scaling': scaling,
@@ -95,6 +118,88 @@ def prepare_histograms(
     }
     if extracond is not None:
         output['extracond'] = extracond
+    if steps is not None:
+        output['steps'] = list(steps)
+    if quicklook is not None:
+        output['quicklook'] = quicklook
+        output['provisional'] = True
+    if shards:
+        output['shards'] = True
+    values = []
+    for n, v in (
+        ('stepsize1X', stepsize), ('stepsize1Y', stepsize1Y),
+        ('stepsize2X', stepsize2X), ('stepsize2Y', stepsize2Y)
+    ):
+        if v is not None:
+            values.append(NamedFloat(n+'_x', v[0]))
+            values.append(NamedFloat(n+'_y', v[1]))
+    filename1, filename2 = write_histograms(
+        output, histograms+[xerror, yerror], values
+    )
+    for binning in derive:
+        derive_histograms(filename1, binning)
+    return filename2
+
+def prepare_incremental(
+    configfile, outputpath, suffix, nbins, mintrk, scaling=1.0, verbose=False,
+    derive=(), shards=False
+):
+    with open(configfile) as f:
+        config = load(f)
+    fill = config['fill']
+    version = config['version']
+    bcids = config['bcids']
+    heavyion = bool('heavyion' in config and config['heavyion'])
+    name = 'Fill{0}_{1}'.format(fill, version)
+    if heavyion:
+        crange = (-20.0, 20.0)
+    else:
+        crange = (-10.0, 10.0)
+    times = {scan: zip(
+        config['scan{0}MoveBegin'.format(scan)],
+        config['scan{0}MoveEnd'.format(scan)]
+    ) for scan in ('1X', '1Y', '2X', '2Y')}
+    statefile = '{0}/{1}_mintrk{2}_state.root'.format(outputpath, name, mintrk)
+    accumulator = HistogramAccumulator(
+        statefile, times, bcids, mintrk, scaling, crange
+    )
+    for directory in config['sourcedirs']:
+        directory = '{0}/{1}'.format(config['sourcepath'], directory)
+        for filename in sorted(listdir(directory)):
+            filename = '{0}/{1}'.format(directory, filename)
+            if not filename.endswith('.root') or stat(filename).st_size == 0:
+                continue
+            if accumulator.processed(filename):
+                continue
+            if verbose:
+                print '<<< Add file {0}'.format(filename)
+            accumulator.add_file(filename)
+            accumulator.save()
+    histograms, xerror, yerror = accumulator.histograms(nbins)
+    output = {
+        'fill': fill,
+        'name': '{0}_{1}'.format(name, suffix),
+        'bcids': bcids,
+        'datapath': outputpath,
+        'dataname': '{0}_{1}'.format(name, suffix),
+        'vtxresx': round(xerror.GetMean(), 6),
+        'vtxresy': round(yerror.GetMean(), 6),
+        'scaling': scaling,
+        'mintrk': mintrk,
+        'nbins': nbins,
+        'heavyion': heavyion,
+        'nfiles': len(accumulator.state['files'])
+    }
+    if shards:
+        output['shards'] = True
+    filename1, filename2 = write_histograms(
+        output, histograms+[xerror, yerror], []
+    )
+    for binning in derive:
+        derive_histograms(filename1, binning)
+    return filename2
+
+def write_histograms(output, histograms, values):
     filename1 = 'res/hist/{0}.json'.format(output['name'])
     if not exists('res'):
         mkdir('res')
@@ -102,24 +207,81 @@ def prepare_histograms(
         mkdir('res/hist')
     with open(filename1, 'w') as f:
         dump(output, f, indent=4, separators=(',',': '))
-    filename2 = '{0}/{1}.root'.format(outputpath, output['name'])
+    filename2 = '{0}/{1}.root'.format(output['datapath'], output['name'])
     with BareRootFile(filename2, 'RECREATE') as f:
         for hist in histograms:
             hist.Write()
-        xerror.Write()
-        yerror.Write()
         Timestamp().Write()
-        for n, v in (
-            ('stepsize1X', stepsize), ('stepsize1Y', stepsize1Y),
-            ('stepsize2X', stepsize2X), ('stepsize2Y', stepsize2Y)
-        ):
-            if v is not None:
-                NamedFloat(n+'_x', v[0]).Write()
-                NamedFloat(n+'_y', v[1]).Write()
+        for value in values:
+            value.Write()
         NamedString('name', output['name']).Write()
-    return filename2
+    if output.get('shards'):
+        write_shards(output, histograms)
+    elif exists(filename2[:-5]):
+        # Shards of earlier histograms would take precedence in load_bi_hists
+        print '<<< Remove outdated shards {0}'.format(filename2[:-5])
+        rmtree(filename2[:-5])
+    return filename1, filename2
+
+def write_shards(output, histograms):
+    filename = '{0}/{1}.root'.format(output['datapath'], output['name'])
+    if not exists(filename[:-5]):
+        mkdir(filename[:-5])
+    for bcid in output['bcids']:
+        with BareRootFile(shard_name(filename, bcid), 'RECREATE') as f:
+            for hist in histograms:
+                found = search('_bunch(-?[0-9]+)Add$', hist.GetName())
+                if found and int(found.group(1)) == bcid:
+                    hist.Write()
+            Timestamp().Write()
+            NamedString('name', output['name']).Write()
+
+def derived_name(name, binning):
+    newname, n = subn(
+        '_({0})(?=_|$)'.format('|'.join(binnings)), '_'+binning, name, 1
+    )
+    if n == 0:
+        newname = '{0}_{1}'.format(name, binning)
+    return newname
+
+def derive_histograms(jsonfile, binning):
+    with open(jsonfile) as f:
+        config = load(f)
+    datafile = '{0}/{1}.root'.format(config['datapath'], config['dataname'])
+    hists = {}
+    values = []
+    with BareRootFile(datafile) as f:
+        for key in f.GetListOfKeys():
+            name = key.GetName()
+            if name in ('name', 'timestamp'):
+                continue
+            obj = f.Get(name)
+            if obj.InheritsFrom('TH1'):
+                obj.SetDirectory(0)
+                hists[name] = obj
+            else:
+                values.append(obj)
+    output = dict(config)
+    output['name'] = derived_name(config['name'], binning)
+    output['dataname'] = output['name']
+    output['nbins'] = binnings[binning]
+    output['master'] = config['dataname']
+    derived = rebin_histograms(hists, output['nbins'])
+    return write_histograms(output, derived.values(), values)[1]
+
+def main_derive():
+    if len(argv) < 3 or not argv[2] or not exists(argv[2]):
+        raise RuntimeError('Specify 2nd argument: JSON histogram config file.')
+    if len(argv) < 4 or any(b not in binnings for b in argv[3:]):
+        raise RuntimeError(
+            'Specify 3rd and further arguments: Bins (many, some, or few).'
+        )
+    for binning in argv[3:]:
+        derive_histograms(argv[2], binning)
 
 def main():
+    if len(argv) > 1 and argv[1] == 'derive':
+        return main_derive()
     if len(argv) < 2 or not argv[1] or not exists(argv[1]):
         raise RuntimeError('Specify 1st argument: JSON config file.')
     configfile = argv[1]
@@ -128,10 +290,16 @@ def main():
     outputpath = argv[2]
     if outputpath.endswith('/'):
         outputpath = outputpath[:-1]
-    if len(argv) < 4 or not argv[3] or argv[3] not in ['many', 'some', 'few']:
-        raise RuntimeError('Specify 3rd argument: Bins (many, some, or few).')
+    if len(argv) < 4 or not argv[3] or argv[3] not in binnings:
+        raise RuntimeError(
+            'Specify 3rd argument: Bins (master, many, some, or few).'
+        )
     binning = argv[3]
-    nbins = {'many': 760, 'some': 190, 'few': 95}[binning]
+    nbins = binnings[binning]
+    if binning == 'master':
+        derive = ('many', 'some', 'few')
+    else:
+        derive = ()
     if len(argv) < 5 or not argv[4] or argv[4] not in ['l', 'm', 't', 'vt', 'et']:
         raise RuntimeError(
             'Specify 4th argument: Track selection (l, m, t, vt, et).'
@@ -150,19 +318,43 @@ def main():
     except ValueError:
         raise RuntimeError('Optional 5th argument: scaling (float).')
     suffix = '{0}_{1}'.format(binning, selection)
+    shards = bool('-shards' in argv)
+    quicklook = None
+    for arg in argv:
+        if arg == '-quicklook':
+            quicklook = 10
+        elif arg.startswith('-quicklook='):
+            quicklook = int(arg[11:])
+    if quicklook is not None:
+        if len(argv) > 6 and argv[6] in (
+            'vdm', 'drift', 'singlevdm', 'mixed', 'incremental'
+        ):
+            raise RuntimeError(
+                'Option -quicklook is only available for default and extra.'
+            )
     if len(argv) < 7 or not argv[6] or not argv[6] in (
-        'vdm', 'drift', 'extra', 'singlevdm', 'mixed',
+        'vdm', 'drift', 'extra', 'singlevdm', 'mixed', 'incremental',
     ):
         prepare_histograms(
             configfile, outputpath, suffix, nbins, mintrk,
-            scaling=scaling, verbose=True
+            scaling=scaling, verbose=True, derive=derive, shards=shards,
+            quicklook=quicklook
+        )
+    elif argv[6] == 'incremental':
+        with open(configfile) as f:
+            if 'sourcedirs' not in load(f):
+                raise RuntimeError('Specify 1st argument: JSON raw config.')
+        prepare_incremental(
+            configfile, outputpath, suffix, nbins, mintrk,
+            scaling=scaling, verbose=True, derive=derive, shards=shards
         )
     elif argv[6] == 'extra':
-        extracond = 'scanstep>2 && scanstep<16'
+        steps = range(3, 16)
         suffix = '{0}_extra'.format(suffix)
         prepare_histograms(
             configfile, outputpath, suffix, nbins, mintrk,
-            scaling=scaling, verbose=True, extracond=extracond
+            scaling=scaling, verbose=True, steps=steps, derive=derive,
+            shards=shards, quicklook=quicklook
         )
     elif argv[6] == 'vdm':
         if len(argv) < 9 or not argv[7] or not argv[8]:
@@ -173,7 +365,8 @@ def main():
             raise RuntimeError('Specify 7th, 8th argument: VdM scan step size.')
         prepare_histograms(
             configfile, outputpath, suffix, nbins, mintrk,
-            scaling=scaling, verbose=True, stepsize=stepsize
+            scaling=scaling, verbose=True, stepsize=stepsize,
+            derive=derive, shards=shards
         )
     elif argv[6] == 'singlevdm':
         if len(argv) < 9 or not argv[7] or not argv[8]:
@@ -184,7 +377,8 @@ def main():
             raise RuntimeError('Specify 7th, 8th argument: VdM scan step size.')
         prepare_histograms(
             configfile, outputpath, suffix, nbins, mintrk,
-            scaling=scaling, verbose=True, stepsize=stepsize, singlepair=True
+            scaling=scaling, verbose=True, stepsize=stepsize,
+            singlepair=True, derive=derive, shards=shards
         )
     else: # 'drift', 'mixed'
         if (
@@ -204,7 +398,8 @@ def main():
         prepare_histograms(
             configfile, outputpath, suffix, nbins, mintrk, scaling=scaling,
             verbose=True, stepsize=stepsize, stepsize1Y=stepsize1Y,
-            stepsize2X=stepsize2X, stepsize2Y=stepsize2Y
+            stepsize2X=stepsize2X, stepsize2Y=stepsize2Y, derive=derive,
+            shards=shards
         )
 
 if __name__ == '__main__':
@@ -4,14 +4,14 @@ from os.path import exists
 from sys import argv
 
 from lib.io import BareRootFile, NamedString, Timestamp
-from lib.prepare import make_trees
+from lib.prepare import make_trees, storage_profiles, write_tree
 
 qualities = ('vtx_isGood', '!vtx_isFake')
 # qualities = ('goodVertex', 'vtx_isValid', '!vtx_isFake')
 
 def prepare_trees(
     configfile, outputpath, mintrk=0, verbose=False, scans=None,
-    noerror=False, start=None
+    noerror=False, start=None, profile='default'
 ):
     if scans is None:
         scans = ('1X', '1Y', '2X', '2Y')
@@ -21,6 +21,8 @@ def prepare_trees(
     version = config['version']
     bcids = config['bcids']
     name = 'Fill{0}_{1}'.format(fill, version)
+    compact = storage_profiles[profile]['compact']
+    compression = storage_profiles[profile]['compression']
     for scan in scans:
         print '<<< Prepare scan files: {0}'.format(scan)
         basefilelist = config['scan{0}MoveFiles'.format(scan)]
@@ -35,13 +37,14 @@ def prepare_trees(
             ), enumerate(basefilelist[start:], start=start))
         for i, (filename, filelist) in enumerate(filelists):
             print '<<< Now at filelist {0} of {1}'.format((0 if start is None else start)+i, len(filelists))
-            trees = make_trees(filelist, times, bcids, mintrk, verbose, noerror, qualities)
+            trees = make_trees(filelist, times, bcids, mintrk, verbose, noerror, qualities, compact)
             with BareRootFile(filename, 'RECREATE') as f:
+                if compression is not None:
+                    f.SetCompressionSettings(compression)
                 for tree in trees.itervalues():
                     nam = tree.GetName()
                     treename = 'Beam{0}Move{1}_{2}'.format(scan[0], scan[1], nam)
-                    tree.SetName(treename)
-                    tree.Write(treename)
+                    write_tree(tree, treename, compression)
                 Timestamp().Write()
                 NamedString('name', name).Write()
                 NamedString('scan', scan).Write()
@@ -69,9 +72,17 @@ def main():
             raise RuntimeError('Usage: -s3 to start at 4th file.')
     else:
         start = None
+    profile = 'default'
+    for opt in opts:
+        if opt.startswith('PROFILE='):
+            profile = opt[8:].lower()
+            if profile not in storage_profiles:
+                raise RuntimeError('Usage: -profile=compact ({0}).'.format(
+                    ', '.join(sorted(storage_profiles))
+                ))
     prepare_trees(
         configfile, outputpath, mintrk=6, verbose=True, scans=scans,
-        noerror=noerror, start=start
+        noerror=noerror, start=start, profile=profile
     )
 
 if __name__ == '__main__':
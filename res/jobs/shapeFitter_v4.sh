@@ -2,4 +2,4 @@
 cd $1
 source /cvmfs/cms.cern.ch/cmsset_default.sh
 eval `scramv1 runtime -sh`
-python shapeFitter_v4.py $2 $3 $4 $5
+python shapeFitter_v4.py "${@:2}"
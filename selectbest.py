@@ -4,6 +4,7 @@ from sys import argv
 from time import strftime
 
 from lib.io import BareRootFile, copy_directory, RootFile, Timestamp
+from lib.results import record_results
 
 def selectbest(names, delete=False):
     prefix = commonprefix(names)
@@ -33,6 +34,7 @@ def selectbest(names, delete=False):
         copy_directory(new, old, condition=condition)
         new.cd()
         Timestamp('selectedTimestamp').Write()
+    record_results(filename)
     if delete:
         for name in names:
             remove(name)
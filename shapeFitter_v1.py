@@ -4,20 +4,34 @@ from sys import argv
 
 from ROOT import RooFit
 
+from lib.batch import parse_bcids, parse_options, run_batch
+from lib.cache import FitCache
 from lib.correction import compute_correction
 from lib.fit import (
-    compute_chisq, data_hist, fit, model_hist_fast as model_hist,
-    overlap_variations, residual_hist
+    compute_chisq, data_hist, fit, fit_multires, fit_numpy,
+    model_hist_fast as model_hist, overlap_variations, residual_hist
 )
-from lib.io import BareRootFile, NamedFloat, NamedString, RootFile, Timestamp
+from lib.io import (
+    load_bi_hists, NamedFloat, NamedString, RootFile, Timestamp
+)
+from lib.prepare import quicklook_name
+from lib.profiling import Profiler
+from lib.results import record_results
 from lib.shape.dg import DoubleGaussFit, SuperGaussFit
 from lib.shape.sg import SingleGauss, SingleGaussUncorrelated
 from lib.shape.tg import SuperDoubleGaussFit, TripleGaussFit
+from lib.stats import write_stats
 
 def fit_shape(
     model, bcid, datafile, name, nbins, vtxresx,
-    vtxresy=None, scaling=1.0, heavyion=False
+    vtxresy=None, scaling=1.0, heavyion=False, cache=None, multires=False,
+    ncpu=1, numpy=False, hists=None, previous=None, quicklook=False, seed=None
 ):
+    profiler = Profiler()
+    if quicklook:
+        eps, ntoys = 1.0e-5, 20
+    else:
+        eps, ntoys = 1.0e-7, 100
     if heavyion:
         parameters = model.load_json(
             parameterfile='res/shapes/{}hi.json'.format(model.name())
@@ -26,36 +40,59 @@ def fit_shape(
     else:
         parameters = model.load_json()
         crange = (-10.0, 10.0)
+    if previous is not None:
+        model.load_model(previous, parameters)
+    if seed is not None:
+        print '<<< Start values from {0}'.format(seed)
+        model.load_root(seed, parameters, narrow=False)
     if vtxresy is None:
         vtxresy = vtxresx
     model.set_vtxres(vtxresx / scaling, vtxresy / scaling)
 
-    hists = []
-    with BareRootFile(datafile) as f:
-        for histname in [
-            'hist_Beam2MoveX_bunch{0}Add', 'hist_Beam2MoveY_bunch{0}Add',
-            'hist_Beam1MoveX_bunch{0}Add', 'hist_Beam1MoveY_bunch{0}Add'
-        ]:
-            hist = f.Get(histname.format(bcid))
-            hist.SetDirectory(0)
-            hists.append(hist)
+    with profiler.stage('load'):
+        if hists is None:
+            hists = load_bi_hists(datafile, [bcid])[bcid]
 
-    fitmethod = lambda pdf, data: pdf.fitTo(
-        data, RooFit.Save(), RooFit.PrintLevel(1), RooFit.Verbose(0)
-    )
+    if numpy:
+        fitter, fitmethod = fit_numpy, 'nll'
+    else:
+        fitter = fit
+        fitmethod = lambda pdf, data: pdf.fitTo(
+            data, RooFit.Save(), RooFit.PrintLevel(1), RooFit.Verbose(0),
+            RooFit.NumCPU(ncpu, RooFit.Interleave)
+        )
 
-    result, modfuncs, datahist = fit(model, hists, fitmethod)
+    with profiler.stage('fit'):
+        if multires:
+            result, modfuncs, datahist = fit_multires(
+                model, hists, fitmethod, eps=eps, fitter=fitter
+            )
+        elif cache is None:
+            result, modfuncs, datahist = fitter(
+                model, hists, fitmethod, eps=eps
+            )
+        else:
+            result, modfuncs, datahist = cache.fit(
+                model, hists, fitmethod, eps=eps, fitter=fitter
+            )
 
-    hdata = data_hist(model.xvar(), model.yvar(), datahist)
-    hmodel = model_hist(model.xvar(), model.yvar(), modfuncs)
-    chisqs, dofs = compute_chisq(hmodel, hdata)
+    with profiler.stage('model_hist'):
+        hdata = data_hist(model.xvar(), model.yvar(), datahist)
+        hmodel = model_hist(model.xvar(), model.yvar(), modfuncs)
+    with profiler.stage('compute_chisq'):
+        chisqs, dofs = compute_chisq(hmodel, hdata)
 
-    true, avg, rms = overlap_variations(model)
+    with profiler.stage('overlap_variations'):
+        true, avg, rms = overlap_variations(model, n=ntoys)
 
-    scDat, scMod, scRes = residual_hist(hdata, hmodel, scaling, crange=crange)
+    with profiler.stage('residual_hist'):
+        scDat, scMod, scRes = residual_hist(
+            hdata, hmodel, scaling, crange=crange
+        )
 
-    model.factor = 100.0
-    corrTree = compute_correction(model.overlap_func())
+    with profiler.stage('compute_correction'):
+        model.factor = 100.0
+        corrTree = compute_correction(model.overlap_func(), n=ntoys)
 
     outputname = 'BeamImaging_v1_{0}_{1}_bcid{2}' \
                  .format(name, model.name(), bcid)
@@ -64,6 +101,7 @@ def fit_shape(
         for hist in scDat + scMod + scRes:
             hist.Write()
         corrTree.Write()
+        write_stats(corrTree)
         for i, scan in enumerate(('X1', 'Y1', 'X2', 'Y2')):
             NamedFloat('chisq{0}'.format(scan), chisqs[i]).Write()
             NamedFloat('dof{0}'.format(scan), dofs[i]).Write()
@@ -72,7 +110,10 @@ def fit_shape(
         NamedFloat('overlap_rms', rms).Write()
         NamedFloat('scaling', scaling).Write()
         Timestamp().Write()
+        profiler.write()
         NamedString('name', outputname).Write()
+        if quicklook:
+            NamedString('provisional', 'quicklook').Write()
         f.mkdir('initial').cd()
         for par in parameters:
             par.Write()
@@ -82,17 +123,25 @@ def fit_shape(
             NamedFloat(
                 '{0}_error'.format(par.GetName()), par.err(model.parameter)
             ).Write()
+    record_results(f.filename)
 
-fitmodels = ('noCorr', 'SG', 'DG', 'TG', 'SupG', 'SupDG')
+fitmodels = ('noCorr', 'SG', 'DG', 'TG', 'SupG', 'SupDG', 'chain')
+
+# Model ladder for chained fits: (model, model to take start values from)
+fitchain = (
+    ('SG', None), ('DG', 'SG'), ('SupG', 'DG'), ('SupDG', 'SupG'), ('TG', 'DG')
+)
 
 def main():
     if len(argv) < 2 or not argv[1] or not exists(argv[1]):
         raise RuntimeError('Specify 1st argument: JSON config file.')
     with open(argv[1]) as f:
         config = load(f)
-    if len(argv) < 3 or not argv[2] or int(argv[2]) not in config['bcids']:
-        raise RuntimeError('Specify 2nd argument: a valid BCID.')
-    bcid = int(argv[2])
+    if len(argv) < 3 or not argv[2] or not parse_bcids(
+        argv[2], config['bcids']
+    ):
+        raise RuntimeError('Specify 2nd argument: valid BCIDs (or all).')
+    bcids = parse_bcids(argv[2], config['bcids'])
     if len(argv) < 4 or not argv[3] or argv[3] not in fitmodels:
         raise RuntimeError(
             'Specify 3rd argument: Fit model ({0}).' \
@@ -105,20 +154,70 @@ def main():
     else:
         heavyion = False
         crange = (-10.0, 10.0)
-    model = {
+    models = {
         'SG': SingleGauss, 'DG': DoubleGaussFit, 'TG': TripleGaussFit,
         'SupG': SuperGaussFit, 'SupDG': SuperDoubleGaussFit,
         'noCorr': SingleGaussUncorrelated
-    }[argv[3]](crange=crange)
+    }
     datafile = '{0}/{1}.root'.format(config['datapath'], config['dataname'])
     nbins = config['nbins']
     vtxresx = config['vtxresx']
     vtxresy = config['vtxresy']
     scaling = config['scaling']
-    fit_shape(
-        model, bcid, datafile, name, nbins, vtxresx,
-        vtxresy=vtxresy, scaling=scaling, heavyion=heavyion
-    )
+    options = parse_options(argv)
+    if options['cache']:
+        cache = FitCache()
+    else:
+        cache = None
+    multires = options['multires']
+    numpy = options['numpy']
+    ncpu = options['ncpu']
+    jobs = options['jobs']
+    quicklook = bool('-quicklook' in argv or config.get('quicklook'))
+    if quicklook and 'quicklook' not in name:
+        name = quicklook_name(name)
+    if '-seed' in argv and quicklook:
+        raise RuntimeError('Option -seed is not available for quick-look fits.')
+    if argv[3] == 'chain':
+        chain = fitchain
+    else:
+        chain = ((argv[3], None),)
+    instances = {
+        modelname: models[modelname](crange=crange)
+        for modelname, __ in chain
+    }
+    hists = load_bi_hists(datafile, bcids)
+    def fit_bcid(bcid):
+        fitted = {}
+        for modelname, previous in chain:
+            print '<<< Fit model {0} to BCID {1}'.format(modelname, bcid)
+            model = instances[modelname]
+            model.reset()
+            if '-seed' in argv:
+                seed = 'BeamImaging_v1_{0}_{1}_bcid{2}_'.format(
+                    quicklook_name(name), modelname, bcid
+                )
+                try:
+                    seed = RootFile.find_file(seed)
+                except IOError:
+                    raise RuntimeError(
+                        'No quick-look result {0}* for -seed.'.format(seed)
+                    )
+            else:
+                seed = None
+            fit_shape(
+                model, bcid, datafile, name, nbins, vtxresx,
+                vtxresy=vtxresy, scaling=scaling, heavyion=heavyion,
+                cache=cache, multires=multires, ncpu=ncpu, numpy=numpy,
+                hists=hists[bcid], previous=fitted.get(previous),
+                quicklook=quicklook, seed=seed
+            )
+            fitted[modelname] = model
+    failed = run_batch(fit_bcid, bcids, jobs)
+    if failed:
+        raise RuntimeError('Fits failed for BCIDs {0}.'.format(
+            ', '.join(str(bcid) for bcid in failed)
+        ))
 
 if __name__ == '__main__':
     main()
@@ -5,18 +5,32 @@ from sys import argv
 
 from ROOT import RooFit, TRandom3
 
+from lib.batch import parse_bcids, parse_options, run_batch
+from lib.cache import FitCache
 from lib.correction import compute_correction
 from lib.fit import (
-    compute_chisq, data_hist, fit, model_hist_fast as model_hist,
-    overlap_variations, residual_hist
+    compute_chisq, data_hist, fit, fit_multires, fit_numpy,
+    model_hist_fast as model_hist, overlap_variations, residual_hist
 )
-from lib.io import BareRootFile, NamedFloat, NamedString, RootFile, Timestamp
+from lib.io import (
+    load_bi_hists, NamedFloat, NamedString, RootFile, Timestamp
+)
+from lib.prepare import quicklook_name
+from lib.profiling import Profiler
+from lib.results import record_results
 from lib.shape.tg import SuperDoubleGaussFit
+from lib.stats import write_stats
 
 def fit_shape(
     model, bcid, datafile, inputfile, name, nbins, vtxresx,
-    vtxresy=None, scaling=1.0, heavyion=False
+    vtxresy=None, scaling=1.0, heavyion=False, cache=None, multires=False,
+    ncpu=1, numpy=False, hists=None, quicklook=False
 ):
+    profiler = Profiler()
+    if quicklook:
+        eps, ntoys = 1.0e-5, 20
+    else:
+        eps, ntoys = 1.0e-7, 100
     rand = TRandom3()
     rand.SetSeed(0)
 
@@ -79,32 +93,50 @@ def fit_shape(
         vtxresy = vtxresx
     model.set_vtxres(vtxresx / scaling, vtxresy / scaling)
 
-    hists = []
-    with BareRootFile(datafile) as f:
-        for histname in [
-            'hist_Beam2MoveX_bunch{0}Add', 'hist_Beam2MoveY_bunch{0}Add',
-            'hist_Beam1MoveX_bunch{0}Add', 'hist_Beam1MoveY_bunch{0}Add'
-        ]:
-            hist = f.Get(histname.format(bcid))
-            hist.SetDirectory(0)
-            hists.append(hist)
+    with profiler.stage('load'):
+        if hists is None:
+            hists = load_bi_hists(datafile, [bcid])[bcid]
 
-    fitmethod = lambda pdf, data: pdf.fitTo(
-        data, RooFit.Save(), RooFit.PrintLevel(1), RooFit.Verbose(0)
-    )
+    if numpy:
+        fitter, fitmethod = fit_numpy, 'nll'
+    else:
+        fitter = fit
+        fitmethod = lambda pdf, data: pdf.fitTo(
+            data, RooFit.Save(), RooFit.PrintLevel(1), RooFit.Verbose(0),
+            RooFit.NumCPU(ncpu, RooFit.Interleave)
+        )
 
-    result, modfuncs, datahist = fit(model, hists, fitmethod)
+    with profiler.stage('fit'):
+        if multires:
+            result, modfuncs, datahist = fit_multires(
+                model, hists, fitmethod, eps=eps, fitter=fitter
+            )
+        elif cache is None:
+            result, modfuncs, datahist = fitter(
+                model, hists, fitmethod, eps=eps
+            )
+        else:
+            result, modfuncs, datahist = cache.fit(
+                model, hists, fitmethod, eps=eps, fitter=fitter
+            )
 
-    hdata = data_hist(model.xvar(), model.yvar(), datahist)
-    hmodel = model_hist(model.xvar(), model.yvar(), modfuncs)
-    chisqs, dofs = compute_chisq(hmodel, hdata)
+    with profiler.stage('model_hist'):
+        hdata = data_hist(model.xvar(), model.yvar(), datahist)
+        hmodel = model_hist(model.xvar(), model.yvar(), modfuncs)
+    with profiler.stage('compute_chisq'):
+        chisqs, dofs = compute_chisq(hmodel, hdata)
 
-    true, avg, rms = overlap_variations(model)
+    with profiler.stage('overlap_variations'):
+        true, avg, rms = overlap_variations(model, n=ntoys)
 
-    scDat, scMod, scRes = residual_hist(hdata, hmodel, scaling, crange=crange)
+    with profiler.stage('residual_hist'):
+        scDat, scMod, scRes = residual_hist(
+            hdata, hmodel, scaling, crange=crange
+        )
 
-    model.factor = 100.0
-    corrTree = compute_correction(model.overlap_func())
+    with profiler.stage('compute_correction'):
+        model.factor = 100.0
+        corrTree = compute_correction(model.overlap_func(), n=ntoys)
 
     outputname = 'BeamImaging_v4_{0}_{1}_bcid{2}' \
                  .format(name, model.name(), bcid)
@@ -113,6 +145,7 @@ def fit_shape(
         for hist in scDat + scMod + scRes:
             hist.Write()
         corrTree.Write()
+        write_stats(corrTree)
         for i, scan in enumerate(('X1', 'Y1', 'X2', 'Y2')):
             NamedFloat('chisq{0}'.format(scan), chisqs[i]).Write()
             NamedFloat('dof{0}'.format(scan), dofs[i]).Write()
@@ -121,7 +154,10 @@ def fit_shape(
         NamedFloat('overlap_rms', rms).Write()
         NamedFloat('scaling', scaling).Write()
         Timestamp().Write()
+        profiler.write()
         NamedString('name', outputname).Write()
+        if quicklook:
+            NamedString('provisional', 'quicklook').Write()
         f.mkdir('initial').cd()
         for par in parameters:
             par.Write()
@@ -131,15 +167,18 @@ def fit_shape(
             NamedFloat(
                 '{0}_error'.format(par.GetName()), par.err(model.parameter)
             ).Write()
+    record_results(f.filename)
 
 def main():
     if len(argv) < 2 or not argv[1] or not exists(argv[1]):
         raise RuntimeError('Specify 1st argument: JSON config file.')
     with open(argv[1]) as f:
         config = load(f)
-    if len(argv) < 3 or not argv[2] or int(argv[2]) not in config['bcids']:
-        raise RuntimeError('Specify 2nd argument: a valid BCID.')
-    bcid = int(argv[2])
+    if len(argv) < 3 or not argv[2] or not parse_bcids(
+        argv[2], config['bcids']
+    ):
+        raise RuntimeError('Specify 2nd argument: valid BCIDs (or all).')
+    bcids = parse_bcids(argv[2], config['bcids'])
     if len(argv) < 4 or not argv[3] or argv[3] not in ('SupDG',):
         raise RuntimeError('Specify 3rd argument: Fit model (SupDG).')
     if 'heavyion' in config and config['heavyion']:
@@ -151,23 +190,46 @@ def main():
     model = {
         'SupDG': SuperDoubleGaussFit
     }[argv[3]](crange=crange)
-    if len(argv) < 5 or not argv[4]:
+    if len(argv) < 5 or not argv[4] or argv[4].startswith('-'):
         raise RuntimeError('Specify 4th argument: Unique name.')
     namepart = argv[4]
     name = config['name']
+    quicklook = bool('-quicklook' in argv or config.get('quicklook'))
+    if quicklook and 'quicklook' not in name:
+        name = quicklook_name(name)
     datafile = '{0}/{1}.root'.format(config['datapath'], config['dataname'])
-    inputfile = 'BeamImaging_v2_{0}_{1}_bcid{2}'.format(
-        name, {'SupDG': 'SupG'}[argv[3]], bcid
-    )
     nbins = config['nbins']
     vtxresx = config['vtxresx']
     vtxresy = config['vtxresy']
     scaling = config['scaling']
+    inputname = name
     name = '{0}_{1}'.format(name, namepart)
-    fit_shape(
-        model, bcid, datafile, inputfile, name, nbins, vtxresx,
-        vtxresy=vtxresy, scaling=scaling, heavyion=heavyion
-    )
+    options = parse_options(argv)
+    if options['cache']:
+        cache = FitCache()
+    else:
+        cache = None
+    multires = options['multires']
+    numpy = options['numpy']
+    ncpu = options['ncpu']
+    jobs = options['jobs']
+    hists = load_bi_hists(datafile, bcids)
+    def fit_bcid(bcid):
+        inputfile = 'BeamImaging_v2_{0}_{1}_bcid{2}'.format(
+            inputname, {'SupDG': 'SupG'}[argv[3]], bcid
+        )
+        model.reset()
+        fit_shape(
+            model, bcid, datafile, inputfile, name, nbins, vtxresx,
+            vtxresy=vtxresy, scaling=scaling, heavyion=heavyion, cache=cache,
+            multires=multires, ncpu=ncpu, numpy=numpy, hists=hists[bcid],
+            quicklook=quicklook
+        )
+    failed = run_batch(fit_bcid, bcids, jobs)
+    if failed:
+        raise RuntimeError('Fits failed for BCIDs {0}.'.format(
+            ', '.join(str(bcid) for bcid in failed)
+        ))
 
 if __name__ == '__main__':
     main()
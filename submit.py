@@ -11,6 +11,10 @@ test = False
 
 # for shapeFitter, computeCorr, integrateResiduals
 switchConfignummodel = False
+# for shapeFitter: one job per config and model that fits all BCIDs, using
+# batchJobs worker processes
+switchBatch = False
+batchJobs = 4
 configs = [
     '6868_rereco_second',
     '6868_rereco_second_verytight',
@@ -42,6 +46,19 @@ def shapeFitter(config, i, model, bcid, json, version):
         ma=ma, mo=mo, rt=5, test=test
     )
 
+def shapeFitterBatch(config, bcids, model, json, version):
+    args = [json, 'all', model]
+    if version in ('v3', 'v4'):
+        # shapeFitter_v3 and _v4 take a unique name as 4th argument
+        args.append('batch')
+    args.append('-jobs={0}'.format(batchJobs))
+    names = ['sF'] + config.split('_') + ['all', model, version]
+    rt = 5*((len(bcids)+batchJobs-1)//batchJobs)
+    submit(
+        'res/jobs/shapeFitter_{0}.sh'.format(version), args=args, names=names,
+        ma=ma, mo=mo, rt=rt, test=test
+    )
+
 def computeCorr(config, i, model, bcid, json, version):
     args = [json, str(bcid), model, version]
     names = ['cC'] + config.split('_') + [str(i), model, version]
@@ -60,7 +77,14 @@ def integrateResiduals(config, i, model, bcid, json, version):
 for arg in argv[1:]:
     if arg in ('shapeFitter', 'computeCorr', 'integrateResiduals'):
         thejob = locals()[arg]
-        if not switchConfignummodel:
+        if arg == 'shapeFitter' and switchBatch:
+            for config in configs:
+                json = '{0}/res/hist/Fill{1}.json'.format(submit.cwd(), config)
+                with open(json) as f:
+                    bcids = load(f)['bcids']
+                for model, version in modelversion:
+                    shapeFitterBatch(config, bcids, model, json, version)
+        elif not switchConfignummodel:
             for config in configs:
                 json = '{0}/res/hist/Fill{1}.json'.format(submit.cwd(), config)
                 with open(json) as f:
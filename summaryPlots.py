@@ -1,67 +1,67 @@
 from array import array
+from json import load
+from math import isnan
 
 from ROOT import TGraphErrors, TH2F, TLegend, TMultiGraph
 
 from lib.plot.plot import SingleHistBase
+from lib.results import ResultsIndex
 
 wip = True
 colors = (46, 8, 9, 42, 38, 30)
 
+# Plots: (fill, suffix of plot name, [(label, JSON config file)])
+summaries = (
+    (4266, '', [
+        ('central', 'res/hist/Fill4266_central.json'),
+        ('prompt', 'res/hist/Fill4266_prompt_reco.json'),
+        ('tight', 'res/hist/Fill4266_tight_selection.json'),
+        ('VdM', 'res/hist/Fill4266_vdm.json'),
+    ]),
+    (4954, '', [
+        ('central', 'res/hist/Fill4954_central.json'),
+        ('prompt', 'res/hist/Fill4954_prompt_reco.json'),
+        ('tight', 'res/hist/Fill4954_tight_selection.json'),
+        ('VdM', 'res/hist/Fill4954_vdm.json'),
+    ]),
+    (4954, '_drift', [
+        ('central', 'res/hist/Fill4954_central.json'),
+        ('drift1', 'res/hist/Fill4954_transverse_drift_v1.json'),
+        ('drift2', 'res/hist/Fill4954_transverse_drift_v2.json'),
+    ]),
+    (4266, '_drift', [
+        ('central', 'res/hist/Fill4266_central.json'),
+        ('drift1', 'res/hist/Fill4266_transverse_drift_v1.json'),
+        ('drift2', 'res/hist/Fill4266_transverse_drift_v2.json'),
+    ]),
+)
+model = 'SupDG'
+version = 3
+
 def summary_plots():
-    for fill, nameadd, values in [
-        (4266, '', {
-            'bcids': [51, 771, 1631, 2211, 2674],
-            'variants': ['central', 'prompt', 'tight', 'VdM'],
-            'central_val': [1.402, 1.411, 1.164, 1.549, 1.589],
-            'central_err': [0.462, 0.463, 0.463, 0.462, 0.464],
-            'VdM_val': [0.776, 0.604, -1.0, 0.429, 1.591],
-            'VdM_err': [0.515, 0.509, -1.0, 0.509, 0.516],
-            'prompt_val': [0.912, 0.687, 1.046, 1.039, 1.835],
-            'prompt_err': [0.525, 0.521, 0.530, 0.521, 0.542],
-            'tight_val': [0.361, 0.939, 1.116, 0.666, 1.421],
-            'tight_err': [0.486, 0.520, 0.616, 0.520, 0.505]
-        }),
-        (4954, '', {
-            'bcids': [41, 281, 872, 1783, 2063],
-            'variants': ['central', 'prompt', 'tight', 'VdM'],
-            'central_val': [0.794, 0.694, 1.642, 0.983, 0.993],
-            'central_err': [0.516, 0.512, 0.533, 0.510, 0.520],
-            'VdM_val': [0.978, 1.265, 1.226, 1.042, 1.880],
-            'VdM_err': [0.490, 0.490, 0.490, 0.491, 0.492],
-            'prompt_val': [1.365, 0.636, 1.251, 1.428, 1.419],
-            'prompt_err': [0.541, 0.548, 0.541, 0.542, 0.542],
-            'tight_val': [1.267, 1.100, 1.042, 1.082, 1.047],
-            'tight_err': [0.450, 0.450, 0.450, 0.450, 0.450]
-        }),
-        (4954, '_drift', {
-            'bcids': [41, 281, 872, 1783, 2063],
-            'variants': ['central', 'drift1', 'drift2'],
-            'central_val': [0.794, 0.694, 1.642, 0.983, 0.993],
-            'central_err': [0.516, 0.512, 0.533, 0.510, 0.520],
-            'drift1_val': [0.765, 0.907, 1.421, 0.926, 0.735],
-            'drift1_err': [0.515, 0.510, 0.530, 0.512, 0.530],
-            'drift2_val': [0.713, 0.718, 1.509, 0.856, 0.854],
-            'drift2_err': [0.872, 0.513, 0.536, 0.510, 0.564]
-        }),
-        (4266, '_drift', {
-            'bcids': [51, 771, 1631, 2211, 2674],
-            'variants': ['central', 'drift1', 'drift2'],
-            'central_val': [1.402, 1.411, 1.164, 1.549, 1.589],
-            'central_err': [0.462, 0.463, 0.463, 0.462, 0.464],
-            'drift1_val': [1.445, 1.163, 0.913, 1.272, 1.335],
-            'drift1_err': [0.462, 0.464, 0.462, 0.462, 0.463],
-            'drift2_val': [1.095, 0.810, 0.864, 1.279, 1.436],
-            'drift2_err': [0.463, 0.463, 0.463, 0.463, 0.463]
-        })
-    ]:
-        bcids = values['bcids']
-        variants = values['variants']
-        yval = {
-            var: array('d', values['{0}_val'.format(var)]) for var in variants
-        }
-        yerr = {
-            var: array('d', values['{0}_err'.format(var)]) for var in variants
-        }
+    index = ResultsIndex()
+    for fill, nameadd, configs in summaries:
+        variants = [label for label, __ in configs]
+        names, bcids = [], None
+        for __, filename in configs:
+            with open(filename) as f:
+                config = load(f)
+            names.append(config['name'])
+            if bcids is None:
+                bcids = config['bcids']
+        criteria = {'model': model, 'version': version, 'best': version >= 3}
+        yval, yerr = {}, {}
+        for var, name in zip(variants, names):
+            row = [index.find(name=name, bcid=bx, **criteria) for bx in bcids]
+            # Missing results are moved out of the plot range
+            yval[var] = array('d', [
+                -1.0 if isnan(index.value(e, 'overlap_diff'))
+                else index.value(e, 'overlap_diff')*100.0 for e in row
+            ])
+            yerr[var] = array('d', [
+                -1.0 if isnan(index.value(e, 'overlap_diff_error'))
+                else index.value(e, 'overlap_diff_error')*100.0 for e in row
+            ])
         xerr = array('d', [0.0]*len(bcids))
         maxi = max([max([
             v+e for v,e in zip(yval[var], yerr[var]) if v>0
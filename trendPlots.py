@@ -0,0 +1,97 @@
+from array import array
+from sys import argv
+
+from numpy import isnan, lexsort
+
+from ROOT import TGraphErrors, TH2F, TLegend, TMultiGraph
+
+from lib.plot.plot import SingleHistBase
+from lib.store import ResultsStore
+
+wip = True
+colors = (46, 8, 9, 42, 38, 30)
+
+def trend_plot(model, variant, version=1, best=False, fills=None):
+    store = ResultsStore(fills)
+    columns = store.select(
+        model=model, variant=variant, version=version, best=best
+    )
+    # Columns of fields only exist if at least one result of the fill has them
+    if not columns or 'overlap_diff' not in columns or \
+       isnan(columns['overlap_diff']).all():
+        print '<<< No results for {0} {1} (v{2})'.format(model, variant, version)
+        return
+    order = lexsort((columns['bcid'], columns['fill']))
+    fill = columns['fill'][order]
+    bcid = columns['bcid'][order]
+    yval = columns['overlap_diff'][order]*100.0
+    yerr = columns['overlap_diff_error'][order]*100.0
+    valid = ~isnan(yval)
+    maxi, mini = (yval+yerr)[valid].max(), (yval-yerr)[valid].min()
+    maxi, mini = maxi+0.2*(maxi-mini), mini-0.1*(maxi-mini)
+    multi = TMultiGraph('multi', '')
+    leg = TLegend(0.15, 0.80, 0.85, 0.83)
+    leg.SetBorderSize(0)
+    fillnames = sorted(set(fill))
+    leg.SetNColumns(len(fillnames))
+    graphs = []
+    for i, f in enumerate(fillnames):
+        select = (fill == f) & valid
+        xval = array('d', [float(j) for j in select.nonzero()[0]])
+        graph = TGraphErrors(
+            len(xval), xval, array('d', yval[select]),
+            array('d', [0.0]*len(xval)), array('d', yerr[select])
+        )
+        graph.SetName('graph{0}'.format(f))
+        graph.SetMarkerStyle(20+i)
+        graph.SetMarkerColor(colors[i % len(colors)])
+        graph.SetLineColor(colors[i % len(colors)])
+        multi.Add(graph)
+        leg.AddEntry(graph, 'Fill {0}'.format(f), 'PL')
+        graphs.append(graph)
+    axishist = TH2F(
+        'axishist', '', len(bcid), -0.5, len(bcid)-0.5, 100, mini, maxi
+    )
+    for i, bx in enumerate(bcid):
+        axishist.GetXaxis().SetBinLabel(i+1, '{0}'.format(bx))
+    plot = SingleHistBase(
+        axishist, name='trend_{0}_{1}_v{2}'.format(model, variant, version),
+        fill=None, workinprogress=wip
+    )
+    plot._xtitle = 'BCID'
+    plot._ytitle = 'correction [%] from fit'
+    plot.xrange(-0.5, len(bcid)-0.5)
+    plot.yrange(mini, maxi)
+    plot._drawoption = 'AXIS'
+    plot.draw()
+    plot.xaxis().SetNdivisions(len(bcid), False)
+    plot.xaxis().SetLabelSize(0.03)
+    multi.Draw('P')
+    leg.Draw()
+    plot.save_pdf()
+    plot.Close()
+
+fitmodels = ('noCorr', 'SG', 'DG', 'TG', 'SupG', 'SupDG')
+
+def main():
+    if len(argv) < 2 or not argv[1] or argv[1] not in fitmodels:
+        raise RuntimeError(
+            'Specify 1st argument: Fit model ({0}).' \
+            .format(', '.join(fitmodels))
+        )
+    if len(argv) < 3 or not argv[2]:
+        raise RuntimeError('Specify 2nd argument: Variant (e.g. central).')
+    version = 1
+    fills = []
+    for arg in argv[3:]:
+        if arg.startswith('-version='):
+            version = int(arg[9:])
+        elif arg.isdigit():
+            fills.append(int(arg))
+    trend_plot(
+        argv[1], argv[2], version=version, best=bool('-best' in argv),
+        fills=fills or None
+    )
+
+if __name__ == '__main__':
+    main()